@@ -0,0 +1,131 @@
+'''
+aio.py is an asyncio front end to the Transaction and Category ORMs
+
+AsyncTransaction and AsyncCategory have the same methods as
+Transaction and Category, but as coroutines.  Each runs its queries
+on a thread pool of its own, so the event loop never waits for
+SQLite, and since every thread has its own connection (see
+database.py) many reports can run at once:
+
+    async with AsyncTransaction('tracker.db') as tran:
+        food, bills = await asyncio.gather(
+            tran.cat_total('food'), tran.cat_total('bills'))
+        async for row in tran.iter_transactions(year=2022):
+            ...
+
+The iterators read one keyset page of chunk_size rows per call to the
+pool, so no cursor is left open between pages and a slow consumer
+never holds a worker thread.
+
+'''
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from category import Category
+from transactions import Transaction
+
+
+def _coroutine(method):
+    ''' return a coroutine method running method on self's executor;
+        it is looked up on the ORM at each call, so it can be wrapped
+        (see instrument.py) '''
+    name = method.__name__
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        return await self._run(getattr(self.orm, name), *args, **kwargs)
+    return wrapper
+
+
+def _mirror(sync_class):
+    ''' class decorator adding a coroutine for every public method of
+        sync_class that the async class does not define or inherit '''
+    def decorate(cls):
+        cls.sync_class = sync_class
+        for name, method in vars(sync_class).items():
+            if name.startswith('_') or hasattr(cls, name) or not callable(method):
+                continue
+            setattr(cls, name, _coroutine(method))
+        return cls
+    return decorate
+
+
+class _AsyncORM():
+    ''' the executor and lifetime shared by the async ORMs '''
+    sync_class = None
+
+    def __init__(self, dbfile, cache_size=0, concurrent=False, max_workers=4):
+        self._executor = ThreadPoolExecutor(max_workers,
+            thread_name_prefix=self.__class__.__name__)
+        try:
+            self.orm = self.sync_class(dbfile, cache_size, concurrent)
+        except BaseException:
+            self._executor.shutdown()
+            raise
+
+    @property
+    def db(self):
+        ''' the shared Database of the wrapped ORM '''
+        return self.orm.db
+
+    def cache_info(self):
+        ''' returns the cache statistics, or None if there is no cache '''
+        return self.orm.cache_info()
+
+    async def _run(self, func, *args, **kwargs):
+        ''' call func on the executor and wait for its result '''
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor,
+            functools.partial(func, *args, **kwargs))
+
+    async def _pages(self, iterate, after_rowid, limit, chunk_size, **filters):
+        ''' yield the rows of iterate(after_rowid=, limit=, **filters) one
+            keyset page of chunk_size rows at a time '''
+        while limit is None or limit > 0:
+            size = chunk_size if limit is None else min(chunk_size, limit)
+            page = await self._run(lambda: list(iterate(
+                after_rowid=after_rowid, limit=size, **filters)))
+            for row in page:
+                yield row
+            if len(page) < size:
+                return
+            after_rowid = page[-1]['rowid']
+            if limit is not None:
+                limit -= size
+
+    async def close(self):
+        ''' close the wrapped ORM and then the executor '''
+        await self._run(self.orm.close)
+        self._executor.shutdown()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+@_mirror(Transaction)
+class AsyncTransaction(_AsyncORM):
+    ''' AsyncTransaction is a Transaction whose methods are coroutines '''
+
+    async def iter_transactions(self, limit=None, chunk_size=500, **filters):
+        ''' yield the transactions matching the where_clause filters in
+            rowid order, like Transaction.iter_transactions '''
+        after_rowid = filters.pop('after_rowid', None) or 0
+        async for tran in self._pages(self.orm.iter_transactions,
+                after_rowid, limit, chunk_size, **filters):
+            yield tran
+
+
+@_mirror(Category)
+class AsyncCategory(_AsyncORM):
+    ''' AsyncCategory is a Category whose methods are coroutines '''
+
+    async def iter_all(self, after_rowid=0, limit=None, chunk_size=500):
+        ''' yield the categories with rowid greater than after_rowid in
+            rowid order, like Category.iter_all '''
+        async for cat in self._pages(self.orm.iter_all,
+                after_rowid, limit, chunk_size):
+            yield cat
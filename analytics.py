@@ -0,0 +1,211 @@
+'''
+analytics.py answers ad-hoc aggregate questions from memory
+
+Analytics is an in-memory rollup: it reads the amount, date and
+category id of every transaction once and keeps only their sums per
+(day, category) cell, like the totals_day and totals_category tables
+crossed.  Grouped totals and counts are then added up from those
+cells in plain Python, without another query and without visiting
+the transactions again, so a question costs time in proportion to
+the number of distinct days and categories, not of transactions:
+
+    with Transaction('tracker.db') as tran:
+        stats = Analytics(tran)
+        stats.totals(('category', 'year', 'month'))
+        # {('food', 2022, 1): 431, ('food', 2022, 2): 398, ...}
+        stats.totals('category', year=2022)
+        stats.cat_total('food')         # same as tran.cat_total('food')
+
+The dimensions are 'day' (yyyymmdd), 'year', 'month' (of any year) and
+'category', and the filters are those of transactions.where_clause.
+Totals follow SUM: NULL amounts are skipped, and a total over no
+amounts at all is None.  Like the rollup tables, groups with a NULL
+key are left out.
+
+refresh() brings the cells up to date by reading only the rows
+added since the last load.  If rows were deleted it reloads
+everything, which it detects by comparing the row count with the
+table's.  An UPDATE of rows already loaded isn't detected; call
+reload() after one.  Dates given as strings are converted with int(),
+as in transactions.where_clause.
+
+'''
+
+from transactions import month_range, year_range
+
+DIMENSIONS = ('day', 'year', 'month', 'category')
+
+# key extractors over (date, category id); names maps ids to names
+_KEYS = {
+    'day': lambda date, code, names: date,
+    'year': lambda date, code, names: date // 10000,
+    'month': lambda date, code, names: date // 100 % 100,
+    'category': lambda date, code, names: names[code],
+}
+
+_NULL = -1
+
+
+class Analytics():
+    ''' Analytics holds the transactions of a Transaction as columns '''
+
+    def __init__(self, tran, chunk_size=10000):
+        self.tran = tran
+        self.chunk_size = chunk_size
+        self.reload()
+
+    def reload(self):
+        ''' drop the cells and load every transaction again '''
+        # the number of transactions loaded and the last one's rowid
+        self.rows = 0
+        self.last_rowid = 0
+        self.names = {}
+        self._code_of = {}
+        self._cells = {}
+        self._stamp = None
+        self.refresh()
+
+    def refresh(self):
+        ''' load the rows added since the last refresh, or every row if
+            some were deleted; this returns the number of rows loaded '''
+        dbase = self.tran.db
+        stamp = dbase.stamp()
+        if stamp == self._stamp:
+            return 0
+        before = self.rows
+        rows = dbase.iterate('''SELECT rowid, amount, date, category_id
+            FROM transactions WHERE rowid>(?) ORDER BY rowid''',
+            (self.last_rowid,), self.chunk_size)
+        cells = self._cells
+        for rowid, amount, date, code in rows:
+            self.rows += 1
+            self.last_rowid = rowid
+            # NULL dates and categories are keyed as _NULL
+            key = (_NULL if date is None else date, _NULL if code is None else code)
+            sums = cells.get(key)
+            if sums is None:
+                sums = cells[key] = [0, 0, 0]
+            # total includes NULL amounts as 0; amounts counts the others
+            if amount is not None:
+                sums[0] += amount
+                sums[2] += 1
+            sums[1] += 1
+        # categories are few, and may have been renamed
+        self.names = dict(dbase.execute('SELECT id, name FROM categories'))
+        self._code_of = {name: code for code, name in self.names.items()}
+        count = dbase.execute('SELECT COUNT(*) FROM transactions').fetchone()[0]
+        if count != self.rows:
+            self.reload()
+            return self.rows
+        self._stamp = stamp
+        return self.rows - before
+
+    def group(self, by=(), bgn=None, end=None, year=None, month=None,
+            category=None):
+        ''' return {key: [total, count, amounts]} for the transactions
+            matching the filters, grouped by the dimensions in by (one
+            name or a tuple of them).  A key is a value for a single
+            dimension and a tuple otherwise.  total includes NULL
+            amounts as 0 and amounts counts the non-NULL ones.
+        '''
+        dims = (by,) if isinstance(by, str) else tuple(by)
+        for dim in dims:
+            if dim not in _KEYS:
+                raise ValueError('unknown dimension %r' % (dim,))
+        low, high = _date_bounds(bgn, end, year, month)
+        every_month = int(month) if month is not None and year is None else None
+        code = None
+        if category is not None:
+            code = self._code_of.get(category)
+            if code is None:
+                return {}
+        dated = low is not None or every_month is not None or any(
+            dim != 'category' for dim in dims)
+        named = any(dim == 'category' for dim in dims)
+        keys = [_KEYS[dim] for dim in dims]
+        names = self.names
+        groups = {}
+        for (date, cat), (amount, count, present) in self._cells.items():
+            if code is not None and cat != code:
+                continue
+            if dated:
+                if date == _NULL:
+                    continue
+                if low is not None and not low <= date <= high:
+                    continue
+                if every_month is not None and date // 100 % 100 != every_month:
+                    continue
+            if named and cat == _NULL:
+                continue
+            if len(keys) == 1:
+                key = keys[0](date, cat, names)
+            else:
+                key = tuple(get(date, cat, names) for get in keys)
+            sums = groups.get(key)
+            if sums is None:
+                groups[key] = [amount, count, present]
+            else:
+                sums[0] += amount
+                sums[1] += count
+                sums[2] += present
+        return groups
+
+    def totals(self, by=(), **filters):
+        ''' return {key: total} like group(), with SUM's None for a group
+            without amounts '''
+        return {key: total if amounts else None
+            for key, (total, _, amounts) in self.group(by, **filters).items()}
+
+    def counts(self, by=(), **filters):
+        ''' return {key: number of transactions} like group() '''
+        return {key: count for key, (_, count, _) in self.group(by, **filters).items()}
+
+    def total(self, **filters):
+        ''' return the total amount of the transactions matching the
+            filters, or None if none of them has an amount '''
+        return self.totals(**filters).get(())
+
+    def date_total(self, bgn, end):
+        ''' Transaction.date_total '''
+        return self.total(bgn=bgn, end=end)
+
+    def month_total(self, month):
+        ''' Transaction.month_total '''
+        return self.total(month=month)
+
+    def year_month_total(self, year, month):
+        ''' Transaction.year_month_total '''
+        return self.total(year=year, month=month)
+
+    def year_total(self, year):
+        ''' Transaction.year_total '''
+        return self.total(year=year)
+
+    def cat_total(self, cat):
+        ''' Transaction.cat_total '''
+        return self.total(category=cat)
+
+
+def _date_bounds(bgn, end, year, month):
+    ''' return the (low, high) yyyymmdd range of the date filters, or
+        (None, None) if there is none; as in where_clause, month alone
+        means that month of every year and is left to the caller '''
+    low = high = None
+    ranges = []
+    # the SQL methods accept text dates too
+    bgn = None if bgn is None else int(bgn)
+    end = None if end is None else int(end)
+    if bgn is not None or end is not None:
+        ranges.append((bgn, end))
+    if year is not None:
+        ranges.append(month_range(year, month) if month is not None
+            else year_range(year))
+    for start, stop in ranges:
+        if start is not None:
+            low = start if low is None else max(low, start)
+        if stop is not None:
+            high = stop if high is None else min(high, stop)
+    if low is None and high is None:
+        return (None, None)
+    return (low if low is not None else -2**63 + 1,
+        high if high is not None else 2**63 - 1)
@@ -0,0 +1,268 @@
+'''
+benchmark.py times the tracker ORMs on large synthetic databases
+
+For each scale (number of transactions) it builds a database from a
+seeded generator, spread over YEARS years and CATEGORIES categories,
+and times every public method of Transaction and Category on it, plus
+clone_database.  With --workers it also times the aggregates of
+ParallelTransaction (see parallel.py) for each number of workers;
+1 worker runs them serially, as a baseline.  Each case runs repeat
+times and the best and median times are kept.  The results, with
+the Python and SQLite versions, are written as JSON so runs on
+different commits can be compared:
+
+    python benchmark.py --scales 1000 100000 1000000 --output base.json
+    python benchmark.py --scales 1000 100000 1000000 --compare base.json
+    python benchmark.py --scales 1000000 --only group_by total \
+        --workers 1 2 4 8
+
+The same seed always gives the same database and the same arguments
+to every call.  Databases are built in a temporary directory, which
+is removed afterwards.
+
+'''
+
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+from category import Category
+from database import clone_database, release_database
+from parallel import ParallelTransaction
+from transactions import Transaction
+
+FIRST_YEAR = 2000
+YEARS = 25
+CATEGORIES = 40
+OUTPUT = 'bench_output.txt'
+
+
+def generate(seed, count):
+    ''' yield count transactions made from seed '''
+    rand = random.Random(seed)
+    for i in range(count):
+        yield {'amount':rand.randint(1, 1000),
+            'category':'cat%d' % rand.randrange(CATEGORIES),
+            'date':(FIRST_YEAR + rand.randrange(YEARS))*10000
+                + rand.randint(1, 12)*100 + rand.randint(1, 28),
+            'description':'transaction %d' % i}
+
+
+def build(path, seed, count):
+    ''' create a database at path with count transactions and the
+        categories they use '''
+    with Transaction(path) as tran, Category(path) as cat:
+        tran.add_many(generate(seed, count), batch_size=10000)
+        cat.add_many({'name':'cat%d' % i, 'desc':'category %d' % i}
+            for i in range(CATEGORIES))
+
+
+def cases(tran, cat, rand, count):
+    ''' return a list of (class name, method name, function) to time;
+        every function takes no arguments and picks fresh ones from rand '''
+    rowid = lambda: rand.randint(1, count)
+    year = lambda: FIRST_YEAR + rand.randrange(YEARS)
+    month = lambda: rand.randint(1, 12)
+    category = lambda: 'cat%d' % rand.randrange(CATEGORIES)
+
+    def date_range():
+        bgn = year()*10000 + month()*100 + 1
+        return (bgn, bgn + 27)
+
+    def add():
+        return tran.add(next(generate(rand.random(), 1)))
+
+    def add_many():
+        return tran.add_many(generate(rand.random(), 1000))
+
+    def delete():
+        tran.delete(add())
+
+    def select_many():
+        return tran.select_many([rowid() for _ in range(100)])
+
+    def delete_many():
+        return tran.delete_many(add_many())
+
+    def delete_where():
+        tran.add_many(dict(item, category='doomed')
+            for item in generate(rand.random(), 1000))
+        return tran.delete_where(category='doomed')
+
+    def page():
+        return list(tran.iter_transactions(after_rowid=rowid(), limit=100))
+
+    def cat_add():
+        return cat.add({'name':'new', 'desc':'new category'})
+
+    def cat_add_many():
+        return cat.add_many({'name':'new', 'desc':'new category'} for _ in range(100))
+
+    def cat_delete():
+        cat.delete(cat_add())
+
+    def cat_delete_many():
+        return cat.delete_many(cat.add_many({'name':'new%d' % i, 'desc':'new category'}
+            for i in range(100)))
+
+    # names are unique, so an update keeps the name and changes the
+    # description
+    names = {row['rowid']:row['name'] for row in cat.select_all()}
+
+    def cat_update():
+        rowid = rand.choice(list(names))
+        cat.update(rowid, {'name':names[rowid], 'desc':'updated'})
+
+    def clone():
+        release_database(clone_database(tran.db))
+
+    return [
+        ('Transaction', 'select_one', lambda: tran.select_one(rowid())),
+        ('Transaction', 'select_many', select_many),
+        ('Transaction', 'show_transactions', tran.show_transactions),
+        ('Transaction', 'iter_transactions', page),
+        ('Transaction', 'add', add),
+        ('Transaction', 'add_many', add_many),
+        ('Transaction', 'delete', delete),
+        ('Transaction', 'delete_many', delete_many),
+        ('Transaction', 'delete_where', delete_where),
+        ('Transaction', 'summarize', lambda: tran.summarize(year=year(), month=month())),
+        ('Transaction', 'print_sum_date', lambda: tran.print_sum_date(*date_range())),
+        ('Transaction', 'date_total', lambda: tran.date_total(*date_range())),
+        ('Transaction', 'print_sum_month', lambda: tran.print_sum_month(month())),
+        ('Transaction', 'month_total', lambda: tran.month_total(month())),
+        ('Transaction', 'print_sum_year_month',
+            lambda: tran.print_sum_year_month(year(), month())),
+        ('Transaction', 'year_month_total', lambda: tran.year_month_total(year(), month())),
+        ('Transaction', 'print_sum_year', lambda: tran.print_sum_year(year())),
+        ('Transaction', 'year_total', lambda: tran.year_total(year())),
+        ('Transaction', 'print_sum_cat', lambda: tran.print_sum_cat(category())),
+        ('Transaction', 'cat_total', lambda: tran.cat_total(category())),
+        ('Transaction', 'group_by', lambda: tran.group_by(('month', 'category'),
+            year=year())),
+        ('Transaction', 'group_sums', lambda: tran.group_sums(('year', 'month'))),
+        ('Transaction', 'total', lambda: tran.total(year=year(), category=category())),
+        ('Transaction', 'search', lambda: tran.search(str(rand.randrange(count)))),
+        ('Transaction', 'verify_rollups', tran.verify_rollups),
+        ('Transaction', 'rebuild_rollups', tran.rebuild_rollups),
+        ('Category', 'select_all', cat.select_all),
+        ('Category', 'iter_all', lambda: list(cat.iter_all())),
+        ('Category', 'select_one', lambda: cat.select_one(rand.randint(1, CATEGORIES))),
+        ('Category', 'select_many', lambda: cat.select_many(
+            rand.sample(range(1, CATEGORIES + 1), 10))),
+        ('Category', 'search', lambda: cat.search(str(rand.randrange(CATEGORIES)))),
+        ('Category', 'add', cat_add),
+        ('Category', 'add_many', cat_add_many),
+        ('Category', 'update', cat_update),
+        ('Category', 'delete', cat_delete),
+        ('Category', 'delete_many', cat_delete_many),
+        ('database', 'clone_database', clone),
+    ]
+
+
+def parallel_cases(par, rand):
+    ''' return a list of (method name, function) to time on the
+        ParallelTransaction par, like cases() '''
+    year = lambda: FIRST_YEAR + rand.randrange(YEARS)
+    category = lambda: 'cat%d' % rand.randrange(CATEGORIES)
+    return [
+        ('group_by', lambda: par.group_by(('month', 'category'))),
+        ('total', lambda: par.total(year=year(), category=category())),
+    ]
+
+
+def measure(func, repeat):
+    ''' return the times of repeat calls of func, in seconds '''
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def run(scales, seed=0, repeat=5, only=None, log=None, workers=()):
+    ''' benchmark every scale and return the results as a dict; only,
+        if given, is a collection of method names to time, and workers
+        the numbers of ParallelTransaction workers to time '''
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for count in scales:
+            path = os.path.join(tmp, 'bench%d.db' % count)
+            start = time.perf_counter()
+            build(path, seed, count)
+            if log:
+                log('built %d rows in %.2fs' % (count, time.perf_counter() - start))
+            with Transaction(path) as tran, Category(path) as cat:
+                rand = random.Random(seed)
+                timed = cases(tran, cat, rand, count)
+                pools = [ParallelTransaction(tran, number) for number in workers]
+                for par in pools:
+                    timed.extend(('Parallel%d' % par.workers, method, func)
+                        for method, func in parallel_cases(par, rand))
+                for cls, method, func in timed:
+                    if only and method not in only:
+                        continue
+                    times = measure(func, repeat)
+                    result = {'scale':count, 'class':cls, 'method':method,
+                        'repeat':repeat, 'best':min(times),
+                        'median':statistics.median(times)}
+                    results.append(result)
+                    if log:
+                        log('%8d %-12s %-22s %10.6fs' % (count, cls, method, result['best']))
+                for par in pools:
+                    par.close()
+    return {'seed':seed, 'python':platform.python_version(),
+        'sqlite':sqlite3.sqlite_version, 'platform':platform.platform(),
+        'time':time.strftime('%Y-%m-%dT%H:%M:%S'), 'results':results}
+
+
+def compare(old, new):
+    ''' return (scale, class, method, old best, new best, ratio) for
+        every case in both result dicts; a ratio above 1 is a slowdown '''
+    before = {(r['scale'], r['class'], r['method']):r['best'] for r in old['results']}
+    rows = []
+    for result in new['results']:
+        key = (result['scale'], result['class'], result['method'])
+        if key in before:
+            rows.append(key + (before[key], result['best'],
+                result['best'] / before[key] if before[key] else None))
+    return rows
+
+
+def main(argv):
+    ''' run the benchmarks from the shell '''
+    parser = argparse.ArgumentParser(prog='benchmark.py',
+        description='time the tracker ORMs on synthetic databases')
+    parser.add_argument('--scales', type=int, nargs='+', default=[1000, 100000])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--only', nargs='+', help='method names to time')
+    parser.add_argument('--workers', type=int, nargs='+', default=[],
+        help='numbers of worker processes to time the parallel aggregates with')
+    parser.add_argument('--output', default=OUTPUT)
+    parser.add_argument('--compare', help='an earlier output file to compare with')
+    args = parser.parse_args(argv[1:])
+    results = run(args.scales, args.seed, args.repeat, args.only, log=print,
+        workers=args.workers)
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=1)
+    print('results written to %s' % args.output)
+    if args.compare:
+        with open(args.compare) as file:
+            old = json.load(file)
+        for scale, cls, method, before, after, ratio in compare(old, results):
+            print('%8d %-12s %-22s %10.6fs %10.6fs %6.2fx' % (
+                scale, cls, method, before, after, ratio or 0))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,110 @@
+'''
+cache.py is an optional read-through cache for the ORM queries
+
+A Transaction or Category created with cache_size=N keeps the
+results of up to N recent read calls, evicting the least recently
+used one when it is full:
+
+    tran = Transaction('tracker.db', cache_size=128)
+    tran.cat_total('bills')     # runs the query
+    tran.cat_total('bills')     # answered from the cache
+    tran.cache_info()           # {'hits': 1, 'misses': 1, ...}
+
+The whole cache is dropped as soon as the database may have changed:
+after any write through a Transaction or Category sharing the same
+Database (Database.generation), and after a commit by any other
+connection or process (PRAGMA data_version).
+
+'''
+
+import functools
+import threading
+from collections import OrderedDict
+
+
+def _copy(value):
+    ''' copy the lists and dicts in a result so callers can't change
+        the cached value; rows themselves are immutable '''
+    if isinstance(value, list):
+        return list(value)
+    if isinstance(value, dict):
+        return {key:_copy(item) for key, item in value.items()}
+    return value
+
+
+class QueryCache():
+    ''' QueryCache is a size-bounded LRU map from calls to results '''
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._results = OrderedDict()
+        self._stamp = None
+        # the ORM objects, and so their caches, may be shared by threads
+        self._lock = threading.Lock()
+
+    def check(self, dbase):
+        ''' drop every result if dbase changed since they were read;
+            this returns the stamp to pass to put() '''
+        stamp = dbase.stamp()
+        with self._lock:
+            if stamp != self._stamp:
+                self._results.clear()
+                self._stamp = stamp
+        return stamp
+
+    def get(self, key):
+        ''' return (True, result) for a cached call, else (False, None) '''
+        with self._lock:
+            try:
+                result = self._results[key]
+            except KeyError:
+                self.misses += 1
+                return (False, None)
+            self._results.move_to_end(key)
+            self.hits += 1
+        return (True, _copy(result))
+
+    def put(self, key, result, stamp):
+        ''' remember the result of a call read at stamp, evicting the
+            oldest if full.  If another thread has seen a newer stamp in
+            the meantime the result may be stale and is not kept.
+        '''
+        result = _copy(result)
+        with self._lock:
+            if stamp != self._stamp:
+                return
+            self._results[key] = result
+            if len(self._results) > self.maxsize:
+                self._results.popitem(last=False)
+
+    def clear(self):
+        ''' drop every result and reset the statistics '''
+        with self._lock:
+            self._results.clear()
+            self.hits = self.misses = 0
+
+    def info(self):
+        ''' return the hit and miss statistics as a dict '''
+        with self._lock:
+            return {'hits':self.hits, 'misses':self.misses,
+                'size':len(self._results), 'maxsize':self.maxsize}
+
+
+def cached(method):
+    ''' decorate an ORM read method so its results go through self.cache;
+        it is called directly when the object has no cache '''
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        cache = self.cache
+        if cache is None:
+            return method(self, *args, **kwargs)
+        stamp = cache.check(self.db)
+        key = (method.__name__, args, tuple(sorted(kwargs.items())))
+        found, result = cache.get(key)
+        if not found:
+            result = method(self, *args, **kwargs)
+            cache.put(key, result, stamp)
+        return result
+    return wrapper
@@ -3,17 +3,38 @@ category.py is a Object Relational Mapping to the categories table
 
 The ORM will work map SQL rows with the schema
     (rowid,name,description)
-to Python Dictionaries.
+to CategoryRows, compact read-only rows that can be used like
+Python Dictionaries (see rows.py).  rowid is the category's id, which
+transactions refer to.  Names are unique: adding a category whose
+name is taken updates its description instead of adding a row, and
+a category still used by transactions can't be deleted.
 
 This app will store the data in a SQLite database ~/tracker.db
 
+Category objects keep their connection open between calls (see
+database.py), so close them, or use them in a with-statement, when
+you are done with them.
+
 '''
+import json
 import sqlite3
+from itertools import islice
+
+from cache import QueryCache, cached
+from database import open_database, release_database, search_error
+from migrations import migrate
+from rows import row_type
+
+CategoryRow = row_type('CategoryRow',('rowid','name','desc'))
+
+# add a category, or update the description of the one with its name
+UPSERT = """INSERT INTO categories (name, desc) VALUES (?,?)
+    ON CONFLICT (name) DO UPDATE SET desc=excluded.desc"""
 
 def to_cat_dict(cat_tuple):
-    ''' cat is a category tuple (rowid, name, desc)'''
-    cat = {'rowid':cat_tuple[0], 'name':cat_tuple[1], 'desc':cat_tuple[2]}
-    return cat
+    ''' cat is a category tuple (rowid, name, desc)
+        this returns a CategoryRow, which can be used like a dict'''
+    return CategoryRow._make(cat_tuple)
 
 def to_cat_dict_list(cat_tuples):
     ''' convert a list of category tuples into a list of dictionaries'''
@@ -22,71 +43,163 @@ def to_cat_dict_list(cat_tuples):
 class Category():
     ''' Category represents a table of categories'''
 
-    def __init__(self,dbfile):
-        con= sqlite3.connect(dbfile)
-        cur = con.cursor()
-        cur.execute('''CREATE TABLE IF NOT EXISTS categories
-                    (name text, desc text)''')
-        con.commit()
-        con.close()
+    def __init__(self,dbfile,cache_size=0,concurrent=False):
+        self.db = open_database(dbfile)
+        self._released = False
+        # see cache.py; reads are not cached unless cache_size is given
+        self.cache = QueryCache(cache_size) if cache_size else None
+        try:
+            if concurrent:
+                # WAL, busy timeout and write retries; see database.py
+                self.db.use_wal()
+            migrate(self.db)
+        except BaseException:
+            self.close()
+            raise
         self.dbfile = dbfile
 
+    def close(self):
+        ''' release the shared connection; it is closed once no other
+            Category or Transaction is using it '''
+        if not self._released:
+            self._released = True
+            release_database(self.db)
+
+    def cache_info(self):
+        ''' return the cache statistics, or None if there is no cache '''
+        return self.cache.info() if self.cache else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @cached
     def select_all(self):
         ''' return all of the categories as a list of dicts.'''
-        con= sqlite3.connect(self.dbfile)
-        cur = con.cursor()
-        cur.execute("SELECT rowid,* from categories")
+        cur = self.db.execute("SELECT id,name,desc from categories")
         tuples = cur.fetchall()
-        con.commit()
-        con.close()
         return to_cat_dict_list(tuples)
 
+    def iter_all(self,after_rowid=0,limit=None,chunk_size=500):
+        ''' yield the categories with rowid greater than after_rowid in
+            rowid order, reading chunk_size rows at a time.
+            pass the last rowid seen as after_rowid to get the next page.
+        '''
+        sql = "SELECT id,name,desc from categories WHERE id>(?) ORDER BY id"
+        params = (after_rowid,)
+        if limit is not None:
+            sql += " LIMIT (?)"
+            params += (limit,)
+        for cat in self.db.iterate(sql,params,chunk_size):
+            yield to_cat_dict(cat)
+
+    @cached
     def select_one(self,rowid):
         ''' return a category with a specified rowid '''
-        con= sqlite3.connect(self.dbfile)
-        cur = con.cursor()
-        cur.execute("SELECT rowid,* from categories where rowid=(?)",(rowid,) )
+        cur = self.db.execute("SELECT id,name,desc from categories where id=(?)",(rowid,) )
         tuples = cur.fetchall()
-        con.commit()
-        con.close()
         return to_cat_dict(tuples[0])
 
+    def select_many(self,rowids):
+        ''' return (rows, missing): the categories with the rowids in
+            rowids, in that order, read with one query, and the list of
+            rowids that don't exist.  this is never cached
+        '''
+        rowids = [int(rowid) for rowid in rowids]
+        cur = self.db.execute('''SELECT categories.id,name,desc
+            FROM json_each(?) AS ids JOIN categories ON categories.id=ids.value
+            ORDER BY ids.key''',(json.dumps(rowids),))
+        rows = to_cat_dict_list(cur.fetchall())
+        found = {row[0] for row in rows}
+        return (rows,[rowid for rowid in rowids if rowid not in found])
+    @cached
+    def search(self,query,limit=20):
+        ''' return up to limit categories whose name or description
+            matches the full-text query (FTS5 syntax, see
+            Transaction.search), best matches first.
+            ValueError is raised for a malformed query
+        '''
+        try:
+            cur = self.db.execute('''SELECT categories.id,categories.name,categories.desc
+                FROM categories_fts JOIN categories ON categories.id=categories_fts.rowid
+                WHERE categories_fts MATCH (?) ORDER BY rank LIMIT (?)''',(query,limit))
+            tuples = cur.fetchall()
+        except sqlite3.OperationalError as error:
+            bad_query = search_error(error,query)
+            if bad_query is None:
+                raise
+            raise bad_query from error
+        return to_cat_dict_list(tuples)
 
     def add(self,item):
-        ''' add a category to the categories table.
-            this returns the rowid of the inserted element
+        ''' add a category to the categories table, or update the
+            description of the category with the same name.
+            this returns the rowid of the category
         '''
-        con= sqlite3.connect(self.dbfile)
-        cur = con.cursor()
-        cur.execute("INSERT INTO categories VALUES(?,?)",(item['name'],item['desc']))
-        con.commit()
-        cur.execute("SELECT last_insert_rowid()")
-        last_rowid = cur.fetchone()
-        con.commit()
-        con.close()
-        return last_rowid[0]
+        with self.db.transaction() as cur:
+            return self._upsert(cur,item['name'],item['desc'])
+
+    def add_many(self,items,batch_size=1000):
+        ''' add or update an iterable of categories in one database
+            transaction, batch_size rows per executemany call.
+            this returns the list of rowids of the categories, in order
+        '''
+        items = iter(items)
+        rowids = []
+        with self.db.transaction() as cur:
+            while True:
+                batch = [(item['name'],item['desc']) for item in islice(items,batch_size)]
+                if not batch:
+                    break
+                named = [cat for cat in batch if cat[0] is not None]
+                cur.executemany(UPSERT,named)
+                ids = dict(cur.execute("""SELECT name,id FROM categories
+                    WHERE name IN (SELECT value FROM json_each(?))""",
+                    (json.dumps([name for name,_ in named]),)))
+                for name,desc in batch:
+                    rowids.append(self._upsert(cur,name,desc) if name is None
+                        else ids[name])
+        return rowids
+
+    @staticmethod
+    def _upsert(cur,name,desc):
+        ''' add or update one category with cur; return its rowid '''
+        cur.execute(UPSERT,(name,desc))
+        if name is None:
+            # NULL names are never equal, so this was an insert
+            return cur.lastrowid
+        return cur.execute("SELECT id FROM categories WHERE name=(?)",(name,)).fetchone()[0]
 
     def update(self,rowid,item):
-        ''' update a category in the categories table.
-            # this returns the rowid of the inserted element
+        ''' update a category in the categories table; its transactions
+            follow a change of name.  sqlite3.IntegrityError is raised
+            if another category has the new name
         '''
-        con= sqlite3.connect(self.dbfile)
-        cur = con.cursor()
-        cur.execute('''UPDATE categories
-                        SET name=(?), desc=(?)
-                        WHERE rowid=(?);
-        ''',(item['name'],item['desc'],rowid))
-        con.commit()
-        con.close()
+        with self.db.transaction() as cur:
+            cur.execute('''UPDATE categories
+                            SET name=(?), desc=(?)
+                            WHERE id=(?);
+            ''',(item['name'],item['desc'],rowid))
 
     def delete(self,rowid):
         ''' delete a category from the categories table.
-            this returns the rowid of the inserted element
+            sqlite3.IntegrityError is raised if transactions use it
+        '''
+        with self.db.transaction() as cur:
+            cur.execute('''DELETE FROM categories
+                           WHERE id=(?);
+            ''',(rowid,))
+
+    def delete_many(self,rowids):
+        ''' delete the categories with the rowids in rowids in one
+            database transaction; none are deleted if any is in use
+            (sqlite3.IntegrityError).
+            this returns the number of categories deleted
         '''
-        con= sqlite3.connect(self.dbfile)
-        cur = con.cursor()
-        cur.execute('''DELETE FROM categories
-                       WHERE rowid=(?);
-        ''',(rowid,))
-        con.commit()
-        con.close()
+        with self.db.transaction() as cur:
+            cur.execute('''DELETE FROM categories
+                           WHERE id IN (SELECT value FROM json_each(?));
+            ''',(json.dumps([int(rowid) for rowid in rowids]),))
+        return cur.rowcount
@@ -0,0 +1,22 @@
+'''
+conftest holds the fixtures shared by several test modules
+'''
+
+import random
+
+import pytest
+
+def make_transactions(seed, count):
+    ''' return count transactions over 2010-2013, some of them without
+    an amount, a category or a date '''
+    rand = random.Random(seed)
+    return [{'amount':rand.choice([None, rand.randint(1, 100)]),
+        'category':rand.choice(['food', 'ent', 'travel', None]),
+        'date':rand.choice([None] + [year*10000 + rand.randint(1, 12)*100 + 1
+            for year in range(2010, 2014)] * 5),
+        'description':'item %d' % i} for i in range(count)]
+
+@pytest.fixture(scope='session')
+def make():
+    ''' the seeded transaction builder make(seed, count)'''
+    return make_transactions
@@ -0,0 +1,404 @@
+'''
+database.py manages the SQLite connections used by the ORMs
+
+Transaction and Category used to open, commit and close a new
+connection in every method.  Instead each database file now gets
+one long-lived Database object holding long-lived connections
+(one per thread), and every ORM object pointing at the same file
+shares it:
+
+    tran = Transaction('tracker.db')
+    cat = Category('tracker.db')
+    tran.db is cat.db    # True
+
+The connections are closed when the last ORM object using them is
+closed (or leaves its with-block).  If the process forks, the
+child opens a fresh connection the first time it touches the
+database and never reuses or closes the one it inherited.
+
+In-memory databases are supported two ways.  ':memory:' gives every
+ORM object its own private database, while memory_database() names
+a shared in-memory database that every Transaction and Category
+given the same name uses, for as long as one of them is open:
+
+    mem = memory_database('scratch')
+    tran = Transaction(mem)
+    cat = Category(mem)
+
+clone_database() copies any database, on disk or in memory, into a
+new shared in-memory one with the SQLite backup API, which is the
+fast way to start each test or simulation from a pre-seeded fixture.
+The caller holds one reference to the clone and releases it when done:
+
+    clone = clone_database(seed.db)
+    with Transaction(clone) as tran:
+        ...
+    release_database(clone)
+
+In-memory databases are not carried across a fork.
+
+Transaction and Category objects can be shared between threads:
+every thread gets its own connection (see Database.connect).
+
+Several processes can share one database file.  Creating a
+Transaction or Category with concurrent=True calls
+Database.use_wal(), which switches the file to write-ahead logging,
+sets synchronous=NORMAL and gives every connection a busy timeout.
+With WAL on, the guarantees are:
+
+  * any number of readers run at the same time as one writer;
+    readers never wait for the writer and the writer never waits
+    for readers
+  * each read statement sees the database as of the last commit
+    before it started, never a half-written transaction
+  * writers are serialized: a write transaction starts with
+    BEGIN IMMEDIATE, so it either gets the write lock up front or
+    waits for it.  If the lock is still held after the busy timeout,
+    BEGIN is retried with exponential backoff, and
+    sqlite3.OperationalError is raised only when every retry fails.
+  * a committed transaction survives a crash of the process; with
+    synchronous=NORMAL the last transactions may be lost if the
+    machine loses power, but the file is never corrupted
+
+WAL needs every process on the same host (not a network file system)
+and is ignored for in-memory databases.
+
+A shared in-memory database (memory_database() or clone_database())
+gives weaker isolation than a file.  Its connections share one cache,
+where a reader that meets a writer's table lock fails with
+SQLITE_LOCKED instead of waiting, and Python's sqlite3 module has no
+way to wait for the lock to be released.  So every connection to it
+reads with PRAGMA read_uncommitted=1:
+
+  * readers on other threads never wait for or block a writer
+  * but they can see rows of a write transaction that hasn't
+    committed yet, and that may still be rolled back
+  * writers are still serialized, and a reader on the writer's own
+    thread sees exactly what a file would show it
+
+Use a database file when other threads must only see committed data.
+
+'''
+
+import contextlib
+import itertools
+import os
+import random
+import sqlite3
+import threading
+import time
+import urllib.parse
+import weakref
+
+_DATABASES = {}
+_LOCK = threading.Lock()
+_MEMORY_NAMES = itertools.count(1)
+
+# connections inherited across a fork; they must not be used or closed
+# by the child, so we keep them referenced instead of letting them be
+# finalized
+_INHERITED = []
+
+
+def database_key(dbfile):
+    ''' return the registry key for dbfile; files are keyed by absolute
+        path and URIs by themselves, while ':memory:' is never shared '''
+    path = os.fspath(dbfile)
+    if path == ':memory:':
+        return None
+    if path.startswith('file:'):
+        return path
+    return os.path.abspath(path)
+
+
+def memory_database(name=None):
+    ''' return the URI of the shared in-memory database called name,
+        or of a new one with a unique name '''
+    if name is None:
+        name = 'memdb%d' % next(_MEMORY_NAMES)
+    return 'file:%s?mode=memory&cache=shared' % name
+
+
+class Database():
+    ''' Database owns the connections to one SQLite database file '''
+
+    def __init__(self, dbfile, max_connections=16):
+        self.dbfile = os.fspath(dbfile)
+        if self.dbfile == ':memory:':
+            # per-thread connections must all see the same database
+            self.dbfile = memory_database()
+        self.refs = 0
+        self.closed = False
+        # bumped whenever a write transaction ends, so caches can tell
+        # that anything they read before may be stale
+        self.generation = 0
+        # see use_wal()
+        self.wal = False
+        self.busy_timeout = 5.0
+        self.retries = 5
+        self.retry_delay = 0.05
+        # see connect()
+        self.max_connections = max_connections
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        ''' forget every connection; used when created and after a fork '''
+        self._pid = os.getpid()
+        self._local = threading.local()
+        self._idle = []
+        self._open = set()
+        self._slots = threading.BoundedSemaphore(self.max_connections)
+        self._external = 0
+
+    def connect(self):
+        ''' return the calling thread's connection, opening one if needed.
+
+            Each thread gets a connection of its own, so ORM objects can be
+            shared by a thread pool.  At most max_connections are open at
+            once; a thread that needs one more waits up to busy_timeout
+            for another thread to exit and hand its connection back.
+            After a fork the child starts over with new connections.
+        '''
+        if self.closed:
+            raise sqlite3.ProgrammingError('Cannot operate on a closed database.')
+        if self._pid != os.getpid():
+            self._after_fork()
+        local = self._local
+        try:
+            return local.con
+        except AttributeError:
+            pass
+        if not self._slots.acquire(timeout=self.busy_timeout):
+            raise sqlite3.OperationalError('all %d connections to %s are in use'
+                % (self.max_connections, self.dbfile))
+        with self._lock:
+            con = self._idle.pop() if self._idle else None
+        if con is None:
+            con = sqlite3.connect(self.dbfile, isolation_level=None,
+                timeout=self.busy_timeout, uri=self.dbfile.startswith('file:'),
+                check_same_thread=False)
+            if 'mode=memory' in self.dbfile:
+                # dirty reads; see the top of this module
+                con.execute('PRAGMA read_uncommitted=1')
+            if self.wal:
+                self._configure(con)
+            with self._lock:
+                self._open.add(con)
+        local.con = con
+        local.data_version = None
+        # the sentinel dies with the thread's locals, handing the
+        # connection back for another thread to use
+        local.sentinel = _Sentinel()
+        weakref.finalize(local.sentinel, self._give_back, con, self._slots)
+        return con
+
+    def _after_fork(self):
+        ''' start over in a forked child.  The parent's lock may have been
+            held by a thread that does not exist here, so it is replaced
+            rather than taken, and the parent's thread-local state is
+            dropped only once the new state is in place, since finalizing
+            it calls _give_back.
+        '''
+        old_local = self._local
+        _INHERITED.extend(self._open)
+        self._lock = threading.RLock()
+        self._reset()
+        del old_local
+
+    def _give_back(self, con, slots):
+        ''' return the connection of a thread that has exited '''
+        if slots is not self._slots:
+            # left over from before a fork or a close
+            return
+        with self._lock:
+            if self.closed or con not in self._open:
+                con = None
+            else:
+                self._idle.append(con)
+        slots.release()
+
+    def _configure(self, con):
+        ''' apply the per-connection settings of the concurrency mode '''
+        con.execute('PRAGMA synchronous=NORMAL')
+        con.execute('PRAGMA busy_timeout=%d' % int(self.busy_timeout * 1000))
+
+    def use_wal(self, busy_timeout=None):
+        ''' switch to the concurrency mode described at the top of this
+            module; this returns the journal mode now in use '''
+        if busy_timeout is not None:
+            self.busy_timeout = busy_timeout
+        self.wal = True
+        con = self.connect()
+        self._configure(con)
+        return con.execute('PRAGMA journal_mode=WAL').fetchone()[0]
+
+    def execute(self, sql, params=()):
+        ''' run a single read-only statement and return its cursor '''
+        return self.connect().execute(sql, params)
+
+    def stamp(self):
+        ''' return a value that changes whenever the database may have
+            changed: after a write through this Database (generation) and
+            after a commit by any other connection or process, which
+            SQLite reports through PRAGMA data_version
+        '''
+        con = self.connect()
+        local = self._local
+        version = con.execute('PRAGMA data_version').fetchone()[0]
+        if version != local.data_version:
+            # a thread's first check counts as a change too, since its
+            # connection has no earlier version to compare with
+            local.data_version = version
+            with self._lock:
+                self._external += 1
+        return (self.generation, self._external)
+
+    def iterate(self, sql, params=(), chunk_size=500):
+        ''' run a read-only statement and yield its rows, fetching
+            chunk_size rows at a time so the result is never held in
+            memory all at once.  Outside a transaction there is no
+            snapshot: SQLite may read further rows only as they are
+            fetched, so rows committed by other connections while the
+            generator is half consumed can appear in what it yields.
+        '''
+        cur = self.connect().execute(sql, params)
+        try:
+            while True:
+                rows = cur.fetchmany(chunk_size)
+                if not rows:
+                    return
+                yield from rows
+        finally:
+            cur.close()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        ''' yield a cursor; everything run on it commits together, or
+            rolls back if the block raises.  Nested calls join the
+            outer transaction.
+        '''
+        con = self.connect()
+        cur = con.cursor()
+        if con.in_transaction:
+            yield cur
+            return
+        self._begin(cur)
+        try:
+            yield cur
+        except BaseException:
+            con.rollback()
+            raise
+        else:
+            con.commit()
+        finally:
+            with self._lock:
+                self.generation += 1
+
+    def _begin(self, cur):
+        ''' start a write transaction, retrying with exponential backoff
+            while another connection holds the write lock '''
+        delay = self.retry_delay
+        for attempt in range(self.retries + 1):
+            try:
+                # take the write lock up front so two writers can never
+                # both read and then fail to upgrade to writing
+                cur.execute('BEGIN IMMEDIATE')
+                return
+            except sqlite3.OperationalError as error:
+                locked = 'locked' in str(error) or 'busy' in str(error)
+                if not locked or attempt == self.retries:
+                    raise
+            time.sleep(delay * random.uniform(0.5, 1.5))
+            delay *= 2
+
+    def close(self):
+        ''' close every connection; the Database cannot be used afterwards.
+            Threads still using it get sqlite3.ProgrammingError.
+        '''
+        with self._lock:
+            self.closed = True
+            cons = self._open if self._pid == os.getpid() else ()
+            self._open = set()
+            self._idle = []
+        for con in cons:
+            con.close()
+
+
+class _Sentinel():
+    ''' an object whose only job is to be finalized with a thread '''
+
+
+def open_database(dbfile):
+    ''' return the shared Database for dbfile, opening it if necessary;
+        dbfile may also be a Database, which is then shared '''
+    if isinstance(dbfile, Database):
+        with _LOCK:
+            dbfile.refs += 1
+            return dbfile
+    key = database_key(dbfile)
+    with _LOCK:
+        dbase = _DATABASES.get(key) if key is not None else None
+        if dbase is None:
+            dbase = Database(dbfile)
+            if key is not None:
+                _DATABASES[key] = dbase
+        dbase.refs += 1
+        return dbase
+
+
+def release_database(dbase):
+    ''' drop one reference to dbase and close it when nobody uses it '''
+    with _LOCK:
+        dbase.refs -= 1
+        if dbase.refs > 0:
+            return
+        key = database_key(dbase.dbfile)
+        if _DATABASES.get(key) is dbase:
+            del _DATABASES[key]
+    dbase.close()
+
+
+def clone_database(source, name=None):
+    ''' copy source, a Database or a database file, into a new shared
+        in-memory database and return its Database.  The caller owns
+        one reference to it: pass it (or its dbfile) to Transaction or
+        Category, and call release_database() on it once done, so it is
+        closed along with the last of them.  A database file is opened
+        read-only, so a missing one raises sqlite3.OperationalError
+        instead of being created.
+    '''
+    clone = Database(memory_database(name))
+    key = database_key(clone.dbfile)
+    with _LOCK:
+        if key in _DATABASES:
+            raise ValueError('in-memory database %r is already open' % name)
+        clone.refs = 1
+        _DATABASES[key] = clone
+    try:
+        if isinstance(source, Database):
+            source.connect().backup(clone.connect())
+        else:
+            path = os.fspath(source)
+            if not path.startswith('file:'):
+                path = 'file:%s?mode=ro' % urllib.parse.quote(os.path.abspath(path))
+            con = sqlite3.connect(path, uri=True)
+            try:
+                con.backup(clone.connect())
+            finally:
+                con.close()
+    except BaseException:
+        release_database(clone)
+        raise
+    return clone
+
+
+# the starts of the SQLite errors for a malformed full-text query
+_FTS_ERRORS = ('fts5:', 'unterminated string', 'no such column')
+
+def search_error(error, query):
+    ''' return a ValueError for an sqlite3.OperationalError raised by a
+        malformed full-text query, or None for any other error '''
+    if str(error).startswith(_FTS_ERRORS):
+        return ValueError('bad search query %r: %s' % (query, error))
+    return None
@@ -0,0 +1,236 @@
+'''
+exporter.py writes transactions out of tracker.db in bulk
+
+export() streams the transactions matching the where_clause filters
+(all of them by default) to a file in one of three formats:
+
+    csv       a header row, then one row per transaction
+    jsonl     one JSON object per line
+    columnar  the compact binary format described below
+
+    with Transaction('tracker.db') as tran:
+        export(tran, 'food.csv', 'csv', category='food')
+        export_report(tran, '2022.col', 'columnar', 'print_sum_year', 2022)
+
+Rows are read from the cursor chunk_size at a time and written through
+a buffered file, so memory use does not grow with the table.  From
+the shell:
+
+    python exporter.py DBFILE OUTFILE [--format csv|jsonl|columnar]
+        [--bgn yyyymmdd] [--end yyyymmdd] [--year yyyy] [--month mm]
+        [--category name]
+
+The columnar format is a MAGIC line followed by blocks of up to
+chunk_size rows.  A block is its row count as a little-endian uint32
+and then one section per column of FIELDS: an integer column is a
+byte per row (1 if set, 0 for NULL) and an int64 per row, and a text
+column is an int32 length per row (-1 for NULL) and the UTF-8 bytes
+of the set values.  A row count of 0 ends the file.  read_columnar()
+reads it back.
+
+'''
+
+import argparse
+import csv
+import struct
+import sys
+from array import array
+from itertools import islice
+from json.encoder import encode_basestring
+
+from transactions import to_transaction_dict
+
+FIELDS = ('rowid', 'amount', 'category', 'date', 'description')
+TEXT_FIELDS = ('category', 'description')
+MAGIC = b'tracker-columnar 1\n'
+BUFFER_SIZE = 1 << 20
+
+# the filters selecting the rows of each Transaction report
+REPORTS = {
+    'show_transactions': lambda: {},
+    'print_sum_date': lambda bgn, end: {'bgn':bgn, 'end':end},
+    'print_sum_month': lambda month: {'month':month},
+    'print_sum_year_month': lambda year, month: {'year':year, 'month':month},
+    'print_sum_year': lambda year: {'year':year},
+    'print_sum_cat': lambda cat: {'category':cat},
+}
+
+_COUNT = struct.Struct('<I')
+
+
+def _chunks(rows, chunk_size):
+    ''' yield lists of up to chunk_size rows '''
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def write_csv(file, chunks):
+    ''' write a header and the rows to a binary file as CSV '''
+    text = _TextWriter(file)
+    writer = csv.writer(text, lineterminator='\n')
+    writer.writerow(FIELDS)
+    for chunk in chunks:
+        writer.writerows(chunk)
+        text.flush()
+
+
+def _json(value):
+    ''' return the JSON text of a column value '''
+    if value is None:
+        return 'null'
+    if value.__class__ is str:
+        return encode_basestring(value)
+    return repr(value)
+
+
+# json.dumps of a dict per row is the bottleneck of a JSONL export,
+# so each line is filled into a template instead
+_JSON_LINE = '{' + ', '.join('"%s": %%s' % field for field in FIELDS) + '}\n'
+
+
+def write_jsonl(file, chunks):
+    ''' write the rows to a binary file as JSON lines '''
+    for chunk in chunks:
+        file.write(''.join([_JSON_LINE % (_json(rowid), _json(amount),
+            _json(category), _json(date), _json(description))
+            for rowid, amount, category, date, description in chunk]
+            ).encode('utf-8'))
+
+
+def write_columnar(file, chunks):
+    ''' write the rows to a binary file in the columnar format '''
+    file.write(MAGIC)
+    for chunk in chunks:
+        file.write(_COUNT.pack(len(chunk)))
+        for field, column in zip(FIELDS, zip(*chunk)):
+            if field in TEXT_FIELDS:
+                data = [None if value is None else str(value).encode('utf-8')
+                    for value in column]
+                lengths = array('i', [-1 if value is None else len(value)
+                    for value in data])
+                file.write(_little(lengths).tobytes())
+                file.write(b''.join([value for value in data if value]))
+            else:
+                file.write(bytes([value is not None for value in column]))
+                values = array('q', [0 if value is None else value
+                    for value in column])
+                file.write(_little(values).tobytes())
+    file.write(_COUNT.pack(0))
+
+
+WRITERS = {'csv':write_csv, 'jsonl':write_jsonl, 'columnar':write_columnar}
+
+
+def export(tran, path, fmt='csv', chunk_size=10000, **filters):
+    ''' write the transactions of tran matching the where_clause filters
+        to path in the format fmt; this returns the number of rows '''
+    if fmt not in WRITERS:
+        raise ValueError('unknown export format %r' % (fmt,))
+    count = 0
+
+    def counted(rows):
+        nonlocal count
+        for chunk in _chunks(rows, chunk_size):
+            count += len(chunk)
+            yield chunk
+
+    rows = tran.iter_transactions(chunk_size=chunk_size, **filters)
+    with open(path, 'wb', buffering=BUFFER_SIZE) as file:
+        WRITERS[fmt](file, counted(rows))
+    return count
+
+
+def export_report(tran, path, fmt, report, *args, chunk_size=10000):
+    ''' export the rows of a Transaction report, such as
+        print_sum_year, called with args '''
+    return export(tran, path, fmt, chunk_size, **REPORTS[report](*args))
+
+
+def read_columnar(path):
+    ''' yield the TransactionRows of a columnar file '''
+    with open(path, 'rb', buffering=BUFFER_SIZE) as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError('%s is not a columnar export' % path)
+        while True:
+            count, = _COUNT.unpack(file.read(_COUNT.size))
+            if not count:
+                return
+            columns = []
+            for field in FIELDS:
+                if field in TEXT_FIELDS:
+                    lengths = _little(_read_array(file, 'i', count))
+                    blob = file.read(sum(length for length in lengths if length > 0))
+                    column = []
+                    offset = 0
+                    for length in lengths:
+                        if length < 0:
+                            column.append(None)
+                        else:
+                            column.append(blob[offset:offset+length].decode('utf-8'))
+                            offset += length
+                else:
+                    present = file.read(count)
+                    values = _little(_read_array(file, 'q', count))
+                    column = [value if set_ else None
+                        for set_, value in zip(present, values)]
+                columns.append(column)
+            for row in zip(*columns):
+                yield to_transaction_dict(row)
+
+
+def _read_array(file, typecode, count):
+    ''' read an array of count items of typecode from file '''
+    values = array(typecode)
+    values.frombytes(file.read(values.itemsize * count))
+    return values
+
+
+def _little(values):
+    ''' return an array in little-endian byte order '''
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+class _TextWriter():
+    ''' a text front end for a binary file that encodes whole chunks,
+        since csv.writer writes one row at a time '''
+
+    def __init__(self, file):
+        self.file = file
+        self.parts = []
+
+    def write(self, text):
+        self.parts.append(text)
+
+    def flush(self):
+        self.file.write(''.join(self.parts).encode('utf-8'))
+        self.parts = []
+
+
+def main(argv):
+    ''' export a database file from the shell '''
+    from transactions import Transaction
+    parser = argparse.ArgumentParser(prog='exporter.py',
+        description='export transactions from a tracker database')
+    parser.add_argument('dbfile')
+    parser.add_argument('outfile')
+    parser.add_argument('--format', choices=sorted(WRITERS), default='csv')
+    for name in ('bgn', 'end', 'year', 'month'):
+        parser.add_argument('--' + name, type=int)
+    parser.add_argument('--category')
+    args = parser.parse_args(argv[1:])
+    filters = {name:getattr(args, name) for name in
+        ('bgn', 'end', 'year', 'month', 'category')}
+    with Transaction(args.dbfile) as tran:
+        count = export(tran, args.outfile, args.format, **filters)
+    print('%d rows exported to %s' % (count, args.outfile))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,215 @@
+'''
+importer.py loads bank exports into the transactions table
+
+A CSV file (with a header row) or a JSONL file (one JSON object per
+line) is read and validated batch_size rows at a time, so files of
+any size are imported in bounded memory:
+
+    with Transaction('tracker.db') as tran:
+        stats = import_file(tran, 'bank.csv')
+    print(stats['rows'], 'rows at', stats['rows_per_sec'], 'rows/sec')
+
+Every row needs amount, category, date and description fields.
+Amounts must be whole numbers (or empty, for no amount) and dates are
+normalized to yyyymmdd integers; they may be given as 20220131,
+2022-01-31, 2022/01/31 or 01/31/2022.
+
+Each batch is committed in its own write transaction together with
+a checkpoint in the imports table recording how many rows of the
+file are in.  If an import is interrupted, running it again on the
+same file skips those rows and carries on where it stopped.  The
+checkpoint is kept under the file's path and fingerprint (its size,
+modification time and a hash of its first block), so a new export
+written to the same path is imported from its first row, and
+importing a file that is already in adds nothing.  From the shell:
+
+    python importer.py tracker.db bank.csv [--skip-invalid]
+
+'''
+
+import csv
+import datetime
+import functools
+import hashlib
+import json
+import os
+import sys
+import time
+from itertools import islice
+
+FIELDS = ('amount', 'category', 'date', 'description')
+
+DATE_FORMATS = ('%Y%m%d', '%Y-%m-%d', '%Y/%m/%d', '%m/%d/%Y')
+
+
+class InvalidRow(ValueError):
+    ''' raised for a row that can't be imported '''
+
+    def __init__(self, line, message):
+        super().__init__('line %d: %s' % (line, message))
+        self.line = line
+
+
+@functools.lru_cache(maxsize=4096)
+def normalize_date(value):
+    ''' return value, a date in one of DATE_FORMATS, as a yyyymmdd int;
+        exports repeat the same few dates, so the results are cached '''
+    text = str(value).strip()
+    for fmt in DATE_FORMATS:
+        try:
+            day = datetime.datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+        return day.year*10000 + day.month*100 + day.day
+    raise ValueError('bad date %r' % (value,))
+
+
+def normalize_amount(value):
+    ''' return value as an int, or None if it is empty '''
+    if value is None or value == '':
+        return None
+    if isinstance(value, float):
+        if not value.is_integer():
+            raise ValueError('amount %r is not a whole number' % (value,))
+        return int(value)
+    if isinstance(value, int):
+        return value
+    try:
+        return int(str(value).strip())
+    except ValueError:
+        raise ValueError('bad amount %r' % (value,)) from None
+
+
+def to_row(line, record):
+    ''' return a record read from line of a file as an
+        (amount, category, date, description) tuple '''
+    if isinstance(record, InvalidRow):
+        raise record
+    if not isinstance(record, dict):
+        raise InvalidRow(line, 'expected an object, got %r' % (record,))
+    missing = [field for field in FIELDS if field not in record]
+    if missing:
+        raise InvalidRow(line, 'missing ' + ', '.join(missing))
+    try:
+        return (normalize_amount(record['amount']),
+            record['category'], normalize_date(record['date']),
+            record['description'])
+    except (TypeError, ValueError) as error:
+        raise InvalidRow(line, str(error)) from None
+
+
+def read_csv(file):
+    ''' yield (line, record) for every row of a CSV file with a header '''
+    reader = csv.DictReader(file)
+    for record in reader:
+        yield reader.line_num, record
+
+
+def read_jsonl(file):
+    ''' yield (line, record) for every non-blank line of a JSONL file;
+        the record of a line that isn't JSON is an InvalidRow '''
+    for line, text in enumerate(file, 1):
+        if not text.strip():
+            continue
+        try:
+            record = json.loads(text)
+        except ValueError as error:
+            record = InvalidRow(line, str(error))
+        yield line, record
+
+
+READERS = {'csv':read_csv, 'jsonl':read_jsonl, 'json':read_jsonl}
+
+
+def fingerprint(path, block_size=65536):
+    ''' return a key telling the file at path apart from a different
+        file written to the same path later: its absolute path, size,
+        modification time and a hash of its first block '''
+    info = os.stat(path)
+    with open(path, 'rb') as file:
+        digest = hashlib.sha256(file.read(block_size)).hexdigest()
+    return '%s|%d|%d|%s' % (os.path.abspath(os.fspath(path)), info.st_size,
+        info.st_mtime_ns, digest)
+
+
+def checkpoint(dbase, source):
+    ''' return how many records of source have been imported so far '''
+    row = dbase.execute('SELECT rows FROM imports WHERE source=(?)',
+        (source,)).fetchone()
+    return row[0] if row else 0
+
+
+def import_file(tran, path, fmt=None, batch_size=10000, skip_invalid=False):
+    ''' import a CSV or JSONL file into tran, a Transaction, resuming
+        after the last checkpoint of an earlier import of the same file.
+        fmt is 'csv' or 'jsonl', by default taken from the file name.
+        A row that fails validation raises InvalidRow, or is counted and
+        left out when skip_invalid is true.
+        this returns a dict of statistics: rows imported, rows resumed
+        (skipped as already imported), invalid rows, seconds and
+        rows_per_sec
+    '''
+    if fmt is None:
+        fmt = os.path.splitext(os.fspath(path))[1].lstrip('.').lower()
+    if fmt not in READERS:
+        raise ValueError('unknown import format %r' % (fmt,))
+    source = fingerprint(path)
+    done = resumed = checkpoint(tran.db, source)
+    if not resumed:
+        # the checkpoints of earlier files at this path don't apply
+        prefix = os.path.abspath(os.fspath(path)) + '|'
+        with tran.db.transaction() as cur:
+            cur.execute('DELETE FROM imports WHERE substr(source, 1, ?)=(?)',
+                (len(prefix), prefix))
+    imported = invalid = 0
+    started = time.perf_counter()
+    with open(path, newline='', encoding='utf-8') as file:
+        records = READERS[fmt](file)
+        for _ in islice(records, resumed):
+            pass
+        while True:
+            chunk = list(islice(records, batch_size))
+            if not chunk:
+                break
+            batch = []
+            for line, record in chunk:
+                try:
+                    batch.append(to_row(line, record))
+                except InvalidRow:
+                    if not skip_invalid:
+                        raise
+                    invalid += 1
+            done += len(chunk)
+            with tran.db.transaction() as cur:
+                tran.insert_batch(cur, batch)
+                cur.execute('''INSERT INTO imports (source, rows) VALUES (?, ?)
+                    ON CONFLICT (source) DO UPDATE SET rows=excluded.rows''',
+                    (source, done))
+            imported += len(batch)
+    seconds = time.perf_counter() - started
+    return {'rows':imported, 'resumed':resumed, 'invalid':invalid,
+        'seconds':seconds,
+        'rows_per_sec':round(imported / seconds) if seconds else None}
+
+
+def main(argv):
+    ''' import a file from the shell '''
+    from transactions import Transaction
+    args = [arg for arg in argv[1:] if arg != '--skip-invalid']
+    if len(args) != 2:
+        print('usage: python importer.py DBFILE FILE.csv|FILE.jsonl [--skip-invalid]')
+        return 2
+    with Transaction(args[0]) as tran:
+        try:
+            stats = import_file(tran, args[1],
+                skip_invalid='--skip-invalid' in argv)
+        except InvalidRow as error:
+            print(error)
+            return 1
+    print('%(rows)d rows imported (%(resumed)d already in, %(invalid)d invalid)'
+        ' at %(rows_per_sec)s rows/sec' % stats)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
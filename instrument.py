@@ -0,0 +1,262 @@
+'''
+instrument.py measures where the ORMs spend their time
+
+Nothing is measured, and nothing costs anything, until enable() is
+called.  It wraps every public method of Transaction and Category,
+and while it is on each call records:
+
+  * the number of calls and their latency, as a histogram
+  * the rows returned (the length of a list, of a summary's
+    transactions or of select_many's rows; 1 for a single value and
+    0 for None)
+  * the time spent opening connections (setup), converting tuples to
+    rows (convert) and everything else, mostly SQLite (query)
+
+    instrument.enable(slow=0.05)
+    ...
+    instrument.stats()['Transaction.cat_total']
+    print(instrument.report())
+    instrument.disable()
+
+A call slower than the slow threshold (in seconds) is logged as a
+warning on the 'tracker.slow' logger, with the SQL and parameters it
+ran and their EXPLAIN QUERY PLAN.  A method called by another one
+counts as part of its caller.  The iterators are timed from the
+first to the last row they yield, so their latency includes the
+caller's own work between rows.
+
+'''
+
+import functools
+import inspect
+import logging
+import threading
+import time
+
+import category
+import database
+import transactions
+
+LOGGER = logging.getLogger('tracker.slow')
+
+# latency histogram bucket upper bounds, in seconds
+BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, float('inf'))
+
+CLASSES = (transactions.Transaction, category.Category)
+
+# (module, function) pairs whose time counts as row conversion
+CONVERTERS = ((transactions, 'to_transaction_dict'),
+    (transactions, 'to_transaction_dict_list'),
+    (category, 'to_cat_dict'), (category, 'to_cat_dict_list'))
+
+_LOCK = threading.Lock()
+_STATS = {}
+_LOCAL = threading.local()
+_ORIGINALS = []
+_SLOW = [None]
+
+
+def enable(slow=None):
+    ''' start measuring; calls slower than slow seconds are logged '''
+    _SLOW[0] = slow
+    if _ORIGINALS:
+        return
+    for cls in CLASSES:
+        for name, method in list(vars(cls).items()):
+            if name.startswith('_') or not callable(method):
+                continue
+            _patch(cls, name, _timed('%s.%s' % (cls.__name__, name), method))
+    for module, name in CONVERTERS:
+        _patch(module, name, _phase('convert', getattr(module, name)))
+    _patch(database.Database, 'connect',
+        _phase('setup', database.Database.connect))
+    _patch(database.Database, 'execute',
+        _logged(database.Database.execute))
+    _patch(database.Database, 'iterate',
+        _logged(database.Database.iterate))
+
+
+def disable():
+    ''' stop measuring and restore the original methods; the
+        statistics gathered so far are kept '''
+    while _ORIGINALS:
+        owner, name, original = _ORIGINALS.pop()
+        setattr(owner, name, original)
+
+
+def enabled():
+    ''' return whether measuring is on '''
+    return bool(_ORIGINALS)
+
+
+def reset():
+    ''' forget every statistic '''
+    with _LOCK:
+        _STATS.clear()
+
+
+def stats():
+    ''' return {'Class.method': statistics} for every method called
+        while measuring was on '''
+    with _LOCK:
+        return {name:dict(entry, histogram=dict(entry['histogram']))
+            for name, entry in _STATS.items()}
+
+
+def report():
+    ''' return the statistics as a table, slowest methods first '''
+    lines = ['%-32s %7s %10s %10s %10s %10s %10s %8s' % ('method', 'calls',
+        'total ms', 'mean ms', 'setup ms', 'query ms', 'convert ms', 'rows')]
+    entries = sorted(stats().items(), key=lambda item: -item[1]['seconds'])
+    for name, entry in entries:
+        lines.append('%-32s %7d %10.2f %10.3f %10.2f %10.2f %10.2f %8d' % (
+            name, entry['calls'], entry['seconds']*1000,
+            entry['seconds']*1000/entry['calls'], entry['setup']*1000,
+            entry['query']*1000, entry['convert']*1000, entry['rows']))
+    if not entries:
+        lines.append('no calls recorded' + ('' if enabled() else
+            ' (call instrument.enable() first)'))
+    return '\n'.join(lines)
+
+
+def _patch(owner, name, replacement):
+    ''' replace owner.name, remembering the original for disable() '''
+    _ORIGINALS.append((owner, name, getattr(owner, name)))
+    setattr(owner, name, replacement)
+
+
+class _Call():
+    ''' the measurements of one ORM call in progress on a thread '''
+    __slots__ = ('setup', 'convert', 'statements')
+
+    def __init__(self):
+        self.setup = self.convert = 0.0
+        self.statements = []
+
+
+def _begin():
+    ''' start a call on this thread, unless one is already running;
+        this returns the call, or None for a nested one '''
+    if getattr(_LOCAL, 'call', None) is not None:
+        return None
+    call = _LOCAL.call = _Call()
+    return call
+
+
+def _end(name, call, seconds, result, dbase):
+    ''' record a finished call '''
+    _LOCAL.call = None
+    rows = _count_rows(result)
+    query = max(seconds - call.setup - call.convert, 0.0)
+    with _LOCK:
+        entry = _STATS.get(name)
+        if entry is None:
+            entry = _STATS[name] = {'calls':0, 'seconds':0.0, 'max':0.0,
+                'rows':0, 'setup':0.0, 'query':0.0, 'convert':0.0,
+                'histogram':{bound:0 for bound in BUCKETS}}
+        entry['calls'] += 1
+        entry['seconds'] += seconds
+        entry['max'] = max(entry['max'], seconds)
+        entry['rows'] += rows
+        entry['setup'] += call.setup
+        entry['query'] += query
+        entry['convert'] += call.convert
+        for bound in BUCKETS:
+            if seconds <= bound:
+                entry['histogram'][bound] += 1
+                break
+    slow = _SLOW[0]
+    if slow is not None and seconds >= slow:
+        _log_slow(name, seconds, call.statements, dbase)
+
+
+def _count_rows(result):
+    ''' return the number of rows in a method's result '''
+    if result is None:
+        return 0
+    if isinstance(result, (list, range)):
+        return len(result)
+    if isinstance(result, dict) and 'transactions' in result:
+        return len(result['transactions'])
+    if isinstance(result, tuple):
+        # select_many's (rows, missing)
+        return len(result[0])
+    return 1
+
+
+def _log_slow(name, seconds, statements, dbase):
+    ''' log a slow call with the plans of its statements '''
+    lines = ['%s took %.1f ms' % (name, seconds*1000)]
+    for sql, params in statements:
+        lines.append('  %s  %r' % (' '.join(sql.split()), params))
+        try:
+            plan = dbase.execute('EXPLAIN QUERY PLAN ' + sql, params).fetchall()
+        except database.sqlite3.Error as error:
+            lines.append('    (no plan: %s)' % error)
+            continue
+        lines.extend('    ' + row[3] for row in plan)
+    LOGGER.warning('\n'.join(lines))
+
+
+def _timed(name, method):
+    ''' wrap an ORM method to record its calls under name '''
+    if inspect.isgeneratorfunction(method):
+        @functools.wraps(method)
+        def generator(self, *args, **kwargs):
+            call = _begin()
+            if call is None:
+                yield from method(self, *args, **kwargs)
+                return
+            start = time.perf_counter()
+            count = 0
+            try:
+                for row in method(self, *args, **kwargs):
+                    count += 1
+                    _LOCAL.call = None
+                    yield row
+                    _LOCAL.call = call
+            finally:
+                _end(name, call, time.perf_counter() - start,
+                    range(count), self.db)
+        return generator
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        call = _begin()
+        if call is None:
+            return method(self, *args, **kwargs)
+        start = time.perf_counter()
+        result = None
+        try:
+            result = method(self, *args, **kwargs)
+            return result
+        finally:
+            _end(name, call, time.perf_counter() - start, result, self.db)
+    return wrapper
+
+
+def _phase(phase, func):
+    ''' wrap func so its time counts toward phase of the current call '''
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        call = getattr(_LOCAL, 'call', None)
+        if call is None:
+            return func(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            setattr(call, phase, getattr(call, phase) + time.perf_counter() - start)
+    return wrapper
+
+
+def _logged(run):
+    ''' wrap Database.execute or iterate to remember the statements of
+        the current call '''
+    @functools.wraps(run)
+    def wrapper(self, sql, params=(), *args):
+        call = getattr(_LOCAL, 'call', None)
+        if call is not None:
+            call.statements.append((sql, params))
+        return run(self, sql, params, *args)
+    return wrapper
@@ -0,0 +1,514 @@
+'''
+migrations.py keeps the schema of tracker.db up to date
+
+The schema version of a database file is stored in
+PRAGMA user_version.  MIGRATIONS[n] lists the steps that take a
+database from version n to version n+1; a step is either an SQL
+statement or a function called with a cursor.  migrate() runs every
+step the file has not seen yet inside one transaction, so existing
+tracker.db files are upgraded in place the first time a Transaction
+or Category opens them.
+
+Never edit a migration that has been released; append a new one.
+
+'''
+
+MIGRATIONS = [
+    # 0 -> 1: the original tables
+    ['''CREATE TABLE IF NOT EXISTS transactions
+        (amount int, category text, date int, description text)''',
+     '''CREATE TABLE IF NOT EXISTS categories
+        (name text, desc text)'''],
+    # 1 -> 2: secondary indexes for the summaries.  The covering
+    # (category, date, amount) index also serves plain category lookups.
+    ['''CREATE INDEX IF NOT EXISTS transactions_date
+        ON transactions(date)''',
+     '''CREATE INDEX IF NOT EXISTS transactions_month
+        ON transactions(date / 100 % 100)''',
+     '''CREATE INDEX IF NOT EXISTS transactions_category_date_amount
+        ON transactions(category, date, amount)'''],
+    # 2 -> 3: running totals kept by triggers, filled from existing rows
+    ['''CREATE TABLE IF NOT EXISTS totals_day
+        (date, total, count int, PRIMARY KEY (date))''',
+     '''CREATE TABLE IF NOT EXISTS totals_month
+        (year, month, total, count int, PRIMARY KEY (year, month))''',
+     '''CREATE TABLE IF NOT EXISTS totals_year
+        (year, total, count int, PRIMARY KEY (year))''',
+     '''CREATE TABLE IF NOT EXISTS totals_category
+        (category, total, count int, PRIMARY KEY (category))''',
+     '''CREATE TRIGGER IF NOT EXISTS transactions_rollup_insert
+        AFTER INSERT ON transactions BEGIN
+        INSERT INTO totals_day (date, total, count)
+            SELECT NEW.date, coalesce(NEW.amount, 0), 1
+            WHERE NEW.date IS NOT NULL
+            ON CONFLICT (date) DO UPDATE
+            SET total=total+excluded.total, count=count+1;
+        INSERT INTO totals_month (year, month, total, count)
+            SELECT NEW.date / 10000, NEW.date / 100 % 100, coalesce(NEW.amount, 0), 1
+            WHERE NEW.date / 10000 IS NOT NULL AND NEW.date / 100 % 100 IS NOT NULL
+            ON CONFLICT (year, month) DO UPDATE
+            SET total=total+excluded.total, count=count+1;
+        INSERT INTO totals_year (year, total, count)
+            SELECT NEW.date / 10000, coalesce(NEW.amount, 0), 1
+            WHERE NEW.date / 10000 IS NOT NULL
+            ON CONFLICT (year) DO UPDATE
+            SET total=total+excluded.total, count=count+1;
+        INSERT INTO totals_category (category, total, count)
+            SELECT NEW.category, coalesce(NEW.amount, 0), 1
+            WHERE NEW.category IS NOT NULL
+            ON CONFLICT (category) DO UPDATE
+            SET total=total+excluded.total, count=count+1;
+        END''',
+     '''CREATE TRIGGER IF NOT EXISTS transactions_rollup_delete
+        AFTER DELETE ON transactions BEGIN
+        UPDATE totals_day SET total=total-coalesce(OLD.amount, 0), count=count-1
+            WHERE date=OLD.date;
+        DELETE FROM totals_day WHERE date=OLD.date AND count=0;
+        UPDATE totals_month SET total=total-coalesce(OLD.amount, 0), count=count-1
+            WHERE year=OLD.date / 10000 AND month=OLD.date / 100 % 100;
+        DELETE FROM totals_month
+            WHERE year=OLD.date / 10000 AND month=OLD.date / 100 % 100 AND count=0;
+        UPDATE totals_year SET total=total-coalesce(OLD.amount, 0), count=count-1
+            WHERE year=OLD.date / 10000;
+        DELETE FROM totals_year WHERE year=OLD.date / 10000 AND count=0;
+        UPDATE totals_category SET total=total-coalesce(OLD.amount, 0), count=count-1
+            WHERE category=OLD.category;
+        DELETE FROM totals_category WHERE category=OLD.category AND count=0;
+        END''',
+     '''CREATE TRIGGER IF NOT EXISTS transactions_rollup_update
+        AFTER UPDATE ON transactions BEGIN
+        UPDATE totals_day SET total=total-coalesce(OLD.amount, 0), count=count-1
+            WHERE date=OLD.date;
+        DELETE FROM totals_day WHERE date=OLD.date AND count=0;
+        UPDATE totals_month SET total=total-coalesce(OLD.amount, 0), count=count-1
+            WHERE year=OLD.date / 10000 AND month=OLD.date / 100 % 100;
+        DELETE FROM totals_month
+            WHERE year=OLD.date / 10000 AND month=OLD.date / 100 % 100 AND count=0;
+        UPDATE totals_year SET total=total-coalesce(OLD.amount, 0), count=count-1
+            WHERE year=OLD.date / 10000;
+        DELETE FROM totals_year WHERE year=OLD.date / 10000 AND count=0;
+        UPDATE totals_category SET total=total-coalesce(OLD.amount, 0), count=count-1
+            WHERE category=OLD.category;
+        DELETE FROM totals_category WHERE category=OLD.category AND count=0;
+        INSERT INTO totals_day (date, total, count)
+            SELECT NEW.date, coalesce(NEW.amount, 0), 1
+            WHERE NEW.date IS NOT NULL
+            ON CONFLICT (date) DO UPDATE
+            SET total=total+excluded.total, count=count+1;
+        INSERT INTO totals_month (year, month, total, count)
+            SELECT NEW.date / 10000, NEW.date / 100 % 100, coalesce(NEW.amount, 0), 1
+            WHERE NEW.date / 10000 IS NOT NULL AND NEW.date / 100 % 100 IS NOT NULL
+            ON CONFLICT (year, month) DO UPDATE
+            SET total=total+excluded.total, count=count+1;
+        INSERT INTO totals_year (year, total, count)
+            SELECT NEW.date / 10000, coalesce(NEW.amount, 0), 1
+            WHERE NEW.date / 10000 IS NOT NULL
+            ON CONFLICT (year) DO UPDATE
+            SET total=total+excluded.total, count=count+1;
+        INSERT INTO totals_category (category, total, count)
+            SELECT NEW.category, coalesce(NEW.amount, 0), 1
+            WHERE NEW.category IS NOT NULL
+            ON CONFLICT (category) DO UPDATE
+            SET total=total+excluded.total, count=count+1;
+        END''',
+     '''INSERT INTO totals_day (date, total, count)
+        SELECT date, SUM(coalesce(amount, 0)), COUNT(*) FROM transactions
+        WHERE date IS NOT NULL GROUP BY date''',
+     '''INSERT INTO totals_month (year, month, total, count)
+        SELECT date / 10000, date / 100 % 100, SUM(coalesce(amount, 0)), COUNT(*)
+        FROM transactions WHERE date IS NOT NULL
+        GROUP BY date / 10000, date / 100 % 100''',
+     '''INSERT INTO totals_year (year, total, count)
+        SELECT date / 10000, SUM(coalesce(amount, 0)), COUNT(*) FROM transactions
+        WHERE date IS NOT NULL GROUP BY date / 10000''',
+     '''INSERT INTO totals_category (category, total, count)
+        SELECT category, SUM(coalesce(amount, 0)), COUNT(*) FROM transactions
+        WHERE category IS NOT NULL GROUP BY category'''],
+    # 3 -> 4: rollups count their non-NULL amounts too, so a total over
+    # nothing but NULL amounts is NULL, as SUM(amount) would be
+    ['''DROP TRIGGER transactions_rollup_insert''',
+     '''DROP TRIGGER transactions_rollup_delete''',
+     '''DROP TRIGGER transactions_rollup_update''',
+     '''DROP TABLE totals_day''',
+     '''DROP TABLE totals_month''',
+     '''DROP TABLE totals_year''',
+     '''DROP TABLE totals_category''',
+     '''CREATE TABLE totals_day
+        (date, total, count int, amounts int, PRIMARY KEY (date))''',
+     '''CREATE TABLE totals_month
+        (year, month, total, count int, amounts int, PRIMARY KEY (year, month))''',
+     '''CREATE TABLE totals_year
+        (year, total, count int, amounts int, PRIMARY KEY (year))''',
+     '''CREATE TABLE totals_category
+        (category, total, count int, amounts int, PRIMARY KEY (category))''',
+     '''CREATE TRIGGER transactions_rollup_insert
+        AFTER INSERT ON transactions BEGIN
+        INSERT INTO totals_day (date, total, count, amounts)
+            SELECT NEW.date, coalesce(NEW.amount, 0), 1, NEW.amount IS NOT NULL
+            WHERE NEW.date IS NOT NULL
+            ON CONFLICT (date) DO UPDATE SET total=total+excluded.total,
+            count=count+1, amounts=amounts+excluded.amounts;
+        INSERT INTO totals_month (year, month, total, count, amounts)
+            SELECT NEW.date / 10000, NEW.date / 100 % 100, coalesce(NEW.amount, 0), 1, NEW.amount IS NOT NULL
+            WHERE NEW.date / 10000 IS NOT NULL AND NEW.date / 100 % 100 IS NOT NULL
+            ON CONFLICT (year, month) DO UPDATE SET total=total+excluded.total,
+            count=count+1, amounts=amounts+excluded.amounts;
+        INSERT INTO totals_year (year, total, count, amounts)
+            SELECT NEW.date / 10000, coalesce(NEW.amount, 0), 1, NEW.amount IS NOT NULL
+            WHERE NEW.date / 10000 IS NOT NULL
+            ON CONFLICT (year) DO UPDATE SET total=total+excluded.total,
+            count=count+1, amounts=amounts+excluded.amounts;
+        INSERT INTO totals_category (category, total, count, amounts)
+            SELECT NEW.category, coalesce(NEW.amount, 0), 1, NEW.amount IS NOT NULL
+            WHERE NEW.category IS NOT NULL
+            ON CONFLICT (category) DO UPDATE SET total=total+excluded.total,
+            count=count+1, amounts=amounts+excluded.amounts;
+        END''',
+     '''CREATE TRIGGER transactions_rollup_delete
+        AFTER DELETE ON transactions BEGIN
+        UPDATE totals_day SET total=total-coalesce(OLD.amount, 0), count=count-1,
+            amounts=amounts-(OLD.amount IS NOT NULL)
+            WHERE date=OLD.date;
+        DELETE FROM totals_day WHERE date=OLD.date AND count=0;
+        UPDATE totals_month SET total=total-coalesce(OLD.amount, 0), count=count-1,
+            amounts=amounts-(OLD.amount IS NOT NULL)
+            WHERE year=OLD.date / 10000 AND month=OLD.date / 100 % 100;
+        DELETE FROM totals_month WHERE year=OLD.date / 10000 AND month=OLD.date / 100 % 100 AND count=0;
+        UPDATE totals_year SET total=total-coalesce(OLD.amount, 0), count=count-1,
+            amounts=amounts-(OLD.amount IS NOT NULL)
+            WHERE year=OLD.date / 10000;
+        DELETE FROM totals_year WHERE year=OLD.date / 10000 AND count=0;
+        UPDATE totals_category SET total=total-coalesce(OLD.amount, 0), count=count-1,
+            amounts=amounts-(OLD.amount IS NOT NULL)
+            WHERE category=OLD.category;
+        DELETE FROM totals_category WHERE category=OLD.category AND count=0;
+        END''',
+     '''CREATE TRIGGER transactions_rollup_update
+        AFTER UPDATE ON transactions BEGIN
+        UPDATE totals_day SET total=total-coalesce(OLD.amount, 0), count=count-1,
+            amounts=amounts-(OLD.amount IS NOT NULL)
+            WHERE date=OLD.date;
+        DELETE FROM totals_day WHERE date=OLD.date AND count=0;
+        UPDATE totals_month SET total=total-coalesce(OLD.amount, 0), count=count-1,
+            amounts=amounts-(OLD.amount IS NOT NULL)
+            WHERE year=OLD.date / 10000 AND month=OLD.date / 100 % 100;
+        DELETE FROM totals_month WHERE year=OLD.date / 10000 AND month=OLD.date / 100 % 100 AND count=0;
+        UPDATE totals_year SET total=total-coalesce(OLD.amount, 0), count=count-1,
+            amounts=amounts-(OLD.amount IS NOT NULL)
+            WHERE year=OLD.date / 10000;
+        DELETE FROM totals_year WHERE year=OLD.date / 10000 AND count=0;
+        UPDATE totals_category SET total=total-coalesce(OLD.amount, 0), count=count-1,
+            amounts=amounts-(OLD.amount IS NOT NULL)
+            WHERE category=OLD.category;
+        DELETE FROM totals_category WHERE category=OLD.category AND count=0;
+        INSERT INTO totals_day (date, total, count, amounts)
+            SELECT NEW.date, coalesce(NEW.amount, 0), 1, NEW.amount IS NOT NULL
+            WHERE NEW.date IS NOT NULL
+            ON CONFLICT (date) DO UPDATE SET total=total+excluded.total,
+            count=count+1, amounts=amounts+excluded.amounts;
+        INSERT INTO totals_month (year, month, total, count, amounts)
+            SELECT NEW.date / 10000, NEW.date / 100 % 100, coalesce(NEW.amount, 0), 1, NEW.amount IS NOT NULL
+            WHERE NEW.date / 10000 IS NOT NULL AND NEW.date / 100 % 100 IS NOT NULL
+            ON CONFLICT (year, month) DO UPDATE SET total=total+excluded.total,
+            count=count+1, amounts=amounts+excluded.amounts;
+        INSERT INTO totals_year (year, total, count, amounts)
+            SELECT NEW.date / 10000, coalesce(NEW.amount, 0), 1, NEW.amount IS NOT NULL
+            WHERE NEW.date / 10000 IS NOT NULL
+            ON CONFLICT (year) DO UPDATE SET total=total+excluded.total,
+            count=count+1, amounts=amounts+excluded.amounts;
+        INSERT INTO totals_category (category, total, count, amounts)
+            SELECT NEW.category, coalesce(NEW.amount, 0), 1, NEW.amount IS NOT NULL
+            WHERE NEW.category IS NOT NULL
+            ON CONFLICT (category) DO UPDATE SET total=total+excluded.total,
+            count=count+1, amounts=amounts+excluded.amounts;
+        END''',
+     '''INSERT INTO totals_day (date, total, count, amounts)
+        SELECT date, SUM(coalesce(amount, 0)), COUNT(*), COUNT(amount)
+        FROM transactions WHERE date IS NOT NULL GROUP BY date''',
+     '''INSERT INTO totals_month (year, month, total, count, amounts)
+        SELECT date / 10000, date / 100 % 100, SUM(coalesce(amount, 0)), COUNT(*), COUNT(amount)
+        FROM transactions WHERE date / 10000 IS NOT NULL AND date / 100 % 100 IS NOT NULL GROUP BY date / 10000, date / 100 % 100''',
+     '''INSERT INTO totals_year (year, total, count, amounts)
+        SELECT date / 10000, SUM(coalesce(amount, 0)), COUNT(*), COUNT(amount)
+        FROM transactions WHERE date / 10000 IS NOT NULL GROUP BY date / 10000''',
+     '''INSERT INTO totals_category (category, total, count, amounts)
+        SELECT category, SUM(coalesce(amount, 0)), COUNT(*), COUNT(amount)
+        FROM transactions WHERE category IS NOT NULL GROUP BY category'''],
+    # 4 -> 5: add_many fills the rollups once per batch instead of once
+    # per row; while rollup_state.deferred is set (only ever inside its
+    # write transaction) the insert trigger stands aside
+    ['''CREATE TABLE rollup_state (deferred int NOT NULL)''',
+     '''INSERT INTO rollup_state VALUES (0)''',
+     '''DROP TRIGGER transactions_rollup_insert''',
+     '''CREATE TRIGGER transactions_rollup_insert
+        AFTER INSERT ON transactions
+        WHEN (SELECT deferred FROM rollup_state)=0 BEGIN
+        INSERT INTO totals_day (date, total, count, amounts)
+            SELECT NEW.date, coalesce(NEW.amount, 0), 1, NEW.amount IS NOT NULL
+            WHERE NEW.date IS NOT NULL
+            ON CONFLICT (date) DO UPDATE SET total=total+excluded.total,
+            count=count+1, amounts=amounts+excluded.amounts;
+        INSERT INTO totals_month (year, month, total, count, amounts)
+            SELECT NEW.date / 10000, NEW.date / 100 % 100, coalesce(NEW.amount, 0), 1, NEW.amount IS NOT NULL
+            WHERE NEW.date / 10000 IS NOT NULL AND NEW.date / 100 % 100 IS NOT NULL
+            ON CONFLICT (year, month) DO UPDATE SET total=total+excluded.total,
+            count=count+1, amounts=amounts+excluded.amounts;
+        INSERT INTO totals_year (year, total, count, amounts)
+            SELECT NEW.date / 10000, coalesce(NEW.amount, 0), 1, NEW.amount IS NOT NULL
+            WHERE NEW.date / 10000 IS NOT NULL
+            ON CONFLICT (year) DO UPDATE SET total=total+excluded.total,
+            count=count+1, amounts=amounts+excluded.amounts;
+        INSERT INTO totals_category (category, total, count, amounts)
+            SELECT NEW.category, coalesce(NEW.amount, 0), 1, NEW.amount IS NOT NULL
+            WHERE NEW.category IS NOT NULL
+            ON CONFLICT (category) DO UPDATE SET total=total+excluded.total,
+            count=count+1, amounts=amounts+excluded.amounts;
+        END'''],
+    # 5 -> 6: an index whose entries for one category are in rowid
+    # order, so keyset pages of a category need no sort
+    ['''CREATE INDEX transactions_category
+        ON transactions(category)'''],
+    # 6 -> 7: checkpoints of the file imports, so an interrupted import
+    # can resume (see importer.py)
+    ['''CREATE TABLE imports
+        (source text NOT NULL, rows int NOT NULL, PRIMARY KEY (source))'''],
+    # 7 -> 8: categories are unique by name and transactions refer to
+    # them by integer id (categories.id), so category lookups are integer
+    # index joins.  Duplicate categories keep their first row, and names
+    # only found in transactions become categories.  The old tables are
+    # copied into new ones since SQLite can't add a primary key in place;
+    # rowids are kept.
+    ['''CREATE TABLE categories_new
+        (id INTEGER PRIMARY KEY, name text, desc text)''',
+     '''INSERT INTO categories_new (id, name, desc)
+        SELECT rowid, name, desc FROM categories
+        WHERE name IS NULL OR rowid IN (SELECT MIN(rowid) FROM categories
+            WHERE name IS NOT NULL GROUP BY name)''',
+     '''INSERT INTO categories_new (name, desc)
+        SELECT DISTINCT category, '' FROM transactions
+        WHERE category IS NOT NULL AND category NOT IN
+            (SELECT name FROM categories_new WHERE name IS NOT NULL)''',
+     '''DROP TABLE categories''',
+     '''ALTER TABLE categories_new RENAME TO categories''',
+     '''CREATE UNIQUE INDEX categories_name ON categories(name)''',
+     '''CREATE TABLE transactions_new
+        (amount int, category_id int REFERENCES categories(id), date int,
+        description text)''',
+     '''INSERT INTO transactions_new (rowid, amount, category_id, date, description)
+        SELECT transactions.rowid, amount, categories.id, date, description
+        FROM transactions LEFT JOIN categories ON categories.name=transactions.category''',
+     '''DROP TABLE transactions''',
+     '''ALTER TABLE transactions_new RENAME TO transactions''',
+     '''CREATE INDEX transactions_date
+        ON transactions(date)''',
+     '''CREATE INDEX transactions_month
+        ON transactions(date / 100 % 100)''',
+     '''CREATE INDEX transactions_category
+        ON transactions(category_id)''',
+     '''CREATE INDEX transactions_category_date_amount
+        ON transactions(category_id, date, amount)''',
+     '''DROP TABLE totals_category''',
+     '''CREATE TABLE totals_category
+        (category_id, total, count int, amounts int, PRIMARY KEY (category_id))''',
+     '''INSERT INTO totals_category (category_id, total, count, amounts)
+        SELECT category_id, SUM(coalesce(amount, 0)), COUNT(*), COUNT(amount)
+        FROM transactions WHERE category_id IS NOT NULL GROUP BY category_id''',
+     '''CREATE TRIGGER transactions_rollup_insert
+        AFTER INSERT ON transactions
+        WHEN (SELECT deferred FROM rollup_state)=0 BEGIN
+        INSERT INTO totals_day (date, total, count, amounts)
+            SELECT NEW.date, coalesce(NEW.amount, 0), 1, NEW.amount IS NOT NULL
+            WHERE NEW.date IS NOT NULL
+            ON CONFLICT (date) DO UPDATE SET total=total+excluded.total,
+            count=count+1, amounts=amounts+excluded.amounts;
+        INSERT INTO totals_month (year, month, total, count, amounts)
+            SELECT NEW.date / 10000, NEW.date / 100 % 100, coalesce(NEW.amount, 0), 1, NEW.amount IS NOT NULL
+            WHERE NEW.date / 10000 IS NOT NULL AND NEW.date / 100 % 100 IS NOT NULL
+            ON CONFLICT (year, month) DO UPDATE SET total=total+excluded.total,
+            count=count+1, amounts=amounts+excluded.amounts;
+        INSERT INTO totals_year (year, total, count, amounts)
+            SELECT NEW.date / 10000, coalesce(NEW.amount, 0), 1, NEW.amount IS NOT NULL
+            WHERE NEW.date / 10000 IS NOT NULL
+            ON CONFLICT (year) DO UPDATE SET total=total+excluded.total,
+            count=count+1, amounts=amounts+excluded.amounts;
+        INSERT INTO totals_category (category_id, total, count, amounts)
+            SELECT NEW.category_id, coalesce(NEW.amount, 0), 1, NEW.amount IS NOT NULL
+            WHERE NEW.category_id IS NOT NULL
+            ON CONFLICT (category_id) DO UPDATE SET total=total+excluded.total,
+            count=count+1, amounts=amounts+excluded.amounts;
+        END''',
+     '''CREATE TRIGGER transactions_rollup_delete
+        AFTER DELETE ON transactions BEGIN
+        UPDATE totals_day SET total=total-coalesce(OLD.amount, 0), count=count-1,
+            amounts=amounts-(OLD.amount IS NOT NULL)
+            WHERE date=OLD.date;
+        DELETE FROM totals_day WHERE date=OLD.date AND count=0;
+        UPDATE totals_month SET total=total-coalesce(OLD.amount, 0), count=count-1,
+            amounts=amounts-(OLD.amount IS NOT NULL)
+            WHERE year=OLD.date / 10000 AND month=OLD.date / 100 % 100;
+        DELETE FROM totals_month WHERE year=OLD.date / 10000 AND month=OLD.date / 100 % 100 AND count=0;
+        UPDATE totals_year SET total=total-coalesce(OLD.amount, 0), count=count-1,
+            amounts=amounts-(OLD.amount IS NOT NULL)
+            WHERE year=OLD.date / 10000;
+        DELETE FROM totals_year WHERE year=OLD.date / 10000 AND count=0;
+        UPDATE totals_category SET total=total-coalesce(OLD.amount, 0), count=count-1,
+            amounts=amounts-(OLD.amount IS NOT NULL)
+            WHERE category_id=OLD.category_id;
+        DELETE FROM totals_category WHERE category_id=OLD.category_id AND count=0;
+        END''',
+     '''CREATE TRIGGER transactions_rollup_update
+        AFTER UPDATE ON transactions BEGIN
+        UPDATE totals_day SET total=total-coalesce(OLD.amount, 0), count=count-1,
+            amounts=amounts-(OLD.amount IS NOT NULL)
+            WHERE date=OLD.date;
+        DELETE FROM totals_day WHERE date=OLD.date AND count=0;
+        UPDATE totals_month SET total=total-coalesce(OLD.amount, 0), count=count-1,
+            amounts=amounts-(OLD.amount IS NOT NULL)
+            WHERE year=OLD.date / 10000 AND month=OLD.date / 100 % 100;
+        DELETE FROM totals_month WHERE year=OLD.date / 10000 AND month=OLD.date / 100 % 100 AND count=0;
+        UPDATE totals_year SET total=total-coalesce(OLD.amount, 0), count=count-1,
+            amounts=amounts-(OLD.amount IS NOT NULL)
+            WHERE year=OLD.date / 10000;
+        DELETE FROM totals_year WHERE year=OLD.date / 10000 AND count=0;
+        UPDATE totals_category SET total=total-coalesce(OLD.amount, 0), count=count-1,
+            amounts=amounts-(OLD.amount IS NOT NULL)
+            WHERE category_id=OLD.category_id;
+        DELETE FROM totals_category WHERE category_id=OLD.category_id AND count=0;
+        INSERT INTO totals_day (date, total, count, amounts)
+            SELECT NEW.date, coalesce(NEW.amount, 0), 1, NEW.amount IS NOT NULL
+            WHERE NEW.date IS NOT NULL
+            ON CONFLICT (date) DO UPDATE SET total=total+excluded.total,
+            count=count+1, amounts=amounts+excluded.amounts;
+        INSERT INTO totals_month (year, month, total, count, amounts)
+            SELECT NEW.date / 10000, NEW.date / 100 % 100, coalesce(NEW.amount, 0), 1, NEW.amount IS NOT NULL
+            WHERE NEW.date / 10000 IS NOT NULL AND NEW.date / 100 % 100 IS NOT NULL
+            ON CONFLICT (year, month) DO UPDATE SET total=total+excluded.total,
+            count=count+1, amounts=amounts+excluded.amounts;
+        INSERT INTO totals_year (year, total, count, amounts)
+            SELECT NEW.date / 10000, coalesce(NEW.amount, 0), 1, NEW.amount IS NOT NULL
+            WHERE NEW.date / 10000 IS NOT NULL
+            ON CONFLICT (year) DO UPDATE SET total=total+excluded.total,
+            count=count+1, amounts=amounts+excluded.amounts;
+        INSERT INTO totals_category (category_id, total, count, amounts)
+            SELECT NEW.category_id, coalesce(NEW.amount, 0), 1, NEW.amount IS NOT NULL
+            WHERE NEW.category_id IS NOT NULL
+            ON CONFLICT (category_id) DO UPDATE SET total=total+excluded.total,
+            count=count+1, amounts=amounts+excluded.amounts;
+        END''',
+     '''CREATE TRIGGER categories_in_use
+        BEFORE DELETE ON categories
+        WHEN EXISTS (SELECT 1 FROM transactions WHERE category_id=OLD.id) BEGIN
+        SELECT RAISE(ABORT, 'category is used by transactions');
+        END'''],
+    # 8 -> 9: like the insert trigger, the delete trigger stands aside
+    # while rollup_state.deferred is set, so bulk deletes can subtract
+    # whole groups from the rollups (see rollups.remove_rows)
+    ['''DROP TRIGGER transactions_rollup_delete''',
+     '''CREATE TRIGGER transactions_rollup_delete
+        AFTER DELETE ON transactions
+        WHEN (SELECT deferred FROM rollup_state)=0 BEGIN
+        UPDATE totals_day SET total=total-coalesce(OLD.amount, 0), count=count-1,
+            amounts=amounts-(OLD.amount IS NOT NULL)
+            WHERE date=OLD.date;
+        DELETE FROM totals_day WHERE date=OLD.date AND count=0;
+        UPDATE totals_month SET total=total-coalesce(OLD.amount, 0), count=count-1,
+            amounts=amounts-(OLD.amount IS NOT NULL)
+            WHERE year=OLD.date / 10000 AND month=OLD.date / 100 % 100;
+        DELETE FROM totals_month WHERE year=OLD.date / 10000 AND month=OLD.date / 100 % 100 AND count=0;
+        UPDATE totals_year SET total=total-coalesce(OLD.amount, 0), count=count-1,
+            amounts=amounts-(OLD.amount IS NOT NULL)
+            WHERE year=OLD.date / 10000;
+        DELETE FROM totals_year WHERE year=OLD.date / 10000 AND count=0;
+        UPDATE totals_category SET total=total-coalesce(OLD.amount, 0), count=count-1,
+            amounts=amounts-(OLD.amount IS NOT NULL)
+            WHERE category_id=OLD.category_id;
+        DELETE FROM totals_category WHERE category_id=OLD.category_id AND count=0;
+        END'''],
+    # 9 -> 10: full-text indexes of the transaction descriptions and of
+    # the category names and descriptions.  They are external content
+    # tables, which store only the index and read the text from the
+    # tables themselves, and triggers keep them in sync.  prefix='2 3'
+    # also indexes the 2 and 3 character prefixes, so short prefix
+    # queries don't scan the vocabulary.  Like the rollup triggers, the
+    # transaction insert and delete triggers stand aside while
+    # rollup_state.deferred is set; bulk writes index a whole batch
+    # with one statement, which is several times faster.
+    ['''CREATE VIRTUAL TABLE transactions_fts USING fts5
+        (description, content='transactions', content_rowid='rowid',
+        prefix='2 3')''',
+     '''INSERT INTO transactions_fts (transactions_fts) VALUES ('rebuild')''',
+     '''CREATE TRIGGER transactions_fts_insert
+        AFTER INSERT ON transactions
+        WHEN (SELECT deferred FROM rollup_state)=0 BEGIN
+        INSERT INTO transactions_fts (rowid, description)
+            VALUES (NEW.rowid, NEW.description);
+        END''',
+     '''CREATE TRIGGER transactions_fts_delete
+        AFTER DELETE ON transactions
+        WHEN (SELECT deferred FROM rollup_state)=0 BEGIN
+        INSERT INTO transactions_fts (transactions_fts, rowid, description)
+            VALUES ('delete', OLD.rowid, OLD.description);
+        END''',
+     '''CREATE TRIGGER transactions_fts_update
+        AFTER UPDATE OF description ON transactions BEGIN
+        INSERT INTO transactions_fts (transactions_fts, rowid, description)
+            VALUES ('delete', OLD.rowid, OLD.description);
+        INSERT INTO transactions_fts (rowid, description)
+            VALUES (NEW.rowid, NEW.description);
+        END''',
+     '''CREATE VIRTUAL TABLE categories_fts USING fts5
+        (name, desc, content='categories', content_rowid='id',
+        prefix='2 3')''',
+     '''INSERT INTO categories_fts (categories_fts) VALUES ('rebuild')''',
+     '''CREATE TRIGGER categories_fts_insert
+        AFTER INSERT ON categories BEGIN
+        INSERT INTO categories_fts (rowid, name, desc)
+            VALUES (NEW.id, NEW.name, NEW.desc);
+        END''',
+     '''CREATE TRIGGER categories_fts_delete
+        AFTER DELETE ON categories BEGIN
+        INSERT INTO categories_fts (categories_fts, rowid, name, desc)
+            VALUES ('delete', OLD.id, OLD.name, OLD.desc);
+        END''',
+     '''CREATE TRIGGER categories_fts_update
+        AFTER UPDATE ON categories BEGIN
+        INSERT INTO categories_fts (categories_fts, rowid, name, desc)
+            VALUES ('delete', OLD.id, OLD.name, OLD.desc);
+        INSERT INTO categories_fts (rowid, name, desc)
+            VALUES (NEW.id, NEW.name, NEW.desc);
+        END'''],
+    # 10 -> 11: the date index covers the category and amount, so a
+    # date range is summed and grouped from the index alone; the date
+    # range chunks of parallel.py would otherwise look up every row
+    ['''DROP INDEX transactions_date''',
+     '''CREATE INDEX transactions_date
+        ON transactions(date, category_id, amount)'''],
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(dbase):
+    ''' return the schema version stored in the database '''
+    return dbase.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(dbase):
+    ''' upgrade dbase to SCHEMA_VERSION, returning the version it had '''
+    if schema_version(dbase) == SCHEMA_VERSION:
+        return SCHEMA_VERSION
+    with dbase.transaction() as cur:
+        # read it again now that we hold the write lock, in case
+        # another process migrated the file in the meantime
+        version = cur.execute('PRAGMA user_version').fetchone()[0]
+        if version > SCHEMA_VERSION:
+            raise RuntimeError('%s has schema version %d, newer than %d'
+                % (dbase.dbfile, version, SCHEMA_VERSION))
+        for steps in MIGRATIONS[version:]:
+            for step in steps:
+                if callable(step):
+                    step(cur)
+                else:
+                    cur.execute(step)
+        cur.execute('PRAGMA user_version=%d' % SCHEMA_VERSION)
+    return version
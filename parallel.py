@@ -0,0 +1,241 @@
+'''
+parallel.py runs the summary and total methods on a process pool
+
+ParallelTransaction wraps an open Transaction or PartitionedTransaction
+and answers its aggregate calls (group_sums, group_by, total and the
+*_total methods) by splitting the work into chunks,
+running each chunk in a worker process on a read-only connection of
+its own, and merging the partial results:
+
+    with Transaction('tracker.db') as tran, \
+            ParallelTransaction(tran, workers=4) as par:
+        par.group_by(('month', 'category'))     # 4 processes
+        par.total(category='food', year=2022)
+
+A Transaction is split into date ranges holding about the same number
+of transactions each, found from the totals_day rollup, plus one
+chunk for the undated transactions when no date filter rules them
+out.  A PartitionedTransaction is split into its partitions, after
+pruning them by date as usual.  Sums are added up with merge_sums, so
+the results are the same as the serial methods'.
+
+summarize runs serially unless rows=True is given: it returns every
+matching row, and pickling them back from the workers costs more
+than the query (0.34s against 0.11s serially at 1M transactions).
+With rows=True the chunks' rows are merged back into item_num order.
+
+Only calls that would scan the transactions table go to the pool.
+When a rollup table can answer a call (see group_source) it takes
+microseconds, less than sending it to another process, so it runs
+serially; so does a call over fewer than min_rows transactions, and
+every call when there are fewer than 2 workers.  The chunks are read
+at slightly different moments, so a call racing with writes may see
+some of them and not others.
+
+The workers are started with the spawn method on the first parallel
+call and kept until close(): a forked worker would inherit the open
+SQLite connections of its parent, which SQLite doesn't allow it to
+use.  In-memory databases can't be shared between processes, so
+calls on them always run serially.
+
+'''
+
+import heapq
+import multiprocessing
+import os
+import urllib.parse
+from concurrent.futures import ProcessPoolExecutor
+
+from partitions import PartitionedTransaction, globalize, scope
+from transactions import (Transaction, TransactionRow, group_results,
+    group_source, merge_sums, summary, where_clause)
+
+# calls over fewer transactions than this run serially
+MIN_ROWS = 50000
+
+# the date filters, which decide the chunks
+DATE_FILTERS = ('bgn', 'end', 'year', 'month')
+
+# the read-only Transactions a worker process has opened, by URI
+_OPEN = {}
+
+
+def read_only(dbfile, immutable=False):
+    ''' return the URI opening the database file dbfile read-only, or
+        None if it is in memory '''
+    if 'mode=memory' in dbfile or dbfile == ':memory:':
+        return None
+    if dbfile.startswith('file:'):
+        return dbfile
+    uri = 'file:%s?mode=ro' % urllib.parse.quote(os.path.abspath(dbfile))
+    return uri + '&immutable=1' if immutable else uri
+
+
+def split_days(days, chunks):
+    ''' split the (date, count) rows of totals_day, in date order, into
+        at most chunks (first, last) date ranges of about the same
+        total count '''
+    total = sum(count for _, count in days)
+    ranges = []
+    first = None
+    seen = 0
+    for date, count in days:
+        if first is None:
+            first = date
+        seen += count
+        if seen * chunks >= total * (len(ranges) + 1):
+            ranges.append((first, date))
+            first = None
+    if first is not None:
+        ranges.append((first, days[-1][0]))
+    return ranges
+
+
+def _transaction(uri):
+    ''' return this worker's Transaction on uri, opening it if needed '''
+    tran = _OPEN.get(uri)
+    if tran is None:
+        tran = _OPEN[uri] = Transaction(uri)
+    return tran
+
+
+def _group_sums(uri, dims, filters):
+    ''' run group_sums over one chunk, in a worker '''
+    return _transaction(uri).group_sums(dims, **filters)
+
+
+def _rows(uri, filters):
+    ''' return the rows summarize reads from one chunk, in a worker, as
+        plain tuples since TransactionRows can't be pickled '''
+    return [tuple(row) for row in _transaction(uri).summarize(**filters)['transactions']]
+
+
+class ParallelTransaction():
+    ''' ParallelTransaction runs the aggregates of a Transaction or a
+        PartitionedTransaction on worker processes '''
+
+    def __init__(self, tran, workers=None, chunks=None, min_rows=MIN_ROWS,
+            rows=False):
+        self.tran = tran
+        # whether summarize goes to the pool too
+        self.rows = rows
+        self.workers = workers or os.cpu_count() or 1
+        # more chunks than workers even out chunks that run slower
+        self.chunks = chunks or 4 * self.workers
+        self.min_rows = min_rows
+        self._pool = None
+
+    def close(self):
+        ''' stop the worker processes; the wrapped object stays open '''
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def plan(self, **filters):
+        ''' return the chunks a call with the where_clause filters is
+            split into, as (uri, filters, year) where year is the
+            partition's or None, or None to run the call serially '''
+        if self.workers < 2:
+            return None
+        if isinstance(self.tran, PartitionedTransaction):
+            return self._plan_partitions(filters)
+        return self._plan_dates(filters)
+
+    def _plan_dates(self, filters):
+        ''' split a Transaction into date ranges '''
+        uri = read_only(self.tran.db.dbfile)
+        if uri is None:
+            return None
+        dates = {name:filters.get(name) for name in DATE_FILTERS}
+        sql, params = where_clause(**dates)
+        days = self.tran.db.execute('SELECT date, count FROM totals_day'
+            + sql + ' ORDER BY date', params).fetchall()
+        if sum(count for _, count in days) < self.min_rows:
+            return None
+        chunks = [(uri, dict(filters, bgn=first, end=last), None)
+            for first, last in split_days(days, self.chunks)]
+        if not any(value is not None for value in dates.values()):
+            chunks.append((uri, dict(filters, undated=True), None))
+        return chunks
+
+    def _plan_partitions(self, filters):
+        ''' split a PartitionedTransaction into its partitions '''
+        parts = self.tran
+        frozen = parts.partitions()
+        scoped = list(scope(frozen, filters))
+        if len(scoped) < 2:
+            return None
+        return [(read_only(parts.path(year, frozen[year]), frozen[year]), local, year)
+            for year, local in scoped]
+
+    def _map(self, func, tasks):
+        ''' run func on every tuple of arguments in tasks in the pool and
+            return the results in order '''
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(self.workers,
+                mp_context=multiprocessing.get_context('spawn'))
+        futures = [self._pool.submit(func, *task) for task in tasks]
+        return [future.result() for future in futures]
+
+    def group_sums(self, by=(), **filters):
+        '''returns {key: (total, count, amounts)} like
+        Transaction.group_sums, added up over the chunks'''
+        dims = (by,) if isinstance(by, str) else tuple(by)
+        chunks = None
+        if group_source(dims, filters)[0] == 'transactions':
+            chunks = self.plan(**filters)
+        if chunks is None:
+            return self.tran.group_sums(dims, **filters)
+        merged = merge_sums(self._map(_group_sums,
+            [(uri, dims, chunk) for uri, chunk, _ in chunks]))
+        return dict(sorted(merged.items()))
+
+    def group_by(self, by=(), **filters):
+        '''returns {key: {'total', 'count', 'avg'}} like
+        Transaction.group_by'''
+        return group_results(self.group_sums(by, **filters))
+
+    def total(self, **filters):
+        '''returns the total amount of the transactions matching the
+        where_clause filters, or None if none of them has an amount'''
+        return self.group_by(**filters).get((), {}).get('total')
+
+    def date_total(self, bgn, end):
+        '''calculates total spent between provided dates (inclusive)'''
+        return self.total(bgn=bgn, end=end)
+
+    def month_total(self, month):
+        '''calculates total from provided month, across all years'''
+        return self.total(month=month)
+
+    def year_month_total(self, year, month):
+        '''calculates total from provided month of provided year'''
+        return self.total(year=year, month=month)
+
+    def year_total(self, year):
+        '''calculates total from provided year'''
+        return self.total(year=year)
+
+    def cat_total(self, cat):
+        '''calculates total from provided category'''
+        return self.total(category=cat)
+
+    def summarize(self, **filters):
+        '''returns the transactions matching the where_clause filters
+        with their count and total, min, max and average amount, like
+        Transaction.summarize; serially unless rows was set'''
+        chunks = self.plan(**filters) if self.rows else None
+        if chunks is None:
+            return self.tran.summarize(**filters)
+        results = self._map(_rows, [(uri, chunk) for uri, chunk, _ in chunks])
+        parts = []
+        for (_, _, year), rows in zip(chunks, results):
+            rows = [TransactionRow._make(row) for row in rows]
+            parts.append(rows if year is None else globalize(year, rows))
+        return summary(list(heapq.merge(*parts, key=lambda row: row[0])))
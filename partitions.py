@@ -0,0 +1,530 @@
+'''
+partitions.py stores the transactions in one SQLite file per year
+
+PartitionedTransaction answers the same calls as Transaction, but
+keeps the transactions of each year in a tracker database of their
+own next to the base file, and those without a date in one more:
+
+    tracker.db            the categories
+    tracker-2021.db       the transactions dated 2021
+    tracker-2022.db       the transactions dated 2022
+    tracker-undated.db    the transactions with a NULL date
+
+    with PartitionedTransaction('tracker.db') as tran:
+        tran.add({'amount':10, 'category':'food', 'date':20220105,
+            'description':'groceries'})
+        tran.print_sum_year(2022)   # opens tracker-2022.db only
+
+A partition is opened the first time a call needs it.  Calls with
+date filters (bgn, end, year, or a method such as print_sum_date or
+year_total) only open the partitions of the years they cover, so
+reports on the current year never read the older files, and every
+file can be vacuumed and backed up on its own.  Results from several
+partitions are merged: rows come in item_num order, and group_by,
+the totals and summarize add up the per-partition sums.  search
+ranks the matches within each year and lists the newest years first.
+
+An item_num is year * SPAN + the rowid within the year's file, so it
+still identifies one transaction and sorts by year, then insertion.
+
+freeze(year) compacts a finished year, makes its file read-only and
+renames it to tracker-2021.frozen.db.  A frozen partition is opened
+with SQLite's immutable flag, which skips all locking and change
+detection, and gets a large query cache that is never invalidated.
+Writing to it raises FrozenPartitionError until thaw(year) makes it
+writable again; so does opening it with code whose schema is newer.
+
+Each partition keeps its own categories table, filled in as
+transactions are added; the base file's categories table lists every
+category name used, for Category.  Writes spanning several years
+are committed per partition, not atomically.  From the shell:
+
+    python partitions.py split tracker.db parts/tracker.db
+    python partitions.py freeze parts/tracker.db 2021
+    python partitions.py thaw parts/tracker.db 2021
+    python partitions.py list parts/tracker.db
+
+'''
+
+import os
+import re
+import stat
+import sys
+import urllib.parse
+from itertools import islice
+
+from category import Category
+from database import open_database, release_database
+from migrations import SCHEMA_VERSION, migrate, schema_version
+from transactions import (ADD_CATEGORY, Transaction, TransactionRow,
+    group_results, merge_sums, summary, year_range)
+
+# item_num = year * SPAN + rowid in the year's partition
+SPAN = 10**10
+# the partition of transactions with a NULL date
+UNDATED = 0
+# the query cache size of a frozen partition
+FROZEN_CACHE_SIZE = 1024
+
+
+class FrozenPartitionError(RuntimeError):
+    ''' raised when writing to, or migrating, a frozen partition '''
+
+
+def year_of(date):
+    ''' return the partition year of a yyyymmdd date, or UNDATED '''
+    if date is None:
+        return UNDATED
+    return int(date) // 10000
+
+
+def prune(years, bgn=None, end=None, year=None, undated=None, **filters):
+    ''' return the years, in order, that can hold transactions matching
+        the where_clause filters; only the date filters rule any out '''
+    if undated:
+        return [UNDATED] if UNDATED in years else []
+    low = high = None
+    if bgn is not None:
+        low = year_of(bgn)
+    if end is not None:
+        high = year_of(end)
+    if year is not None:
+        low = int(year) if low is None else max(low, int(year))
+        high = int(year) if high is None else min(high, int(year))
+    if low is None and high is None:
+        return sorted(years)
+    return sorted(y for y in years if y != UNDATED
+        and (low is None or y >= low) and (high is None or y <= high))
+
+
+def scope(years, filters):
+    ''' yield (year, filters) for the years that can hold transactions
+        matching the where_clause filters, in order, with after_rowid,
+        an item_num, turned into a rowid of each year's partition '''
+    after = filters.get('after_rowid')
+    start = divmod(int(after), SPAN) if after is not None else None
+    for year in prune(years, **filters):
+        if start is None:
+            yield (year, filters)
+        elif year == start[0]:
+            yield (year, dict(filters, after_rowid=start[1]))
+        elif year > start[0]:
+            yield (year, dict(filters, after_rowid=None))
+
+
+def globalize(year, rows):
+    ''' return the TransactionRows of a year's partition with their
+        item_nums made global '''
+    if year == UNDATED:
+        return rows
+    offset = year * SPAN
+    make = TransactionRow._make
+    return [make((offset + row[0],) + row[1:]) for row in rows]
+
+
+class PartitionedTransaction():
+    ''' PartitionedTransaction is a Transaction over per-year files '''
+
+    def __init__(self, dbfile, cache_size=0, concurrent=False):
+        self.db = open_database(dbfile)
+        self._released = False
+        self.cache_size = cache_size
+        self.concurrent = concurrent
+        # year -> open Transaction
+        self._open = {}
+        try:
+            if concurrent:
+                self.db.use_wal()
+            migrate(self.db)
+        except BaseException:
+            self.close()
+            raise
+        self.dbase = dbfile
+        self.refresh()
+
+    def close(self):
+        ''' close every open partition and release the base file '''
+        for part in self._open.values():
+            part.close()
+        self._open = {}
+        if not self._released:
+            self._released = True
+            release_database(self.db)
+
+    def cache_info(self):
+        ''' returns the cache statistics added up over the open
+            partitions, or None if none of them has a cache '''
+        infos = [info for info in (part.cache_info() for part in self._open.values())
+            if info is not None]
+        if not infos:
+            return None
+        return {name:sum(info[name] for info in infos) for name in infos[0]}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    #partition management
+    def path(self, year, frozen=False):
+        ''' return the file name of a year's partition '''
+        base, _ = os.path.splitext(os.fspath(self.dbase))
+        name = 'undated' if year == UNDATED else '%d' % year
+        return '%s-%s%s.db' % (base, name, '.frozen' if frozen else '')
+
+    def refresh(self):
+        ''' find the partition files, including ones that another
+            process has created, frozen or thawed since the last look '''
+        base, _ = os.path.splitext(os.path.abspath(os.fspath(self.dbase)))
+        pattern = re.compile(r'%s-(\d+|undated)(\.frozen)?\.db$'
+            % re.escape(os.path.basename(base)))
+        self._years = {}
+        for name in os.listdir(os.path.dirname(base)):
+            match = pattern.match(name)
+            if match:
+                year = UNDATED if match.group(1) == 'undated' else int(match.group(1))
+                self._years[year] = bool(match.group(2))
+        for year in list(self._open):
+            if self._years.get(year) != self._open[year].frozen:
+                self._open.pop(year).close()
+
+    def partitions(self):
+        ''' return {year: frozen} for every partition; year 0 holds
+            the transactions with a NULL date '''
+        return dict(sorted(self._years.items()))
+
+    def partition(self, year, create=False):
+        ''' return the Transaction of a year's partition, opening it if
+            needed, or None if it doesn't exist and create is False '''
+        part = self._open.get(year)
+        if part is not None:
+            return part
+        frozen = self._years.get(year)
+        if frozen is None and not create:
+            return None
+        if frozen:
+            uri = 'file:%s?mode=ro&immutable=1' % urllib.parse.quote(
+                os.path.abspath(self.path(year, frozen=True)))
+            dbase = open_database(uri)
+            try:
+                if schema_version(dbase) != SCHEMA_VERSION:
+                    raise FrozenPartitionError('partition %d is frozen at schema '
+                        'version %d; thaw it to upgrade it' % (year, schema_version(dbase)))
+            finally:
+                release_database(dbase)
+            part = Transaction(uri, cache_size=FROZEN_CACHE_SIZE)
+        else:
+            part = Transaction(self.path(year), cache_size=self.cache_size,
+                concurrent=self.concurrent)
+            self._years[year] = False
+        part.frozen = bool(frozen)
+        self._open[year] = part
+        return part
+
+    def _writable(self, year):
+        ''' return the partition for writing the transactions of year '''
+        if self._years.get(year):
+            raise FrozenPartitionError('partition %d is frozen; thaw it first' % year)
+        return self.partition(year, create=True)
+
+    def _parts(self, **filters):
+        ''' yield (year, Transaction) for the partitions the where_clause
+            filters can match, in year order '''
+        for year in prune(self._years, **filters):
+            yield (year, self.partition(year))
+
+    def _scoped(self, filters):
+        ''' yield (year, Transaction, filters) like _parts, with the
+            filters of each partition (see scope) '''
+        for year, local in scope(self._years, filters):
+            yield (year, self.partition(year), local)
+
+    def freeze(self, year):
+        ''' compact a year's partition and make it read-only and
+            immutable; freezing a frozen partition does nothing '''
+        if self._years.get(year) is not False:
+            if year not in self._years:
+                raise ValueError('there is no partition %d' % year)
+            return
+        part = self.partition(year)
+        # one file with no journal or WAL, as compact as it gets
+        part.db.execute('PRAGMA journal_mode=DELETE')
+        part.db.execute('PRAGMA optimize')
+        part.db.execute('VACUUM')
+        self._open.pop(year).close()
+        path = self.path(year)
+        os.chmod(path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+        os.rename(path, self.path(year, frozen=True))
+        self._years[year] = True
+
+    def thaw(self, year):
+        ''' make a frozen partition writable again '''
+        if not self._years.get(year):
+            return
+        part = self._open.pop(year, None)
+        if part is not None:
+            part.close()
+        path = self.path(year, frozen=True)
+        os.chmod(path, stat.S_IRUSR | stat.S_IWUSR | stat.S_IRGRP | stat.S_IROTH)
+        os.rename(path, self.path(year))
+        self._years[year] = False
+
+    #item_nums
+    def _add_categories(self, names):
+        ''' add category names to the base file '''
+        with self.db.transaction() as cur:
+            cur.executemany(ADD_CATEGORY, [(name,) for name in dict.fromkeys(names)])
+
+    #the Transaction calls
+    def select_one(self, rowid):
+        ''' return a transaction with a specified item_num '''
+        year, local = divmod(int(rowid), SPAN)
+        part = self.partition(year)
+        if part is None:
+            raise IndexError('no transaction %d' % rowid)
+        return globalize(year, [part.select_one(local)])[0]
+
+    def select_many(self, rowids):
+        ''' return (rows, missing) like Transaction.select_many, with one
+            query per partition '''
+        rowids = [int(rowid) for rowid in rowids]
+        found = {}
+        wanted = {}
+        for rowid in rowids:
+            year, local = divmod(rowid, SPAN)
+            wanted.setdefault(year, []).append(local)
+        for year, locals_ in wanted.items():
+            part = self.partition(year)
+            if part is not None:
+                rows, _ = part.select_many(locals_)
+                found.update((row[0], row) for row in globalize(year, rows))
+        return ([found[rowid] for rowid in rowids if rowid in found],
+            [rowid for rowid in rowids if rowid not in found])
+
+    def show_transactions(self):
+        '''shows all transactions'''
+        rows = []
+        for year, part in self._parts():
+            rows.extend(globalize(year, part.show_transactions()))
+        return rows
+
+    def iter_transactions(self, limit=None, chunk_size=500, after_rowid=None,
+            **filters):
+        '''yields the transactions matching the where_clause filters in
+        item_num order, like Transaction.iter_transactions'''
+        if limit is not None and limit <= 0:
+            return
+        filters['after_rowid'] = after_rowid
+        for year, part, local in self._scoped(filters):
+            for row in part.iter_transactions(limit, chunk_size, **local):
+                yield TransactionRow._make((year * SPAN + row[0],) + row[1:])
+                if limit is not None:
+                    limit -= 1
+                    if not limit:
+                        return
+
+    def add(self, transaction):
+        '''adds a new transaction to the partition of its year
+        this returns the item_num of the inserted element'''
+        year = year_of(transaction['date'])
+        rowid = self._writable(year).add(transaction)
+        self._add_categories([transaction['category']])
+        return year * SPAN + rowid
+
+    def add_many(self, transactions, batch_size=1000):
+        '''adds an iterable of transactions, batch_size at a time, with
+        one database transaction per partition and batch.
+        this returns the list of item_nums of the inserted elements'''
+        items = iter(transactions)
+        rowids = []
+        while True:
+            batch = list(islice(items, batch_size))
+            if not batch:
+                return rowids
+            years = {}
+            for index, tran in enumerate(batch):
+                years.setdefault(year_of(tran['date']), []).append(index)
+            result = [None] * len(batch)
+            for year, indexes in years.items():
+                part = self._writable(year)
+                added = part.add_many([batch[index] for index in indexes], batch_size)
+                for index, rowid in zip(indexes, added):
+                    result[index] = year * SPAN + rowid
+            self._add_categories(tran['category'] for tran in batch)
+            rowids.extend(result)
+
+    def delete(self, itemnum):
+        '''deletes a transaction'''
+        year, local = divmod(int(itemnum), SPAN)
+        if year in self._years:
+            self._writable(year).delete(local)
+        return []
+
+    def delete_many(self, rowids):
+        '''deletes the transactions with the item_nums in rowids, in one
+        database transaction per partition.
+        this returns the number of transactions deleted'''
+        wanted = {}
+        for rowid in rowids:
+            year, local = divmod(int(rowid), SPAN)
+            wanted.setdefault(year, []).append(local)
+        return sum(self._writable(year).delete_many(locals_)
+            for year, locals_ in wanted.items() if year in self._years)
+
+    def delete_where(self, **filters):
+        '''deletes the transactions matching the where_clause filters, in
+        one database transaction per partition.
+        this returns the number of transactions deleted'''
+        if not any(value is not None for value in filters.values()):
+            raise ValueError('delete_where needs at least one filter')
+        return sum(self._writable(year).delete_where(**local)
+            for year, local in scope(self._years, filters))
+
+    def summarize(self, **filters):
+        '''returns the transactions matching the where_clause filters
+        with their count and total, min, max and average amount'''
+        rows = []
+        for year, part, local in self._scoped(filters):
+            rows.extend(globalize(year, part.summarize(**local)['transactions']))
+        return summary(rows)
+
+    def print_sum_date(self, bgn, end):
+        '''shows transactions between provided dates (inclusive)'''
+        rows = []
+        for year, part in self._parts(bgn=bgn, end=end):
+            rows.extend(globalize(year, part.print_sum_date(bgn, end)))
+        return rows
+
+    def date_total(self, bgn, end):
+        '''calculates total spent between provided dates (inclusive)'''
+        return self.total(bgn=bgn, end=end)
+
+    def print_sum_month(self, month):
+        '''shows transactions from provided month, across all years'''
+        rows = []
+        for year, part in self._parts():
+            rows.extend(globalize(year, part.print_sum_month(month)))
+        return rows
+
+    def month_total(self, month):
+        '''calculates total from provided month, across all years'''
+        return self.total(month=month)
+
+    def print_sum_year_month(self, year, month):
+        '''shows transactions from provided month of provided year'''
+        part = self.partition(int(year))
+        if part is None:
+            return []
+        return globalize(int(year), part.print_sum_year_month(year, month))
+
+    def year_month_total(self, year, month):
+        '''calculates total from provided month of provided year'''
+        return self.total(year=year, month=month)
+
+    def print_sum_year(self, year):
+        '''shows transactions from provided year'''
+        return self.print_sum_date(*year_range(year))
+
+    def year_total(self, year):
+        '''calculates total from provided year'''
+        return self.total(year=year)
+
+    def print_sum_cat(self, cat):
+        '''shows transactions from provided category'''
+        rows = []
+        for year, part in self._parts():
+            rows.extend(globalize(year, part.print_sum_cat(cat)))
+        return rows
+
+    def cat_total(self, cat):
+        '''calculates total from provided category'''
+        return self.total(category=cat)
+
+    def group_by(self, by=(), **filters):
+        '''returns {key: {'total', 'count', 'avg'}} like
+        Transaction.group_by, added up over the partitions'''
+        return group_results(self.group_sums(by, **filters))
+
+    def group_sums(self, by=(), **filters):
+        '''returns {key: (total, count, amounts)} like
+        Transaction.group_sums, added up over the partitions'''
+        merged = merge_sums(part.group_sums(by, **local)
+            for _, part, local in self._scoped(filters))
+        return dict(sorted(merged.items()))
+
+    def total(self, **filters):
+        '''returns the total amount of the transactions matching the
+        where_clause filters, or None if none of them has an amount'''
+        return self.group_by(**filters).get((), {}).get('total')
+
+    def search(self, query, limit=20, rank=True, **filters):
+        '''returns up to limit transactions whose description matches
+        the full-text query, like Transaction.search.  ranked results
+        are ranked within each year, newest years first'''
+        parts = list(self._scoped(filters))
+        if rank:
+            parts.reverse()
+        rows = []
+        for year, part, local in parts:
+            if len(rows) >= limit:
+                break
+            rows.extend(globalize(year,
+                part.search(query, limit - len(rows), rank, **local)))
+        return rows
+
+    def rebuild_rollups(self):
+        '''recomputes the running totals of every live partition'''
+        for year, part in self._parts():
+            if not part.frozen:
+                part.rebuild_rollups()
+
+    def verify_rollups(self):
+        '''returns the (table, row) pairs where the running totals
+        disagree with the transactions; table is prefixed with the
+        partition's year, as in 2021/totals_day'''
+        return [('%d/%s' % (year, table), row) for year, part in self._parts()
+            for table, row in part.verify_rollups()]
+
+
+def split(source, base, batch_size=10000):
+    ''' copy the transactions and categories of the tracker database
+        source into a partitioned layout at base; this returns the
+        number of transactions copied '''
+    count = 0
+    with Transaction(source) as tran, PartitionedTransaction(base) as parts:
+        rows = tran.iter_transactions(chunk_size=batch_size)
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            parts.add_many(batch, batch_size)
+            count += len(batch)
+    with Category(source) as cats, Category(base) as copy:
+        copy.add_many(cats.select_all())
+    return count
+
+
+def main(argv):
+    ''' split, freeze, thaw or list partitions from the shell '''
+    usage = ('usage: python partitions.py split SOURCE BASE | freeze BASE YEAR'
+        ' | thaw BASE YEAR | list BASE')
+    command = argv[1] if len(argv) > 1 else None
+    if command == 'split' and len(argv) == 4:
+        print('%d transactions copied' % split(argv[2], argv[3]))
+        return 0
+    if command in ('freeze', 'thaw') and len(argv) == 4:
+        with PartitionedTransaction(argv[2]) as parts:
+            getattr(parts, command)(int(argv[3]))
+        return 0
+    if command == 'list' and len(argv) == 3:
+        with PartitionedTransaction(argv[2]) as parts:
+            for year, frozen in parts.partitions().items():
+                print(parts.path(year, frozen), 'frozen' if frozen else 'live')
+        return 0
+    print(usage)
+    return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,130 @@
+'''
+rollups.py checks and repairs the running totals of the transactions table
+
+Each rollup table holds, for one value of its key, the total amount,
+the number of transactions and the number of those with a non-NULL
+amount:
+
+    totals_day       (date)         per yyyymmdd date
+    totals_month     (year, month)  per month of each year
+    totals_year      (year)         per year
+    totals_category  (category_id)  per category
+
+Triggers on the transactions table (created by migrations.py) keep
+them current on every insert, update and delete, so the *_total
+methods of Transaction read one rollup row (or a short range of
+them) instead of summing the whole table.  Bulk inserts turn the
+insert trigger off inside their own transaction and call add_rows()
+once for the whole batch instead, and bulk deletes likewise turn the
+delete trigger off and call remove_rows().  Rows whose key is NULL are
+left out, and a rollup row is removed when its count drops to 0.
+Like SUM(amount), a total should read as NULL when none of its
+amounts are set:  CASE WHEN amounts>0 THEN total END.
+
+rebuild() recomputes the rollups from the transactions table and
+verify() reports where they disagree with it.  From the shell:
+
+    python rollups.py verify tracker.db
+    python rollups.py rebuild tracker.db
+
+'''
+
+import sys
+
+# (table, key columns, key expressions over the transactions table);
+# this must describe the tables the latest migration creates
+ROLLUPS = (
+    ('totals_day', ('date',), ('date',)),
+    ('totals_month', ('year', 'month'), ('date / 10000', 'date / 100 % 100')),
+    ('totals_year', ('year',), ('date / 10000',)),
+    ('totals_category', ('category_id',), ('category_id',)),
+)
+
+
+def _expected(exprs):
+    ''' return a query computing a rollup from the transactions table '''
+    keys = ', '.join(exprs)
+    not_null = ' AND '.join('%s IS NOT NULL' % expr for expr in exprs)
+    return '''SELECT %s, SUM(coalesce(amount, 0)), COUNT(*), COUNT(amount)
+        FROM transactions WHERE %s GROUP BY %s''' % (keys, not_null, keys)
+
+
+def rebuild(cur, rollups=ROLLUPS):
+    ''' recompute every rollup table from the transactions table '''
+    for table, cols, exprs in rollups:
+        cur.execute('DELETE FROM %s' % table)
+        cur.execute('INSERT INTO %s (%s, total, count, amounts) %s' % (
+            table, ', '.join(cols), _expected(exprs)))
+
+
+def add_rows(cur, first, last):
+    ''' add the transactions with rowids first to last to the rollups
+        in one statement per rollup; used by bulk inserts, which set
+        rollup_state.deferred so the insert trigger skips those rows
+    '''
+    _merge(cur, ' WHERE rowid BETWEEN (?) AND (?)', (first, last), '')
+
+
+def remove_rows(cur, where, params):
+    ''' subtract the transactions matching where (a WHERE clause, or ''
+        for all of them) from the rollups, one statement per rollup;
+        used by bulk deletes, which set rollup_state.deferred so the
+        delete trigger skips those rows, before they delete them
+    '''
+    _merge(cur, where, params, '-')
+    for table, _, _ in ROLLUPS:
+        cur.execute('DELETE FROM %s WHERE count=0' % table)
+
+
+def _merge(cur, where, params, sign):
+    ''' add (sign '') or subtract (sign '-') the per-key sums of the
+        transactions matching where to every rollup '''
+    for table, cols, exprs in ROLLUPS:
+        keys = ', '.join(exprs)
+        not_null = ' AND '.join('%s IS NOT NULL' % expr for expr in exprs)
+        cur.execute('''INSERT INTO %s (%s, total, count, amounts)
+            SELECT %s, %sSUM(coalesce(amount, 0)), %sCOUNT(*), %sCOUNT(amount)
+            FROM transactions%s %s %s
+            GROUP BY %s
+            ON CONFLICT (%s) DO UPDATE SET total=total+excluded.total,
+            count=count+excluded.count, amounts=amounts+excluded.amounts''' % (
+            table, ', '.join(cols), keys, sign, sign, sign, where,
+            'AND' if where else 'WHERE', not_null, keys, ', '.join(cols)),
+            params)
+
+
+def verify(dbase, rollups=ROLLUPS):
+    ''' compare the rollups with the transactions table; this returns a
+        list of (table, row) pairs for every rollup row that is wrong or
+        missing, so an empty list means the rollups are correct
+    '''
+    problems = []
+    for table, cols, exprs in rollups:
+        actual = 'SELECT %s, total, count, amounts FROM %s' % (
+            ', '.join(cols), table)
+        expected = _expected(exprs)
+        cur = dbase.execute('''SELECT * FROM (%s EXCEPT %s)
+            UNION ALL SELECT * FROM (%s EXCEPT %s)''' % (
+            expected, actual, actual, expected))
+        problems.extend((table, row) for row in cur)
+    return problems
+
+
+def main(argv):
+    ''' run "verify" or "rebuild" against a database file '''
+    from transactions import Transaction
+    if len(argv) != 3 or argv[1] not in ('verify', 'rebuild'):
+        print('usage: python rollups.py verify|rebuild DBFILE')
+        return 2
+    with Transaction(argv[2]) as tran:
+        if argv[1] == 'rebuild':
+            tran.rebuild_rollups()
+        problems = tran.verify_rollups()
+    for table, row in problems:
+        print(table, row)
+    print('%d rollup rows differ from transactions' % len(problems))
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
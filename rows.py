@@ -0,0 +1,65 @@
+'''
+rows.py defines the compact row types the ORMs return
+
+A row used to be a fresh dict per database row.  Rows are now
+namedtuples, which take a fraction of the memory and need no
+per-row hash table, but they still answer the parts of the dict
+interface the tracker uses:
+
+    row['amount'], row.keys(), row.values(), row.items(), row.get()
+
+values() and keys() follow the column order of the table, and a row
+compares equal to the dict it replaces.  Like sqlite3.Row, iterating
+over a row yields its values.  Rows are read-only.
+
+'''
+
+from collections import namedtuple
+
+
+class Row():
+    ''' Row adds dict-style access by field name to a namedtuple '''
+    __slots__ = ()
+    _index = {}
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            try:
+                key = self._index[key]
+            except KeyError:
+                raise KeyError(key) from None
+        return super().__getitem__(key)
+
+    def keys(self):
+        ''' return the field names in column order '''
+        return self._fields
+
+    def values(self):
+        ''' return the values in column order '''
+        return tuple(self)
+
+    def items(self):
+        ''' return (field name, value) pairs in column order '''
+        return tuple(zip(self._fields, self))
+
+    def get(self, key, default=None):
+        ''' return the value of field key, or default if there is none '''
+        index = self._index.get(key)
+        return default if index is None else super().__getitem__(index)
+
+    def __eq__(self, other):
+        if isinstance(other, dict):
+            return dict(zip(self._fields, self)) == other
+        return super().__eq__(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = tuple.__hash__
+
+
+def row_type(name, fields):
+    ''' return a new Row namedtuple class with the given field names '''
+    base = namedtuple(name, fields)
+    return type(name, (Row, base), {'__slots__':(),
+        '_index':{field:i for i, field in enumerate(base._fields)}})
@@ -0,0 +1,108 @@
+'''
+test_aio runs unit and integration tests on the aio module
+'''
+
+import asyncio
+import threading
+
+import pytest
+from aio import AsyncCategory, AsyncTransaction
+from transactions import Transaction
+
+@pytest.fixture
+def dbfile(tmpdir):
+    ''' create a database file in a temporary file system '''
+    return tmpdir.join('test_tracker.db')
+
+def run(coro):
+    ''' run a coroutine to completion on a new event loop '''
+    return asyncio.run(coro)
+
+@pytest.mark.aio
+@pytest.mark.simple
+def test_methods_are_coroutines(dbfile):
+    ''' every public Transaction method has a coroutine counterpart'''
+    async def main():
+        async with AsyncTransaction(dbfile) as tran:
+            rowid = await tran.add({'amount':10,'category':'food',
+                'date':20100101,'description':'groceries'})
+            assert (await tran.select_one(rowid))['amount'] == 10
+            assert await tran.cat_total('food') == 10
+            assert (await tran.summarize(year=2010))['count'] == 1
+            await tran.delete(rowid)
+            assert await tran.show_transactions() == []
+            return tran.db
+    assert run(main()).closed
+    for name in ('add_many', 'print_sum_month', 'year_month_total', 'verify_rollups'):
+        assert asyncio.iscoroutinefunction(getattr(AsyncTransaction, name))
+
+@pytest.mark.aio
+def test_queries_run_off_the_loop(dbfile, monkeypatch):
+    ''' queries run on the executor's threads, not the event loop's'''
+    seen = set()
+
+    async def main():
+        async with AsyncTransaction(dbfile, max_workers=2) as tran:
+            execute = tran.db.execute
+            def record(*args):
+                seen.add(threading.get_ident())
+                return execute(*args)
+            monkeypatch.setattr(tran.db, 'execute', record)
+            await asyncio.gather(tran.show_transactions(), tran.year_total(2010))
+    run(main())
+    assert seen and threading.get_ident() not in seen
+
+@pytest.mark.aio
+def test_concurrent_reports(dbfile):
+    ''' many reports can be awaited together and agree with the sync API'''
+    with Transaction(dbfile) as tran:
+        tran.add_many({'amount':i,'category':'c'+str(i%5),
+            'date':20200101+i%28,'description':'x'} for i in range(500))
+        expected = [tran.cat_total('c'+str(i)) for i in range(5)]
+
+    async def main():
+        async with AsyncTransaction(dbfile) as tran:
+            ticks = 0
+            async def ticker():
+                nonlocal ticks
+                while True:
+                    ticks += 1
+                    await asyncio.sleep(0)
+            task = asyncio.create_task(ticker())
+            totals = await asyncio.gather(*[tran.cat_total('c'+str(i % 5))
+                for i in range(50)])
+            task.cancel()
+            return totals, ticks
+    totals, ticks = run(main())
+    assert totals == expected * 10
+    assert ticks > 0
+
+@pytest.mark.aio
+def test_async_iteration(dbfile):
+    ''' async iteration yields the same rows as the sync iterator'''
+    with Transaction(dbfile) as tran:
+        tran.add_many({'amount':i,'category':'c'+str(i%3),
+            'date':20200101+i%28,'description':'x'} for i in range(25))
+        everything = list(tran.iter_transactions())
+        some = list(tran.iter_transactions(category='c1', after_rowid=4, limit=5))
+
+    async def main():
+        async with AsyncTransaction(dbfile) as tran:
+            rows = [row async for row in tran.iter_transactions(chunk_size=4)]
+            limited = [row async for row in tran.iter_transactions(
+                category='c1', after_rowid=4, limit=5, chunk_size=2)]
+            return rows, limited
+    assert run(main()) == (everything, some)
+
+@pytest.mark.aio
+def test_async_category(dbfile):
+    ''' AsyncCategory mirrors Category'''
+    async def main():
+        async with AsyncCategory(dbfile) as cat:
+            await cat.add_many([{'name':'c'+str(i),'desc':'d'} for i in range(7)])
+            await cat.update(1, {'name':'food','desc':'groceries'})
+            names = [row['name'] async for row in cat.iter_all(chunk_size=3)]
+            return names, await cat.select_all()
+    names, cats = run(main())
+    assert names == ['food'] + ['c'+str(i) for i in range(1, 7)]
+    assert [cat['name'] for cat in cats] == names
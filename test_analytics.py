@@ -0,0 +1,90 @@
+'''
+test_analytics runs unit and integration tests on the analytics module
+'''
+
+import random
+
+import pytest
+from analytics import Analytics
+from transactions import Transaction
+
+@pytest.fixture
+def dbfile(tmpdir):
+    ''' create a database file in a temporary file system '''
+    return tmpdir.join('test_tracker.db')
+
+def random_transactions(rand, count):
+    ''' yield count random transactions, a few with NULL fields'''
+    for _ in range(count):
+        yield {'amount':None if rand.random() < 0.05 else rand.randint(-50, 500),
+            'category':None if rand.random() < 0.02 else rand.choice('abcde'),
+            'date':None if rand.random() < 0.02 else
+                rand.randint(2018, 2022)*10000 + rand.randint(1, 12)*100 + rand.randint(1, 28),
+            'description':'x'}
+
+@pytest.fixture
+def tran(dbfile):
+    ''' create a database of random transactions'''
+    db = Transaction(dbfile)
+    db.add_many(random_transactions(random.Random(16), 2000))
+    db.add({'amount':None,'category':'nulls','date':20190101,'description':'x'})
+    yield db
+    db.close()
+
+def check_totals(stats, tran):
+    ''' the in-memory totals agree with every SQL total'''
+    for cat in 'abcdef':
+        assert stats.cat_total(cat) == tran.cat_total(cat)
+    assert stats.cat_total('nulls') is tran.cat_total('nulls') is None
+    for year in range(2017, 2024):
+        assert stats.year_total(year) == tran.year_total(year)
+        for month in (1, 6, 12):
+            assert stats.year_month_total(year, month) == tran.year_month_total(year, month)
+    for month in range(1, 13):
+        assert stats.month_total(month) == tran.month_total(month)
+    for bgn, end in [(20180101, 20181231), (20190315, 20210704), (20300101, 20301231)]:
+        assert stats.date_total(bgn, end) == tran.date_total(bgn, end)
+
+@pytest.mark.analytics
+def test_totals_match_sql(tran):
+    ''' every total matches the Transaction method of the same name'''
+    check_totals(Analytics(tran), tran)
+
+@pytest.mark.analytics
+def test_group_by_matches_sql(tran):
+    ''' grouped totals and counts match GROUP BY queries'''
+    stats = Analytics(tran)
+    rows = tran.db.execute('''SELECT name, date / 10000, date / 100 % 100,
+        SUM(amount), COUNT(*) FROM transactions JOIN categories ON id=category_id
+        WHERE name IS NOT NULL AND date IS NOT NULL AND date>=20190301
+        GROUP BY 1, 2, 3''', ()).fetchall()
+    assert stats.totals(('category', 'year', 'month'), bgn=20190301) == {
+        row[:3]: row[3] for row in rows}
+    assert stats.counts(('category', 'year', 'month'), bgn=20190301) == {
+        row[:3]: row[4] for row in rows}
+    rows = tran.db.execute('''SELECT date, SUM(amount) FROM transactions
+        JOIN categories ON id=category_id WHERE name='c' AND date / 100 % 100=2 GROUP BY date''').fetchall()
+    assert stats.totals('day', category='c', month=2) == dict(rows)
+    assert stats.totals('category', category='zzz') == {}
+    with pytest.raises(ValueError):
+        stats.totals('week')
+
+@pytest.mark.analytics
+def test_incremental_refresh(tran):
+    ''' refresh reads only new rows, and reloads after deletes'''
+    stats = Analytics(tran)
+    assert stats.refresh() == 0
+    rowids = tran.add_many(random_transactions(random.Random(17), 300))
+    assert stats.refresh() == 300
+    check_totals(stats, tran)
+    tran.delete(rowids[5])
+    tran.add({'amount':1000,'category':'a','date':20200101,'description':'x'})
+    assert stats.refresh() == 2301
+    check_totals(stats, tran)
+
+@pytest.mark.analytics
+def test_string_dates(tran):
+    ''' text dates are accepted like the SQL methods accept them'''
+    stats = Analytics(tran)
+    assert stats.date_total('20180101', '20181231') == tran.date_total('20180101', '20181231')
+    assert stats.totals('month', bgn='20190301') == stats.totals('month', bgn=20190301)
@@ -0,0 +1,55 @@
+'''
+test_benchmark runs unit tests on the benchmark module
+'''
+
+import json
+
+import pytest
+from benchmark import compare, generate, main, run
+from category import Category
+from transactions import Transaction
+
+def public_methods(cls):
+    ''' the public methods of an ORM class that touch the database'''
+    return {name for name in vars(cls) if not name.startswith('_')
+        and callable(getattr(cls, name))} - {'close', 'cache_info', 'insert_batch'}
+
+@pytest.mark.benchmark
+@pytest.mark.simple
+def test_generate_is_seeded():
+    ''' the same seed always gives the same transactions'''
+    assert list(generate(3, 50)) == list(generate(3, 50))
+    assert list(generate(3, 50)) != list(generate(4, 50))
+
+@pytest.mark.benchmark
+def test_every_method_is_timed():
+    ''' a run times every public ORM method at every scale'''
+    results = run([50, 200], repeat=1)
+    json.dumps(results)
+    for scale in (50, 200):
+        timed = {(r['class'], r['method']) for r in results['results']
+            if r['scale'] == scale}
+        assert {('Transaction', name) for name in public_methods(Transaction)} <= timed
+        assert {('Category', name) for name in public_methods(Category)} <= timed
+    rows = compare(results, results)
+    assert rows and all(row[-1] == 1 for row in rows if row[3])
+
+@pytest.mark.benchmark
+def test_command_line(tmpdir, capsys):
+    ''' the command line writes JSON results and compares them'''
+    output = tmpdir.join('bench.json')
+    assert main(['benchmark.py', '--scales', '30', '--repeat', '1',
+        '--only', 'cat_total', 'add', '--output', str(output)]) == 0
+    results = json.loads(output.read())
+    assert {r['method'] for r in results['results']} == {'cat_total', 'add'}
+    assert main(['benchmark.py', '--scales', '30', '--repeat', '1', '--only', 'add',
+        '--output', str(tmpdir.join('new.json')), '--compare', str(output)]) == 0
+    assert 'x\n' in capsys.readouterr().out
+
+@pytest.mark.benchmark
+def test_parallel_cases():
+    ''' --workers times the parallel aggregates for each worker count'''
+    results = run([300], repeat=1, only={'group_by', 'total'}, workers=[1, 2])
+    timed = {(r['class'], r['method']) for r in results['results']}
+    assert {('Parallel1', 'group_by'), ('Parallel2', 'group_by'),
+        ('Parallel2', 'total'), ('Transaction', 'total')} <= timed
@@ -0,0 +1,77 @@
+'''
+test_cache runs unit and integration tests on the cache module
+'''
+
+import sqlite3
+
+import pytest
+from transactions import Transaction
+from category import Category
+
+@pytest.fixture
+def dbfile(tmpdir):
+    ''' create a database file in a temporary file system '''
+    return tmpdir.join('test_tracker.db')
+
+@pytest.fixture
+def cached_db(dbfile):
+    ''' create a cached Transaction with a few rows'''
+    db = Transaction(dbfile, cache_size=4)
+    db.add({'amount':10,'category':'food','date':20100101,'description':'groceries'})
+    db.add({'amount':70,'category':'bills','date':20120601,'description':'rent'})
+    yield db
+    db.close()
+
+@pytest.mark.cache
+@pytest.mark.simple
+def test_hits_and_misses(cached_db):
+    ''' repeated calls are answered from the cache'''
+    assert cached_db.cat_total('bills') == 70
+    assert cached_db.cat_total('bills') == 70
+    assert len(cached_db.show_transactions()) == 2
+    assert cached_db.cache_info() == {'hits':1, 'misses':2, 'size':2, 'maxsize':4}
+    with Transaction(cached_db.dbase) as uncached:
+        assert uncached.cache_info() is None
+
+@pytest.mark.cache
+def test_results_are_copies(cached_db):
+    ''' changing a returned list does not change the cached one'''
+    cached_db.show_transactions().clear()
+    cached_db.summarize(category='food')['transactions'].clear()
+    assert len(cached_db.show_transactions()) == 2
+    assert cached_db.summarize(category='food')['count'] == 1
+
+@pytest.mark.cache
+def test_lru_eviction(cached_db):
+    ''' the least recently used result is evicted first'''
+    for year in (2010, 2011, 2012, 2013):
+        cached_db.year_total(year)
+    cached_db.year_total(2010)
+    cached_db.year_total(2014)
+    assert cached_db.cache_info()['size'] == 4
+    hits = cached_db.cache_info()['hits']
+    cached_db.year_total(2010)
+    cached_db.year_total(2011)
+    assert cached_db.cache_info()['hits'] == hits + 1
+
+@pytest.mark.cache
+def test_invalidated_by_writes(cached_db):
+    ''' writes through this object, a sharing object or another
+    connection all invalidate the cache'''
+    assert cached_db.cat_total('food') == 10
+    cached_db.add({'amount':5,'category':'food','date':20100102,'description':'x'})
+    assert cached_db.cat_total('food') == 15
+
+    cats = Category(cached_db.dbase, cache_size=4)
+    assert [cat['desc'] for cat in cats.select_all()] == ['', '']
+    cats.add({'name':'food','desc':'groceries'})
+    assert [cat['desc'] for cat in cats.select_all()] == ['groceries', '']
+    cats.close()
+
+    con = sqlite3.connect(cached_db.dbase)
+    con.execute('''INSERT INTO transactions VALUES
+        (1,(SELECT id FROM categories WHERE name='food'),20100103,'y')''')
+    con.commit()
+    con.close()
+    assert cached_db.cat_total('food') == 16
+    assert len(cached_db.show_transactions()) == 4
@@ -2,8 +2,11 @@
 test_categories runs unit and integration tests on the category module
 '''
 
+import sqlite3
+
 import pytest
 from category import Category, to_cat_dict
+from transactions import Transaction, select_rows, where_clause
 
 @pytest.fixture
 def dbfile(tmpdir):
@@ -15,6 +18,7 @@ def empty_db(dbfile):
     ''' create an empty database '''
     db = Category(dbfile)
     yield db
+    db.close()
 
 
 @pytest.fixture
@@ -27,9 +31,7 @@ def small_db(empty_db):
     id2=empty_db.add(cat2)
     id3=empty_db.add(cat3)
     yield empty_db
-    empty_db.delete(id3)
-    empty_db.delete(id2)
-    empty_db.delete(id1)
+    empty_db.delete_many([id3, id2, id1])
 
 @pytest.fixture
 def med_db(small_db):
@@ -47,8 +49,7 @@ def med_db(small_db):
     yield small_db
 
     # remove those 10 categories
-    for j in range(10):
-        small_db.delete(rowids[j])
+    small_db.delete_many(rowids)
 
 
 @pytest.mark.category
@@ -117,3 +118,92 @@ def test_update(med_db):
     cat2 = med_db.select_one(rowid)
     assert cat2['name']==cat1['name']
     assert cat2['desc']==cat1['desc']
+
+@pytest.mark.category
+@pytest.mark.add
+def test_add_many(med_db):
+    ''' bulk add categories, then select them by the returned rowids'''
+    cats0 = med_db.select_all()
+    cats = [{'name':'bulk'+str(i),'desc':'bulk '+str(i)} for i in range(7)]
+    rowids = med_db.add_many(cats,batch_size=3)
+    assert len(rowids) == 7
+    assert len(med_db.select_all()) == len(cats0) + 7
+    for rowid,cat0 in zip(rowids,cats):
+        assert med_db.select_one(rowid)['name'] == cat0['name']
+
+@pytest.mark.category
+def test_iter_all(med_db):
+    ''' page through the categories 5 at a time'''
+    first = list(med_db.iter_all(limit=5))
+    second = list(med_db.iter_all(after_rowid=first[-1]['rowid'],limit=5,chunk_size=2))
+    assert len(first) == len(second) == 5
+    assert first + second == med_db.select_all()[:10]
+
+@pytest.mark.category
+@pytest.mark.add
+def test_add_is_upsert(med_db):
+    ''' adding a name that exists updates it instead of adding a row'''
+    cats0 = med_db.select_all()
+    rowid = med_db.add({'name':'food','desc':'groceries only'})
+    assert rowid == cats0[0]['rowid']
+    assert len(med_db.select_all()) == len(cats0)
+    assert med_db.select_one(rowid)['desc'] == 'groceries only'
+    rowids = med_db.add_many([{'name':'car','desc':'gas'},{'name':'new','desc':'x'},
+        {'name':'car','desc':'repairs'}])
+    assert rowids[0] == rowids[2] == cats0[1]['rowid']
+    assert med_db.select_one(rowids[0])['desc'] == 'repairs'
+    assert len(med_db.select_all()) == len(cats0) + 1
+    med_db.delete(rowids[1])
+
+@pytest.mark.category
+def test_transactions_refer_by_id(small_db, dbfile):
+    ''' transactions add their categories once, follow a rename and
+    keep a category in use from being deleted'''
+    with Transaction(dbfile) as tran:
+        cats0 = small_db.select_all()
+        rowid = tran.add({'amount':5,'category':'food','date':20100101,'description':'x'})
+        rowids = tran.add_many([{'amount':7,'category':'snacks','date':20100102,
+            'description':'y'}]*3)
+        cats1 = small_db.select_all()
+        assert [cat['name'] for cat in cats1] == [cat['name'] for cat in cats0] + ['snacks']
+        small_db.update(cats1[0]['rowid'], {'name':'meals','desc':'renamed'})
+        assert tran.select_one(rowid)['category'] == 'meals'
+        assert tran.cat_total('meals') == 5
+        assert tran.cat_total('food') is None
+        with pytest.raises(sqlite3.IntegrityError):
+            small_db.update(cats1[0]['rowid'], {'name':'car','desc':'taken'})
+        with pytest.raises(sqlite3.IntegrityError):
+            small_db.delete(cats1[-1]['rowid'])
+        assert len(small_db.select_all()) == len(cats1)
+        sql, params = where_clause(category='snacks')
+        plan = tran.db.execute('EXPLAIN QUERY PLAN ' + select_rows(sql), params).fetchall()
+        assert 'transactions_category (category_id=?)' in plan[0][3]
+        for item_num in [rowid] + list(rowids):
+            tran.delete(item_num)
+        small_db.delete(cats1[-1]['rowid'])
+
+@pytest.mark.category
+@pytest.mark.delete
+def test_select_and_delete_many(med_db):
+    ''' select and delete many categories with one statement each'''
+    cats = med_db.select_all()
+    rows, missing = med_db.select_many([cats[4]['rowid'], 500, cats[0]['rowid']])
+    assert rows == [cats[4], cats[0]]
+    assert missing == [500]
+    rowids = med_db.add_many({'name':'gone'+str(i),'desc':'x'} for i in range(5))
+    assert med_db.delete_many(rowids + [500]) == 5
+    assert med_db.select_all() == cats
+
+@pytest.mark.category
+def test_search(med_db):
+    ''' full-text search over names and descriptions follows updates'''
+    assert [cat['name'] for cat in med_db.search('movies')] == ['fun']
+    assert sorted(cat['name'] for cat in med_db.search('gas OR food')) == ['car', 'food']
+    rowid = med_db.search('car')[0]['rowid']
+    med_db.update(rowid, {'name':'auto', 'desc':'fuel and repairs'})
+    assert med_db.search('gas') == []
+    assert [cat['name'] for cat in med_db.search('fuel')] == ['auto']
+    assert len(med_db.search('descr*', limit=4)) == 4
+    with pytest.raises(ValueError):
+        med_db.search('nosuchcolumn: x')
+    med_db.update(rowid, {'name':'car', 'desc':'gas and repairs'})
@@ -0,0 +1,326 @@
+'''
+test_database runs unit and integration tests on the database module
+'''
+
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from database import (Database, clone_database, memory_database,
+    open_database, release_database)
+from transactions import Transaction
+from category import Category
+
+@pytest.fixture
+def dbfile(tmpdir):
+    ''' create a database file in a temporary file system '''
+    return tmpdir.join('test_tracker.db')
+
+@pytest.mark.database
+@pytest.mark.simple
+def test_shared_connection(dbfile):
+    ''' a Transaction and a Category on the same file share one connection'''
+    tran = Transaction(dbfile)
+    cat = Category(str(dbfile))
+    assert tran.db is cat.db
+    assert tran.db.connect() is cat.db.connect()
+    tran.close()
+    cat.close()
+
+@pytest.mark.database
+@pytest.mark.simple
+def test_use_from_another_thread(dbfile):
+    ''' an ORM object created in one thread works in another, as it did
+    when every method opened its own connection'''
+    tran = Transaction(dbfile)
+    tran.add({'amount':10,'category':'food','date':20100101,'description':'groceries'})
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        assert len(pool.submit(tran.show_transactions).result()) == 1
+        pool.submit(tran.add, {'amount':20,'category':'ent',
+            'date':20100101,'description':'movie'}).result()
+    assert tran.cat_total('ent') == 20
+    tran.close()
+
+@pytest.mark.database
+@pytest.mark.simple
+def test_close_last_reference(dbfile):
+    ''' the connection stays open until the last user closes it'''
+    tran = Transaction(dbfile)
+    cat = Category(dbfile)
+    dbase = tran.db
+    tran.close()
+    tran.close()
+    assert not dbase.closed
+    assert cat.select_all() == []
+    cat.close()
+    assert dbase.closed
+    with pytest.raises(sqlite3.ProgrammingError):
+        dbase.connect()
+
+@pytest.mark.database
+@pytest.mark.simple
+def test_context_manager(dbfile):
+    ''' leaving the with-block closes the connection'''
+    with Transaction(dbfile) as tran:
+        tran.add({'amount':10,'category':'food','date':20100101,'description':'groceries'})
+        dbase = tran.db
+    assert dbase.closed
+    with Transaction(dbfile) as tran:
+        assert len(tran.show_transactions()) == 1
+
+@pytest.mark.database
+@pytest.mark.simple
+def test_transaction_rollback(dbfile):
+    ''' a failing block rolls back everything it wrote'''
+    dbase = open_database(dbfile)
+    dbase.execute('CREATE TABLE t (x int)')
+    with pytest.raises(ValueError):
+        with dbase.transaction() as cur:
+            cur.execute('INSERT INTO t VALUES (1)')
+            raise ValueError
+    assert dbase.execute('SELECT COUNT(*) FROM t').fetchone()[0] == 0
+    release_database(dbase)
+
+@pytest.mark.database
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs os.fork')
+def test_reconnect_after_fork(dbfile):
+    ''' a forked child opens its own connection instead of the parent's'''
+    tran = Transaction(dbfile)
+    parent_con = tran.db.connect()
+    pid = os.fork()
+    if pid == 0:
+        status = 1
+        try:
+            if tran.db.connect() is not parent_con:
+                tran.add({'amount':10,'category':'food',
+                    'date':20100101,'description':'from child'})
+                status = 0
+        finally:
+            os._exit(status)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert tran.db.connect() is parent_con
+    assert tran.show_transactions()[0]['description'] == 'from child'
+    tran.close()
+
+@pytest.mark.database
+@pytest.mark.memory
+def test_private_memory_database():
+    ''' ':memory:' keeps its table between calls, privately per object'''
+    with Transaction(':memory:') as tran, Transaction(':memory:') as other:
+        tran.add({'amount':10,'category':'food','date':20100101,'description':'groceries'})
+        assert len(tran.show_transactions()) == 1
+        assert other.show_transactions() == []
+
+@pytest.mark.database
+@pytest.mark.memory
+def test_shared_memory_database():
+    ''' ORM objects given the same memory_database share it while open'''
+    mem = memory_database()
+    tran = Transaction(mem)
+    cat = Category(mem)
+    assert tran.db is cat.db
+    cat.add({'name':'food','desc':'groceries'})
+    with Transaction(mem) as other:
+        other.add({'amount':10,'category':'food','date':20100101,'description':'groceries'})
+    assert tran.cat_total('food') == 10
+    tran.close()
+    cat.close()
+    with Category(mem) as cat:
+        assert cat.select_all() == []
+
+@pytest.mark.database
+@pytest.mark.memory
+def test_shared_memory_dirty_reads():
+    ''' as database.py documents, other threads reading a shared memory
+    database see uncommitted rows instead of waiting for the writer'''
+    with Transaction(memory_database()) as tran:
+        count = lambda: tran.db.execute('SELECT COUNT(*) FROM transactions').fetchone()[0]
+        with ThreadPoolExecutor(1) as pool:
+            with pytest.raises(RuntimeError):
+                with tran.db.transaction():
+                    tran.add({'amount':1,'category':'a','date':20100101,'description':'x'})
+                    assert pool.submit(count).result() == 1
+                    raise RuntimeError('roll back')
+            assert pool.submit(count).result() == 0
+        assert count() == 0
+
+@pytest.mark.database
+@pytest.mark.memory
+def test_clone_database(dbfile):
+    ''' clones start with the seed's rows and then evolve independently'''
+    with Transaction(dbfile) as seed:
+        seed.add({'amount':10,'category':'food','date':20100101,'description':'groceries'})
+    with Transaction(memory_database()) as mem_seed:
+        mem_seed.add_many([{'amount':20,'category':'ent','date':20100101,
+            'description':'movie'}] * 3)
+        for source, count in [(dbfile, 1), (mem_seed.db, 3)]:
+            clone1 = clone_database(source)
+            clone2 = clone_database(source)
+            tran1 = Transaction(clone1)
+            tran2 = Transaction(clone2.dbfile)
+            tran1.add({'amount':5,'category':'x','date':20100101,'description':'x'})
+            assert len(tran1.show_transactions()) == count + 1
+            assert len(tran2.show_transactions()) == count
+            assert tran1.verify_rollups() == []
+            tran1.close()
+            tran2.close()
+            assert not clone1.closed and not clone2.closed
+            release_database(clone1)
+            release_database(clone2)
+            assert clone1.closed and clone2.closed
+        assert len(mem_seed.show_transactions()) == 3
+
+@pytest.mark.database
+@pytest.mark.memory
+def test_clone_missing_file(tmpdir):
+    ''' cloning a missing file raises instead of creating it, and leaves
+    no clone behind'''
+    missing = tmpdir.join('missing.db')
+    with pytest.raises(sqlite3.OperationalError):
+        clone_database(missing, name='clone_missing')
+    assert not missing.exists()
+    clone = clone_database(memory_database(), name='clone_missing')
+    release_database(clone)
+    assert clone.closed
+
+STRESS_WRITERS = 3
+STRESS_READERS = 3
+STRESS_ROWS = 40
+
+def stress_writer(dbfile, writer):
+    ''' add STRESS_ROWS transactions, one commit each'''
+    with Transaction(dbfile, concurrent=True) as tran:
+        for i in range(STRESS_ROWS):
+            tran.add({'amount':i,'category':'w'+str(writer),
+                'date':20220101+i%28,'description':'stress'})
+
+def stress_reader(dbfile, done):
+    ''' read until the writers are done; counts must never go down'''
+    with Transaction(dbfile, concurrent=True) as tran:
+        seen = 0
+        while not done.is_set():
+            count = tran.summarize(bgn=20220101, end=20221231)['count']
+            assert count >= seen
+            seen = count
+            tran.year_total(2022)
+
+@pytest.mark.database
+@pytest.mark.stress
+def test_concurrent_readers_and_writers(dbfile):
+    ''' N reader and N writer processes share one WAL database file'''
+    with Transaction(dbfile, concurrent=True) as tran:
+        assert tran.db.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    ctx = multiprocessing.get_context()
+    done = ctx.Event()
+    readers = [ctx.Process(target=stress_reader, args=(str(dbfile), done))
+        for _ in range(STRESS_READERS)]
+    writers = [ctx.Process(target=stress_writer, args=(str(dbfile), w))
+        for w in range(STRESS_WRITERS)]
+    for proc in readers + writers:
+        proc.start()
+    for proc in writers:
+        proc.join()
+    done.set()
+    for proc in readers:
+        proc.join()
+    assert [proc.exitcode for proc in readers + writers] == [0] * (
+        STRESS_READERS + STRESS_WRITERS)
+    with Transaction(dbfile) as tran:
+        assert len(tran.show_transactions()) == STRESS_WRITERS * STRESS_ROWS
+        assert tran.verify_rollups() == []
+
+@pytest.mark.database
+def test_write_retries(dbfile):
+    ''' a writer that can't get the lock backs off and retries, and
+    gives up only when every retry fails'''
+    tran = Transaction(dbfile, concurrent=True)
+    tran.db.use_wal(busy_timeout=0)
+    tran.db.retry_delay = 0.02
+    locked = threading.Event()
+
+    def hold_lock(seconds):
+        blocker = sqlite3.connect(dbfile, isolation_level=None)
+        blocker.execute('BEGIN IMMEDIATE')
+        locked.set()
+        time.sleep(seconds)
+        blocker.execute('COMMIT')
+        blocker.close()
+
+    thread = threading.Thread(target=hold_lock, args=(0.1,))
+    thread.start()
+    locked.wait()
+    tran.add({'amount':1,'category':'x','date':20220101,'description':'x'})
+    thread.join()
+
+    tran.db.retries = 1
+    locked.clear()
+    thread = threading.Thread(target=hold_lock, args=(0.5,))
+    thread.start()
+    locked.wait()
+    with pytest.raises(sqlite3.OperationalError):
+        tran.add({'amount':2,'category':'x','date':20220101,'description':'x'})
+    thread.join()
+    assert len(tran.show_transactions()) == 1
+    tran.close()
+
+@pytest.mark.database
+@pytest.mark.threads
+def test_threads_get_own_connections(dbfile):
+    ''' every thread uses its own connection, and a thread's connection
+    is handed on when it exits, so max_connections is never exceeded'''
+    tran = Transaction(Database(dbfile, max_connections=2))
+    main_con = tran.db.connect()
+    seen = []
+
+    def use():
+        seen.append(tran.db.connect())
+        tran.show_transactions()
+
+    for _ in range(5):
+        thread = threading.Thread(target=use)
+        thread.start()
+        thread.join()
+    assert main_con not in seen
+    assert len(tran.db._open) == 2
+    tran.close()
+    with pytest.raises(sqlite3.ProgrammingError):
+        seen[0].execute('SELECT 1')
+
+@pytest.mark.database
+@pytest.mark.threads
+def test_thread_pool_readers_and_writer(dbfile):
+    ''' a pool of readers shares one cached Transaction with a writer'''
+    tran = Transaction(dbfile, cache_size=16)
+    rows = 200
+    done = threading.Event()
+
+    def write():
+        try:
+            for i in range(rows):
+                tran.add({'amount':1,'category':'food',
+                    'date':20220101+i%28,'description':'x'})
+        finally:
+            done.set()
+
+    def read():
+        seen = 0
+        while not done.is_set():
+            total = tran.cat_total('food') or 0
+            count = len(tran.show_transactions())
+            assert total >= seen and count >= seen
+            seen = total
+        return seen
+
+    with ThreadPoolExecutor(max_workers=5) as pool:
+        readers = [pool.submit(read) for _ in range(4)]
+        pool.submit(write).result()
+        assert all(0 <= reader.result() <= rows for reader in readers)
+    assert tran.cat_total('food') == rows
+    assert len(tran.show_transactions()) == rows
+    assert len(tran.db._open) <= tran.db.max_connections
+    tran.close()
@@ -0,0 +1,61 @@
+'''
+test_exporter runs unit and integration tests on the exporter module
+'''
+
+import csv
+import json
+
+import pytest
+from exporter import export, export_report, read_columnar
+from transactions import Transaction
+
+@pytest.fixture
+def dbfile(tmpdir):
+    ''' create a database file in a temporary file system '''
+    return tmpdir.join('test_tracker.db')
+
+@pytest.fixture
+def tran(dbfile):
+    ''' create a database with a few hundred transactions, some NULL'''
+    db = Transaction(dbfile)
+    db.add_many({'amount':i if i % 7 else None,'category':'c'+str(i%4),
+        'date':20200101+(i%3)*10000+i%28,
+        'description':None if i % 11 == 0 else 'café, "%d"' % i}
+        for i in range(300))
+    yield db
+    db.close()
+
+@pytest.mark.exporter
+def test_export_formats(tran, tmpdir):
+    ''' every format holds exactly the rows of the table'''
+    rows = tran.show_transactions()
+    path = tmpdir.join('out')
+    assert export(tran, path, 'csv', chunk_size=64) == 300
+    with open(path, newline='', encoding='utf-8') as file:
+        exported = list(csv.DictReader(file))
+    assert [(int(row['rowid']), row['category'], row['description'])
+        for row in exported] == [(row['rowid'], row['category'],
+        row['description'] or '') for row in rows]
+    assert export(tran, path, 'jsonl', chunk_size=64) == 300
+    with open(path, encoding='utf-8') as file:
+        assert [json.loads(line) for line in file] == rows
+    assert export(tran, path, 'columnar', chunk_size=64) == 300
+    assert list(read_columnar(path)) == rows
+
+@pytest.mark.exporter
+def test_export_reports(tran, tmpdir):
+    ''' filtered exports and reports match the Transaction reports'''
+    path = tmpdir.join('out.col')
+    reports = [('print_sum_date', (20200105, 20210110)), ('print_sum_month', (1,)),
+        ('print_sum_year_month', (2021, 1)), ('print_sum_year', (2022,)),
+        ('print_sum_cat', ('c2',)), ('show_transactions', ())]
+    for report, args in reports:
+        expected = getattr(tran, report)(*args)
+        assert expected
+        assert export_report(tran, path, 'columnar', report, *args,
+            chunk_size=50) == len(expected)
+        assert list(read_columnar(path)) == expected
+    assert export(tran, path, 'columnar', category='none') == 0
+    assert list(read_columnar(path)) == []
+    with pytest.raises(ValueError):
+        export(tran, path, 'xml')
@@ -0,0 +1,110 @@
+'''
+test_importer runs unit and integration tests on the importer module
+'''
+
+import json
+
+import pytest
+from importer import InvalidRow, import_file, normalize_amount, normalize_date
+from transactions import Transaction
+
+@pytest.fixture
+def dbfile(tmpdir):
+    ''' create a database file in a temporary file system '''
+    return tmpdir.join('test_tracker.db')
+
+@pytest.fixture
+def empty_db(dbfile):
+    ''' create an empty database '''
+    db = Transaction(dbfile)
+    yield db
+    db.close()
+
+@pytest.mark.importer
+@pytest.mark.simple
+def test_normalize():
+    ''' dates become yyyymmdd ints and amounts whole numbers'''
+    for date in (20220131, '20220131', '2022-01-31', '2022/01/31', '01/31/2022'):
+        assert normalize_date(date) == 20220131
+    for date in ('2022-02-30', 'yesterday', ''):
+        with pytest.raises(ValueError):
+            normalize_date(date)
+    assert normalize_amount(' 12 ') == 12
+    assert normalize_amount(12.0) == 12
+    assert normalize_amount('') is None
+    for amount in ('12.50', 12.5, 'ten'):
+        with pytest.raises(ValueError):
+            normalize_amount(amount)
+
+@pytest.mark.importer
+def test_import_csv(empty_db, tmpdir):
+    ''' a CSV export is imported with its dates normalized'''
+    path = tmpdir.join('bank.csv')
+    path.write('description,amount,date,category\n'
+        'groceries,10,2022-01-31,food\n'
+        '"rent, january",700,01/01/2022,bills\n'
+        'refund,,20220105,food\n')
+    stats = import_file(empty_db, path)
+    assert (stats['rows'], stats['resumed'], stats['invalid']) == (3, 0, 0)
+    assert stats['rows_per_sec'] > 0
+    assert [tuple(row.values())[1:] for row in empty_db.show_transactions()] == [
+        (10, 'food', 20220131, 'groceries'),
+        (700, 'bills', 20220101, 'rent, january'),
+        (None, 'food', 20220105, 'refund')]
+    assert empty_db.cat_total('food') == 10
+    assert empty_db.verify_rollups() == []
+
+@pytest.mark.importer
+def test_invalid_rows(empty_db, tmpdir):
+    ''' invalid rows raise with their line number, or are skipped'''
+    path = tmpdir.join('bank.jsonl')
+    path.write('{"amount":1,"category":"a","date":"2022-01-01","description":"x"}\n'
+        '\n'
+        '{"amount":2,"category":"a","date":"2022-13-01","description":"x"}\n'
+        'not json\n'
+        '{"amount":3,"category":"a","description":"x"}\n'
+        '{"amount":4,"category":"a","date":20220104,"description":"x"}\n')
+    with pytest.raises(InvalidRow) as info:
+        import_file(empty_db, path)
+    assert info.value.line == 3
+    assert empty_db.show_transactions() == []
+    stats = import_file(empty_db, path, skip_invalid=True)
+    assert (stats['rows'], stats['invalid']) == (2, 3)
+    assert [row['amount'] for row in empty_db.show_transactions()] == [1, 4]
+
+@pytest.mark.importer
+def test_resume_after_interruption(empty_db, tmpdir):
+    ''' a failed import keeps its committed batches and resumes after them'''
+    path = tmpdir.join('bank.jsonl')
+    rows = [{'amount':i,'category':'c'+str(i%3),'date':20220101+i%28,
+        'description':'x'} for i in range(25)]
+    rows[17]['date'] = 'bad'
+    path.write(''.join(json.dumps(row) + '\n' for row in rows))
+    with pytest.raises(InvalidRow):
+        import_file(empty_db, path, batch_size=5)
+    assert len(empty_db.show_transactions()) == 15
+    assert empty_db.verify_rollups() == []
+    stats = import_file(empty_db, path, batch_size=5, skip_invalid=True)
+    assert (stats['rows'], stats['resumed'], stats['invalid']) == (9, 15, 1)
+    assert [row['amount'] for row in empty_db.show_transactions()] == \
+        [i for i in range(25) if i != 17]
+    assert import_file(empty_db, path)['rows'] == 0
+    assert empty_db.verify_rollups() == []
+
+@pytest.mark.importer
+def test_new_file_at_same_path(empty_db, tmpdir):
+    ''' a different file written to an imported path is imported from
+    its first row, even when the earlier import was interrupted'''
+    path = tmpdir.join('bank.csv')
+    path.write('amount,category,date,description\n1,a,20220101,x\n2,a,20220102,x\n')
+    assert import_file(empty_db, path)['rows'] == 2
+    path.write('amount,category,date,description\n3,a,20220103,x\n'
+        '4,a,20220104,x\n5,a,bad,x\n')
+    with pytest.raises(InvalidRow):
+        import_file(empty_db, path, batch_size=2)
+    path.write('amount,category,date,description\n3,a,20220103,x\n'
+        '4,a,20220104,x\n5,a,20220105,x\n')
+    stats = import_file(empty_db, path, batch_size=2)
+    assert (stats['rows'], stats['resumed']) == (3, 0)
+    assert [row['amount'] for row in empty_db.show_transactions()] == [1, 2, 3, 4, 3, 4, 5]
+    assert empty_db.db.execute('SELECT COUNT(*) FROM imports').fetchone()[0] == 1
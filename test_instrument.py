@@ -0,0 +1,73 @@
+'''
+test_instrument runs unit and integration tests on the instrument module
+'''
+
+import logging
+
+import pytest
+import instrument
+from category import Category
+from transactions import Transaction
+
+@pytest.fixture
+def dbfile(tmpdir):
+    ''' create a database file in a temporary file system '''
+    return tmpdir.join('test_tracker.db')
+
+@pytest.fixture
+def measuring():
+    ''' turn the instrumentation on for one test'''
+    instrument.reset()
+    instrument.enable()
+    yield
+    instrument.disable()
+    instrument.reset()
+
+@pytest.mark.instrument
+@pytest.mark.simple
+def test_disabled_costs_nothing():
+    ''' enable wraps the ORM methods and disable puts the originals back'''
+    original = Transaction.cat_total
+    instrument.enable()
+    assert Transaction.cat_total is not original
+    instrument.disable()
+    assert Transaction.cat_total is original
+    assert not instrument.enabled()
+
+@pytest.mark.instrument
+def test_counts_and_phases(dbfile, measuring):
+    ''' calls, rows, histograms and phases are recorded per method'''
+    with Transaction(dbfile) as tran, Category(dbfile) as cat:
+        tran.add_many({'amount':i,'category':'food','date':20200101+i,
+            'description':'x'} for i in range(20))
+        cat.add({'name':'food','desc':'groceries'})
+        for _ in range(3):
+            assert len(tran.print_sum_cat('food')) == 20
+        tran.cat_total('food')
+        tran.summarize(category='food')
+        assert len(list(tran.iter_transactions(limit=5))) == 5
+        cat.select_all()
+    stats = instrument.stats()
+    entry = stats['Transaction.print_sum_cat']
+    assert (entry['calls'], entry['rows']) == (3, 60)
+    assert sum(entry['histogram'].values()) == 3
+    assert entry['convert'] > 0 and entry['query'] > 0
+    assert entry['seconds'] >= entry['setup'] + entry['convert']
+    assert stats['Transaction.cat_total']['rows'] == 1
+    assert stats['Transaction.summarize']['rows'] == 20
+    assert stats['Transaction.iter_transactions']['rows'] == 5
+    assert stats['Transaction.add_many']['rows'] == 20
+    assert stats['Category.select_all']['calls'] == 1
+    assert 'Transaction.print_sum_cat' in instrument.report()
+
+@pytest.mark.instrument
+def test_slow_query_log(dbfile, measuring, caplog):
+    ''' slow calls are logged with their SQL, parameters and plan'''
+    instrument.enable(slow=0)
+    with Transaction(dbfile) as tran:
+        with caplog.at_level(logging.WARNING, logger='tracker.slow'):
+            tran.print_sum_cat('food')
+    message = caplog.records[0].getMessage()
+    assert message.startswith('Transaction.print_sum_cat took')
+    assert "ORDER BY transactions.rowid  ('food',)" in message
+    assert 'SEARCH transactions USING' in message
@@ -0,0 +1,78 @@
+'''
+test_migrations runs unit and integration tests on the migrations module
+'''
+
+import sqlite3
+
+import pytest
+from category import Category
+from migrations import SCHEMA_VERSION, schema_version
+from transactions import Transaction
+
+@pytest.fixture
+def dbfile(tmpdir):
+    ''' create a database file in a temporary file system '''
+    return tmpdir.join('test_tracker.db')
+
+@pytest.fixture
+def old_db(dbfile):
+    ''' create a tracker.db the way the original code did, with no indexes'''
+    con = sqlite3.connect(dbfile)
+    con.execute('''CREATE TABLE transactions
+        (amount int, category text, date int, description text)''')
+    con.execute('''CREATE TABLE categories (name text, desc text)''')
+    con.execute("INSERT INTO transactions VALUES(10,'food',20100101,'groceries')")
+    con.execute("INSERT INTO transactions VALUES(70,'bills',20120601,'rent')")
+    con.execute("INSERT INTO transactions VALUES(5,'food',20120602,'snack')")
+    # option 5 of tracker.py used to add a category per transaction
+    con.execute("INSERT INTO categories VALUES('food','groceries')")
+    con.execute("INSERT INTO categories VALUES('food','snack')")
+    con.commit()
+    con.close()
+    return dbfile
+
+@pytest.mark.migration
+@pytest.mark.simple
+def test_new_database(dbfile):
+    ''' a new database is created at the current schema version'''
+    with Transaction(dbfile) as tran:
+        assert schema_version(tran.db) == SCHEMA_VERSION
+
+@pytest.mark.migration
+def test_upgrade_in_place(old_db):
+    ''' an existing database keeps its rows and gains the indexes'''
+    with Transaction(old_db) as tran:
+        assert schema_version(tran.db) == SCHEMA_VERSION
+        assert len(tran.show_transactions()) == 3
+        assert tran.cat_total('bills') == 70
+        indexes = [row[0] for row in tran.db.execute(
+            "SELECT name FROM sqlite_master WHERE type='index'")]
+        assert 'transactions_date' in indexes
+        assert 'transactions_category_date_amount' in indexes
+        plan = tran.db.execute('''EXPLAIN QUERY PLAN SELECT SUM(amount)
+            FROM transactions WHERE category_id=(?)''', (1,)).fetchall()
+        assert 'COVERING INDEX' in plan[0][3]
+
+@pytest.mark.migration
+def test_categories_normalized(old_db):
+    ''' duplicate categories are merged and transactions refer to them
+    by id, keeping their rowids'''
+    with Transaction(old_db) as tran, Category(old_db) as cat:
+        assert [(row['name'], row['desc']) for row in cat.select_all()] == [
+            ('food', 'groceries'), ('bills', '')]
+        assert [(row['rowid'], row['category']) for row in tran.show_transactions()] == [
+            (1, 'food'), (2, 'bills'), (3, 'food')]
+        assert tran.cat_total('food') == 15
+        assert tran.verify_rollups() == []
+        # existing rows are indexed for search
+        assert [row['rowid'] for row in tran.search('rent OR snack')] == [2, 3]
+        assert [row['name'] for row in cat.search('groceries')] == ['food']
+
+@pytest.mark.migration
+def test_newer_schema_is_rejected(dbfile):
+    ''' code never opens a database written by a newer schema'''
+    con = sqlite3.connect(dbfile)
+    con.execute('PRAGMA user_version=%d' % (SCHEMA_VERSION + 1))
+    con.close()
+    with pytest.raises(RuntimeError):
+        Transaction(dbfile)
@@ -0,0 +1,97 @@
+'''
+test_parallel runs unit and integration tests on the parallel module
+'''
+
+import pytest
+from parallel import ParallelTransaction, read_only, split_days
+from partitions import PartitionedTransaction
+from transactions import Transaction
+
+@pytest.fixture(scope='module')
+def dbs(tmpdir_factory, make):
+    ''' the same transactions in a single file and a partitioned layout '''
+    tmpdir = tmpdir_factory.mktemp('parallel')
+    rows = make(2, 2000)
+    with Transaction(tmpdir.join('single.db')) as single, \
+            PartitionedTransaction(tmpdir.join('parts.db')) as parts:
+        single.add_many(rows)
+        parts.add_many(rows)
+        parts.freeze(2010)
+        yield single, parts
+
+@pytest.fixture(scope='module')
+def pars(dbs):
+    ''' parallel wrappers of both, splitting even the smallest calls '''
+    single, parts = dbs
+    with ParallelTransaction(single, workers=2, chunks=5, min_rows=0,
+            rows=True) as par, \
+            ParallelTransaction(parts, workers=2, min_rows=0, rows=True) as ppar:
+        yield par, ppar
+
+@pytest.mark.unit
+def test_split_days():
+    ''' days are cut into ranges of about equal counts'''
+    days = [(20100101, 5), (20100102, 5), (20100103, 10), (20100104, 1)]
+    assert split_days(days, 1) == [(20100101, 20100104)]
+    assert split_days(days, 2) == [(20100101, 20100103), (20100104, 20100104)]
+    assert split_days(days, 10) == [(20100101, 20100101), (20100102, 20100102),
+        (20100103, 20100103), (20100104, 20100104)]
+    assert split_days([], 4) == []
+
+@pytest.mark.unit
+def test_read_only():
+    ''' files get read-only URIs and memory databases none'''
+    assert read_only('/tmp/a b.db') == 'file:/tmp/a%20b.db?mode=ro'
+    assert read_only('/tmp/a.db', immutable=True) == 'file:/tmp/a.db?mode=ro&immutable=1'
+    assert read_only('file:x?mode=memory&cache=shared') is None
+
+@pytest.mark.integration
+def test_plan(dbs, pars):
+    ''' calls are split into date ranges or partitions, or run serially'''
+    single, _ = dbs
+    par, ppar = pars
+    chunks = par.plan()
+    assert len(chunks) == 6
+    assert chunks[-1][1] == {'undated':True}
+    assert all(uri.endswith('mode=ro') for uri, _, _ in chunks)
+    assert len(par.plan(year=2011, category='food')) <= 5
+    assert all('undated' not in chunk for _, chunk, _ in par.plan(month=3))
+    assert [year for _, _, year in ppar.plan()] == [0, 2010, 2011, 2012, 2013]
+    assert ppar.plan(year=2011) is None
+    assert ppar.plan(bgn=20110101)[0][0].startswith('file:')
+    assert ParallelTransaction(single, workers=1).plan() is None
+    assert ParallelTransaction(single, workers=2).plan() is None
+
+@pytest.mark.integration
+@pytest.mark.parametrize('filters', [{}, {'category':'food'}, {'month':3},
+    {'year':2011, 'category':'ent'}, {'bgn':20100601, 'end':20120301},
+    {'category':'nope'}, {'year':1999}])
+def test_same_as_serial(dbs, pars, filters):
+    ''' every parallel aggregate equals the serial one, for both layouts'''
+    for par, serial in zip(pars, dbs):
+        for by in ((), ('category',), ('month', 'category'), ('year', 'day')):
+            assert par.group_sums(by, **filters) == serial.group_sums(by, **filters)
+            assert list(par.group_by(by, **filters)) == list(serial.group_by(by, **filters))
+        assert par.total(**filters) == serial.total(**filters)
+        assert par.summarize(**filters) == serial.summarize(**filters)
+
+@pytest.mark.integration
+def test_totals(dbs, pars):
+    ''' the *_total methods match the serial ones'''
+    single, _ = dbs
+    for obj in pars:
+        assert obj.group_by(('month', 'category')) == single.group_by(('month', 'category'))
+        assert obj._pool is not None
+        assert obj.date_total(20100601, 20120301) == single.date_total(20100601, 20120301)
+        assert obj.month_total(3) == single.month_total(3)
+        assert obj.year_month_total(2011, 3) == single.year_month_total(2011, 3)
+        assert obj.year_total(2012) == single.year_total(2012)
+        assert obj.cat_total('food') == single.cat_total('food')
+
+@pytest.mark.integration
+def test_summarize_is_serial_by_default(dbs):
+    ''' summarize only goes to the pool when rows is set'''
+    single, _ = dbs
+    with ParallelTransaction(single, workers=2, min_rows=0) as par:
+        assert par.summarize(category='food') == single.summarize(category='food')
+        assert par._pool is None
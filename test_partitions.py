@@ -0,0 +1,219 @@
+'''
+test_partitions runs unit and integration tests on the partitions module
+'''
+
+import os
+import stat
+
+import pytest
+from category import Category
+from partitions import (SPAN, FrozenPartitionError, PartitionedTransaction,
+    main, prune, split)
+from transactions import Transaction
+
+@pytest.fixture
+def both(tmpdir, make):
+    ''' the same transactions in a single file and a partitioned layout '''
+    rows = make(1, 300)
+    with Transaction(tmpdir.join('single.db')) as single, \
+            PartitionedTransaction(tmpdir.join('parts.db')) as parts:
+        single.add_many(rows)
+        parts.add_many(rows)
+        yield single, parts
+
+def strip(rows):
+    ''' return rows without their item_nums, in a canonical order '''
+    return sorted((tuple(row)[1:] for row in rows), key=repr)
+
+@pytest.mark.unit
+def test_prune():
+    ''' only the date filters rule out partitions'''
+    years = [0, 2010, 2011, 2012]
+    assert prune(years) == [0, 2010, 2011, 2012]
+    assert prune(years, category='food', month=3) == [0, 2010, 2011, 2012]
+    assert prune(years, year=2011) == [2011]
+    assert prune(years, bgn=20110301) == [2011, 2012]
+    assert prune(years, bgn=20100301, end=20110101) == [2010, 2011]
+    assert prune(years, bgn=20120101, year=2011) == []
+
+@pytest.mark.integration
+def test_layout(tmpdir, both):
+    ''' each year gets its own file and the base file the categories'''
+    _, parts = both
+    assert parts.partitions() == {0:False, 2010:False, 2011:False,
+        2012:False, 2013:False}
+    assert tmpdir.join('parts-2011.db').check()
+    assert tmpdir.join('parts-undated.db').check()
+    with Category(tmpdir.join('parts.db')) as cat:
+        assert sorted(row['name'] for row in cat.select_all()) == ['ent', 'food', 'travel']
+
+@pytest.mark.integration
+def test_same_answers(both):
+    ''' every read matches a single-file Transaction'''
+    single, parts = both
+    assert strip(parts.show_transactions()) == strip(single.show_transactions())
+    for year in range(2009, 2015):
+        assert strip(parts.print_sum_year(year)) == strip(single.print_sum_year(year))
+        assert parts.year_total(year) == single.year_total(year)
+        assert parts.year_month_total(year, 3) == single.year_month_total(year, 3)
+        assert strip(parts.print_sum_year_month(year, 3)) == \
+            strip(single.print_sum_year_month(year, 3))
+    for month in (1, 6, 12):
+        assert strip(parts.print_sum_month(month)) == strip(single.print_sum_month(month))
+        assert parts.month_total(month) == single.month_total(month)
+    for cat in ('food', 'ent', 'none'):
+        assert strip(parts.print_sum_cat(cat)) == strip(single.print_sum_cat(cat))
+        assert parts.cat_total(cat) == single.cat_total(cat)
+    assert strip(parts.print_sum_date(20100601, 20120301)) == \
+        strip(single.print_sum_date(20100601, 20120301))
+    assert parts.date_total(20100601, 20120301) == single.date_total(20100601, 20120301)
+    for by in ((), ('year',), ('month', 'category'), ('day',)):
+        assert parts.group_by(by) == single.group_by(by)
+        assert parts.group_by(by, category='food') == single.group_by(by, category='food')
+    assert parts.total() == single.total()
+    expected = single.summarize(bgn=20110101)
+    result = parts.summarize(bgn=20110101)
+    assert strip(result.pop('transactions')) == strip(expected.pop('transactions'))
+    assert result == pytest.approx(expected)
+    assert parts.verify_rollups() == []
+
+@pytest.mark.integration
+def test_item_nums(both):
+    ''' item_nums carry the year and find their partition'''
+    _, parts = both
+    rowid = parts.add({'amount':5, 'category':'food', 'date':20110203,
+        'description':'x'})
+    assert rowid // SPAN == 2011
+    assert parts.select_one(rowid)['amount'] == 5
+    rows, missing = parts.select_many([rowid, 2011*SPAN + 10**6, 5])
+    assert [row['rowid'] for row in rows] == [rowid, 5]
+    assert missing == [2011*SPAN + 10**6]
+    with pytest.raises(IndexError):
+        parts.select_one(1999*SPAN + 1)
+    rowids = parts.add_many([{'amount':1, 'category':'ent', 'date':date,
+        'description':'y'} for date in (20130101, None, 20100101)])
+    assert [r // SPAN for r in rowids] == [2013, 0, 2010]
+    assert parts.delete_many(rowids + [1999*SPAN + 1]) == 3
+    parts.delete(rowid)
+    assert parts.select_many([rowid])[0] == []
+    assert parts.verify_rollups() == []
+
+@pytest.mark.integration
+def test_delete_where(both):
+    ''' delete_where deletes the same rows as in a single file'''
+    single, parts = both
+    assert parts.delete_where(year=2011, category='food') == \
+        single.delete_where(year=2011, category='food')
+    assert parts.group_by(('year', 'category')) == single.group_by(('year', 'category'))
+    with pytest.raises(ValueError):
+        parts.delete_where()
+
+@pytest.mark.integration
+def test_iter_transactions(both):
+    ''' iteration and paging run across partitions in item_num order'''
+    _, parts = both
+    every = list(parts.iter_transactions(chunk_size=7))
+    assert [row['rowid'] for row in every] == sorted(row['rowid'] for row in every)
+    assert len(every) == 300
+    pages = []
+    after = None
+    while True:
+        page = list(parts.iter_transactions(limit=40, after_rowid=after))
+        if not page:
+            break
+        pages.extend(page)
+        after = page[-1]['rowid']
+    assert pages == every
+    dated = list(parts.iter_transactions(bgn=20120101))
+    assert {row['rowid'] // SPAN for row in dated} <= {2012, 2013}
+
+@pytest.mark.integration
+def test_pruning_opens_only_needed_partitions(tmpdir, both):
+    ''' date filters open only the partitions of their years'''
+    _, parts = both
+    parts.close()
+    with PartitionedTransaction(tmpdir.join('parts.db')) as fresh:
+        fresh.print_sum_year(2011)
+        fresh.year_total(2012)
+        fresh.date_total(20120101, 20121231)
+        assert sorted(fresh._open) == [2011, 2012]
+        fresh.cat_total('food')
+        assert sorted(fresh._open) == [0, 2010, 2011, 2012, 2013]
+
+@pytest.mark.integration
+def test_search(both):
+    ''' search lists the newest years first, up to limit'''
+    _, parts = both
+    rows = parts.search('item', limit=400)
+    assert len(rows) == 300
+    assert [row['rowid'] // SPAN for row in rows] == \
+        sorted((row['rowid'] // SPAN for row in rows), reverse=True)
+    assert len(parts.search('item', limit=10)) == 10
+    assert [row['description'] for row in parts.search('"item 7"', year=2099)] == []
+
+@pytest.mark.integration
+def test_freeze_and_thaw(tmpdir, both):
+    ''' a frozen partition is read-only until thawed'''
+    single, parts = both
+    expected = parts.group_by(('year', 'month'))
+    parts.freeze(2011)
+    path = tmpdir.join('parts-2011.frozen.db')
+    assert path.check() and not tmpdir.join('parts-2011.db').check()
+    assert not os.stat(path).st_mode & stat.S_IWUSR
+    assert parts.partitions()[2011] is True
+    assert parts.group_by(('year', 'month')) == expected
+    assert strip(parts.print_sum_year(2011)) == strip(single.print_sum_year(2011))
+    assert parts.partition(2011).db.dbfile.endswith('immutable=1')
+    with pytest.raises(FrozenPartitionError):
+        parts.add({'amount':1, 'category':'food', 'date':20110101, 'description':''})
+    with pytest.raises(FrozenPartitionError):
+        parts.delete_where(year=2011)
+    # other years stay writable
+    parts.add({'amount':1, 'category':'food', 'date':20120101, 'description':''})
+    parts.close()
+    with PartitionedTransaction(tmpdir.join('parts.db'), cache_size=8) as again:
+        assert again.partitions()[2011] is True
+        assert again.year_total(2011) == single.year_total(2011)
+        again.thaw(2011)
+        assert again.partitions()[2011] is False
+        again.add({'amount':1, 'category':'food', 'date':20110101, 'description':''})
+        assert again.year_total(2011) == (single.year_total(2011) or 0) + 1
+        assert again.verify_rollups() == []
+
+@pytest.mark.integration
+def test_split(tmpdir, both):
+    ''' split copies a single file into a partitioned layout'''
+    single, _ = both
+    with Category(single.db) as cat:
+        cat.add({'name':'food', 'desc':'meals'})
+    base = tmpdir.join('copy.db')
+    assert split(tmpdir.join('single.db'), base, batch_size=64) == 300
+    with PartitionedTransaction(base) as parts:
+        assert strip(parts.show_transactions()) == strip(single.show_transactions())
+        assert parts.group_by(('year', 'category')) == single.group_by(('year', 'category'))
+    with Category(base) as cat:
+        assert {row['name']:row['desc'] for row in cat.select_all()}['food'] == 'meals'
+
+@pytest.mark.integration
+def test_main(tmpdir, both, capsys):
+    ''' the command line freezes, lists and thaws'''
+    base = str(tmpdir.join('parts.db'))
+    assert main(['partitions.py', 'freeze', base, '2010']) == 0
+    assert main(['partitions.py', 'list', base]) == 0
+    assert 'parts-2010.frozen.db frozen' in capsys.readouterr().out
+    assert main(['partitions.py', 'thaw', base, '2010']) == 0
+    assert main(['partitions.py']) == 2
+
+@pytest.mark.integration
+def test_after_rowid(both):
+    ''' after_rowid, an item_num, is translated for every partition'''
+    single, parts = both
+    rowids = [row['rowid'] for row in parts.iter_transactions()]
+    after = rowids[150]
+    later = [row for row in parts.show_transactions() if row['rowid'] > after]
+    assert parts.summarize(after_rowid=after)['transactions'] == later
+    assert parts.group_by(after_rowid=after)[()]['count'] == len(later)
+    assert len(parts.search('item', limit=400, after_rowid=after)) == len(later)
+    assert parts.delete_where(after_rowid=rowids[-4]) == 3
+    assert [row['rowid'] for row in parts.show_transactions()] == rowids[:-3]
+    assert parts.verify_rollups() == []
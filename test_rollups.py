@@ -0,0 +1,80 @@
+'''
+test_rollups runs integration tests on the rollups module
+'''
+
+import pytest
+from transactions import Transaction
+
+@pytest.fixture
+def dbfile(tmpdir):
+    ''' create a database file in a temporary file system '''
+    return tmpdir.join('test_tracker.db')
+
+@pytest.fixture
+def tran_db(dbfile):
+    ''' create a database with a few transactions'''
+    db = Transaction(dbfile)
+    db.add_many([
+        {'amount':10,'category':'food','date':20100101,'description':'groceries'},
+        {'amount':20,'category':'ent','date':20100101,'description':'movie'},
+        {'amount':30,'category':'travel','date':20110601,'description':'uber'},
+        {'amount':40,'category':'food','date':20120101,'description':'dinner out'},
+        {'amount':70,'category':'bills','date':20120601,'description':'monthly rent'},
+        ])
+    yield db
+    db.close()
+
+@pytest.mark.rollup
+@pytest.mark.total
+def test_rollups_follow_writes(tran_db):
+    ''' the triggers keep every rollup equal to the transactions table'''
+    assert tran_db.verify_rollups() == []
+    rowid = tran_db.add({'amount':5,'category':'food','date':20120115,'description':'x'})
+    assert tran_db.year_total(2012) == 115
+    assert tran_db.year_month_total(2012, 1) == 45
+    assert tran_db.cat_total('food') == 55
+    tran_db.delete(rowid)
+    tran_db.delete(1)
+    assert tran_db.cat_total('food') == 40
+    assert tran_db.date_total(20100101, 20100101) == 20
+    with tran_db.db.transaction() as cur:
+        cur.execute('''UPDATE transactions SET date=20130101,
+            category_id=(SELECT id FROM categories WHERE name='travel') WHERE rowid=2''')
+    assert tran_db.cat_total('ent') is None
+    assert tran_db.cat_total('travel') == 50
+    assert tran_db.year_total(2013) == 20
+    assert tran_db.year_total(2010) is None
+    assert tran_db.verify_rollups() == []
+
+@pytest.mark.rollup
+@pytest.mark.total
+def test_verify_and_rebuild(tran_db):
+    ''' verify finds rollups that drifted and rebuild repairs them'''
+    with tran_db.db.transaction() as cur:
+        cur.execute('''UPDATE totals_category SET total=0
+            WHERE category_id=(SELECT id FROM categories WHERE name='food')''')
+        cur.execute("DELETE FROM totals_year WHERE year=2011")
+    problems = tran_db.verify_rollups()
+    assert sorted(table for table, row in problems) == [
+        'totals_category', 'totals_category', 'totals_year']
+    tran_db.rebuild_rollups()
+    assert tran_db.verify_rollups() == []
+    assert tran_db.cat_total('food') == 50
+    assert tran_db.year_total(2011) == 30
+
+@pytest.mark.rollup
+@pytest.mark.total
+def test_null_amounts_total_like_sum(tran_db):
+    ''' a total over nothing but NULL amounts is None, as SUM(amount) is'''
+    tran_db.add({'amount':None,'category':'nul','date':20300101,'description':'x'})
+    sql = '''SELECT SUM(amount) FROM transactions
+        WHERE category_id=(SELECT id FROM categories WHERE name='nul')'''
+    assert tran_db.db.execute(sql).fetchone()[0] is None
+    assert tran_db.cat_total('nul') is None
+    assert tran_db.year_total(2030) is None
+    assert tran_db.year_month_total(2030, 1) is None
+    assert tran_db.date_total(20300101, 20300101) is None
+    tran_db.add({'amount':5,'category':'nul','date':20300101,'description':'y'})
+    assert tran_db.cat_total('nul') == 5
+    assert tran_db.month_total(1) == 75
+    assert tran_db.verify_rollups() == []
@@ -0,0 +1,36 @@
+'''
+test_rows runs unit tests on the rows module
+'''
+
+import pytest
+from rows import row_type
+
+Pair = row_type('Pair', ('name', 'desc'))
+
+@pytest.mark.rows
+@pytest.mark.simple
+def test_dict_access():
+    ''' a row answers the dict methods in column order'''
+    row = Pair('food', 'groceries')
+    assert row['name'] == 'food'
+    assert row[1] == row.desc == 'groceries'
+    assert row.keys() == ('name', 'desc')
+    assert row.values() == ('food', 'groceries')
+    assert row.items() == (('name', 'food'), ('desc', 'groceries'))
+    assert row.get('desc') == 'groceries'
+    assert row.get('missing', 0) == 0
+    assert dict(row) == {'name':'food', 'desc':'groceries'}
+    with pytest.raises(KeyError):
+        row['missing']
+
+@pytest.mark.rows
+@pytest.mark.simple
+def test_equality():
+    ''' a row equals the dict it replaces and is read-only'''
+    row = Pair('food', 'groceries')
+    assert row == {'name':'food', 'desc':'groceries'}
+    assert row != {'name':'food', 'desc':'takeout'}
+    assert row == Pair('food', 'groceries')
+    assert len({row, Pair('food', 'groceries')}) == 1
+    with pytest.raises(TypeError):
+        row['name'] = 'car'
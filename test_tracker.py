@@ -0,0 +1,149 @@
+'''
+test_tracker runs integration tests on the tracker batch mode
+'''
+
+import importlib
+import json
+
+import pytest
+import instrument
+import tracker
+
+@pytest.fixture
+def dbfile(tmpdir, monkeypatch):
+    ''' run in a temporary directory and return a database file in it '''
+    monkeypatch.chdir(tmpdir)
+    return str(tmpdir.join('test_tracker.db'))
+
+def outputs(capsys):
+    ''' the JSON objects printed since the last call'''
+    return [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+@pytest.mark.tracker
+@pytest.mark.simple
+def test_import_has_no_side_effects(dbfile, tmpdir):
+    ''' importing tracker opens no database and prompts for nothing'''
+    importlib.reload(tracker)
+    assert tracker._ORMS == []
+    assert not tmpdir.join('tracker.db').exists()
+    assert callable(tracker.print_transactions)
+
+@pytest.mark.tracker
+def test_commands(dbfile, capsys):
+    ''' each command prints one JSON result'''
+    assert tracker.main(['--db', dbfile, 'add', '10', 'food', '20220105', 'groceries']) == 0
+    assert tracker.main(['--db', dbfile, 'add', '70', 'bills', '20220201', 'rent']) == 0
+    assert tracker.main(['--db', dbfile, 'summarize', '--year', '2022',
+        '--category', 'food']) == 0
+    assert tracker.main(['--db', dbfile, 'delete', '2']) == 0
+    assert tracker.main(['--db', dbfile, 'show']) == 0
+    added, _, summary, deleted, shown = outputs(capsys)
+    assert added == {'command':'add', 'result':1}
+    assert summary['result']['total'] == 10
+    assert summary['result']['transactions'] == [{'rowid':1, 'amount':10,
+        'category':'food', 'date':20220105, 'description':'groceries'}]
+    assert deleted['result'] == 2
+    assert [row['rowid'] for row in shown['result']] == [1]
+    assert tracker._ORMS == []
+
+@pytest.mark.tracker
+def test_script(dbfile, tmpdir, capsys):
+    ''' a script runs every command in one process and stops at an error'''
+    script = tmpdir.join('script.txt')
+    script.write('# set up\n'
+        'add-category food "groceries and takeout"\n'
+        '\n'
+        'add 10 food 20220105 groceries\n'
+        'add 20 food 20220106 "more groceries"\n'
+        'summarize --category food\n'
+        'update-category 7 x y\n'
+        'show\n')
+    assert tracker.main(['--db', dbfile, 'run', str(script)]) == 1
+    results = outputs(capsys)
+    assert [result['command'] for result in results] == [
+        'add-category', 'add', 'add', 'summarize']
+    assert results[-1]['result']['total'] == 30
+    script.write('add ten food 20220105 x\n')
+    assert tracker.main(['--db', dbfile, 'run', str(script)]) == 2
+    assert 'line 1' in json.loads(capsys.readouterr().err)['error']
+
+@pytest.mark.tracker
+def test_text_output(dbfile, capsys):
+    ''' --text prints the same tables as the menu'''
+    tracker.main(['--db', dbfile, 'add', '10', 'food', '20220105', 'groceries'])
+    capsys.readouterr()
+    assert tracker.main(['--db', dbfile, '--text', 'summarize']) == 0
+    out = capsys.readouterr().out
+    assert 'groceries' in out and 'Total:' in out
+
+@pytest.mark.tracker
+def test_search_command(dbfile, capsys):
+    ''' search prints the matching transactions'''
+    tracker.main(['--db', dbfile, 'add', '10', 'food', '20220105', 'weekly groceries'])
+    tracker.main(['--db', dbfile, 'add', '70', 'bills', '20220201', 'rent'])
+    capsys.readouterr()
+    assert tracker.main(['--db', dbfile, 'search', 'grocer*', '--year', '2022']) == 0
+    result, = outputs(capsys)
+    assert [row['rowid'] for row in result['result']] == [1]
+
+@pytest.mark.tracker
+def test_group_command(dbfile, capsys):
+    ''' group prints a row per group, and a table with --text'''
+    tracker.main(['--db', dbfile, 'add', '10', 'food', '20220105', 'groceries'])
+    tracker.main(['--db', dbfile, 'add', '30', 'food', '20220210', 'groceries'])
+    tracker.main(['--db', dbfile, 'add', '70', 'bills', '20220201', 'rent'])
+    capsys.readouterr()
+    assert tracker.main(['--db', dbfile, 'group', 'month', 'category']) == 0
+    result, = outputs(capsys)
+    assert result['result'] == [
+        {'month':1, 'category':'food', 'total':10, 'count':1, 'avg':10},
+        {'month':2, 'category':'bills', 'total':70, 'count':1, 'avg':70},
+        {'month':2, 'category':'food', 'total':30, 'count':1, 'avg':30}]
+    assert tracker.main(['--db', dbfile, 'group']) == 0
+    assert outputs(capsys)[0]['result'] == [{'total':110, 'count':3, 'avg':110/3}]
+    tracker.main(['--db', dbfile, '--text', 'group', 'year'])
+    assert '110' in capsys.readouterr().out
+    tracker.print_groups(('month', 'category'),
+        tracker.orms()[0].group_by(('month', 'category')))
+    tracker.close()
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0].split() == ['month', 'bills', 'food']
+    assert lines[3].split() == ['2', '70', '30']
+
+@pytest.mark.tracker
+def test_rename_to_taken_name(dbfile, capsys, monkeypatch):
+    ''' renaming a category to a name in use is reported, not raised'''
+    tracker.main(['--db', dbfile, 'add-category', 'food', 'meals'])
+    tracker.main(['--db', dbfile, 'add-category', 'ent', 'fun'])
+    capsys.readouterr()
+    assert tracker.main(['--db', dbfile, 'update-category', '2', 'food', 'x']) == 1
+    assert 'UNIQUE' in json.loads(capsys.readouterr().err)['error']
+    answers = iter(['2', 'food', 'x', '0'])
+    monkeypatch.setattr('builtins.input', lambda prompt: next(answers))
+    monkeypatch.setattr(tracker, 'DBFILE', dbfile)
+    try:
+        tracker.process_choice('3')
+    finally:
+        tracker.close()
+    assert 'already a category named food' in capsys.readouterr().out
+
+@pytest.mark.tracker
+def test_stats_are_opt_in(dbfile, capsys, monkeypatch):
+    ''' query statistics are only recorded with --stats or menu option 14'''
+    instrument.reset()
+    tracker.main(['--db', dbfile, 'show'])
+    assert not instrument.enabled() and instrument.stats() == {}
+    tracker.main(['--db', dbfile, '--stats', 'show'])
+    assert not instrument.enabled()
+    assert instrument.stats()['Transaction.show_transactions']['calls'] == 1
+    capsys.readouterr()
+    answers = iter(['14', '0'])
+    monkeypatch.setattr('builtins.input', lambda prompt: next(answers))
+    monkeypatch.setattr(tracker, 'DBFILE', dbfile)
+    try:
+        tracker.toplevel()
+        assert instrument.enabled()
+    finally:
+        instrument.disable()
+        tracker.close()
+    assert 'recording query statistics' in capsys.readouterr().out
@@ -2,8 +2,12 @@
 test_transaction runs unit and integration tests on the transaction module
 '''
 
+import os
+import time
+
 import pytest
-from transactions import Transaction, to_transaction_dict
+from transactions import (Transaction, group_query, pivot, rowid_order, select_rows,
+    to_transaction_dict, where_clause)
 
 @pytest.fixture
 def dbfile(tmpdir):
@@ -15,6 +19,7 @@ def empty_db(dbfile):
     ''' create an empty database '''
     db = Transaction(dbfile)
     yield db
+    db.close()
 
 @pytest.fixture
 def small_db(empty_db):
@@ -34,13 +39,7 @@ def small_db(empty_db):
     id6=empty_db.add(tran6)
     id7=empty_db.add(tran7)
     yield empty_db
-    empty_db.delete(id7)
-    empty_db.delete(id6)
-    empty_db.delete(id5)
-    empty_db.delete(id4)
-    empty_db.delete(id3)
-    empty_db.delete(id2)
-    empty_db.delete(id1)
+    empty_db.delete_many([id7, id6, id5, id4, id3, id2, id1])
 
 @pytest.fixture
 def med_db(small_db):
@@ -60,13 +59,7 @@ def med_db(small_db):
     id13=small_db.add(tran13)
     id14=small_db.add(tran14)
     yield small_db
-    small_db.delete(id14)
-    small_db.delete(id13)
-    small_db.delete(id12)
-    small_db.delete(id11)
-    small_db.delete(id10)
-    small_db.delete(id9)
-    small_db.delete(id8)
+    small_db.delete_many([id14, id13, id12, id11, id10, id9, id8])
 
 @pytest.mark.todo
 @pytest.mark.print
@@ -233,6 +226,19 @@ def test_date_total_med(med_db):
     assert test3 == 1050
     test4 = med_db.date_total(20100101, 20120601)
     assert test4 == 780
+
+@pytest.mark.total
+@pytest.mark.date
+@pytest.mark.med
+@pytest.mark.transaction
+def test_string_dates(med_db):
+    ''' dates given as strings, as the menu reads them, match the same
+    rows as integers, including where a rollup table answers'''
+    assert med_db.date_total('20100101', '20120601') == 780
+    assert med_db.group_by('day', bgn='20110601', end='20120101') == \
+        med_db.group_by('day', bgn=20110601, end=20120101)
+    assert med_db.total(bgn='20120101', category='food') == 130 + 40
+    assert med_db.summarize(bgn='20130101')['total'] == 140
     
 
 @pytest.mark.print
@@ -442,3 +448,308 @@ def test_cat_total_med(med_db):
     assert test3 == 270
     test4 = med_db.cat_total('bills')
     assert test4 == 440
+
+@pytest.mark.add
+@pytest.mark.data
+@pytest.mark.transaction
+def test_add_many(med_db):
+    ''' testing the add_many function
+    bulk add transactions in small batches and check the returned rowids'''
+    trans0 = med_db.show_transactions()
+    trans = [{'amount':i,'category':'bulk','date':20220101+i,
+        'description':'row '+str(i)} for i in range(25)]
+    rowids = med_db.add_many(iter(trans), batch_size=10)
+    assert len(rowids) == 25
+    assert len(med_db.show_transactions()) == len(trans0) + 25
+    for rowid, tran0 in zip(rowids, trans):
+        tran1 = med_db.select_one(rowid)
+        assert tran1['amount'] == tran0['amount']
+        assert tran1['description'] == tran0['description']
+    assert len(med_db.add_many([])) == 0
+    assert med_db.cat_total('bulk') == sum(range(25))
+    assert med_db.verify_rollups() == []
+    for rowid in rowids:
+        med_db.delete(rowid)
+
+@pytest.mark.add
+@pytest.mark.data
+@pytest.mark.transaction
+def test_add_many_rollback(med_db):
+    ''' a failing add_many adds nothing and leaves the rollups working'''
+    trans = [{'amount':1,'category':'bulk','date':20220101,'description':'x'},
+        {'amount':2,'category':'bulk'}]
+    with pytest.raises(KeyError):
+        med_db.add_many(trans)
+    assert med_db.print_sum_cat('bulk') == []
+    rowid = med_db.add(trans[0])
+    assert med_db.cat_total('bulk') == 1
+    assert med_db.verify_rollups() == []
+    med_db.delete(rowid)
+
+@pytest.mark.benchmark
+@pytest.mark.add
+@pytest.mark.skipif(not os.environ.get('TRACKER_BENCHMARK'),
+    reason='set TRACKER_BENCHMARK=1 to run timing tests')
+def test_add_many_speedup(tmpdir):
+    ''' add_many must be at least 50x faster than a loop over add'''
+    trans = [{'amount':i,'category':'c'+str(i%20),'date':20200101+i%28,
+        'description':'row'} for i in range(2000)]
+    with Transaction(tmpdir.join('loop.db')) as loop_db:
+        start = time.perf_counter()
+        for tran in trans:
+            loop_db.add(tran)
+        loop = time.perf_counter() - start
+    with Transaction(tmpdir.join('bulk.db')) as bulk_db:
+        start = time.perf_counter()
+        bulk_db.add_many(trans)
+        bulk = time.perf_counter() - start
+        assert bulk_db.verify_rollups() == []
+    print('add loop %.3fs, add_many %.3fs, %.0fx' % (loop, bulk, loop/bulk))
+    assert loop / bulk >= 50
+
+@pytest.mark.print
+@pytest.mark.month
+@pytest.mark.cal
+@pytest.mark.med
+@pytest.mark.transaction
+def test_print_sum_year_month_med(med_db):
+    ''' testing the print_sum_year_month and year_month_total functions'''
+    test1 = med_db.print_sum_year_month(2012, 6)
+    assert len(test1) == 4
+    assert med_db.year_month_total(2012, 6) == 430
+    test2 = med_db.print_sum_year_month('2011', '06')
+    assert len(test2) == 3
+    assert med_db.year_month_total('2011', '06') == 180
+    assert med_db.print_sum_year_month(2014, 6) == []
+    assert med_db.year_month_total(2014, 6) is None
+
+@pytest.mark.cal
+@pytest.mark.simple
+@pytest.mark.transaction
+def test_calendar_queries_use_indexes(empty_db, monkeypatch):
+    ''' the queries the calendar methods run search an index (or a
+    rollup table) instead of scanning the transactions'''
+    run = empty_db.db.execute
+    statements = []
+    def record(sql, params=(), *args):
+        statements.append((sql, params))
+        return run(sql, params, *args)
+    monkeypatch.setattr(empty_db.db, 'execute', record)
+    calls = [lambda: empty_db.print_sum_month(6), lambda: empty_db.month_total(6),
+        lambda: empty_db.print_sum_year(2012), lambda: empty_db.year_total(2012),
+        lambda: empty_db.print_sum_year_month(2012, 6),
+        lambda: empty_db.year_month_total(2012, 6),
+        lambda: empty_db.print_sum_date(20120101, 20120630),
+        lambda: empty_db.date_total(20120101, 20120630),
+        lambda: empty_db.summarize(month=6)]
+    for call in calls:
+        statements.clear()
+        call()
+        selects = [(sql, params) for sql, params in statements
+            if sql.lstrip().upper().startswith('SELECT')]
+        assert selects
+        for sql, params in selects:
+            plan = [row[3] for row in run('EXPLAIN QUERY PLAN '+sql, params)]
+            assert not any(line.startswith('SCAN transactions') for line in plan), plan
+            if 'FROM transactions' in sql:
+                assert plan[0].startswith('SEARCH transactions USING')
+
+@pytest.mark.print
+@pytest.mark.total
+@pytest.mark.med
+@pytest.mark.transaction
+def test_summarize(med_db):
+    ''' testing the summarize function against the print_sum/total pairs'''
+    for filters, rows, total in [
+            ({'bgn':20100101, 'end':20110601}, med_db.print_sum_date(20100101, 20110601),
+                med_db.date_total(20100101, 20110601)),
+            ({'month':'06'}, med_db.print_sum_month(6), med_db.month_total(6)),
+            ({'year':2012}, med_db.print_sum_year(2012), med_db.year_total(2012)),
+            ({'category':'bills'}, med_db.print_sum_cat('bills'), med_db.cat_total('bills'))]:
+        summary = med_db.summarize(**filters)
+        assert summary['transactions'] == rows
+        assert summary['total'] == total
+        assert summary['count'] == len(rows)
+    bills = med_db.summarize(year=2012, category='bills')
+    assert bills['count'] == 3
+    assert (bills['min'], bills['max'], bills['avg']) == (70, 120, 100)
+    empty = med_db.summarize(year=2020)
+    assert empty['transactions'] == []
+    assert (empty['total'], empty['count'], empty['avg']) == (None, 0, None)
+
+@pytest.mark.print
+@pytest.mark.med
+@pytest.mark.transaction
+def test_iter_transactions(med_db):
+    ''' testing the iter_transactions generator and keyset pagination'''
+    assert list(med_db.iter_transactions(chunk_size=3)) == med_db.show_transactions()
+    assert list(med_db.iter_transactions(category='food')) == med_db.print_sum_cat('food')
+    pages = []
+    after = 0
+    while True:
+        page = list(med_db.iter_transactions(after_rowid=after, limit=4))
+        if not page:
+            break
+        pages.append(page)
+        after = page[-1]['rowid']
+    assert [len(page) for page in pages] == [4, 4, 4, 2]
+    assert sum(pages, []) == med_db.show_transactions()
+
+@pytest.mark.med
+@pytest.mark.transaction
+def test_filtered_pages_walk_rowid_order(med_db):
+    ''' filtered keyset pages read rows in rowid order, with no sort'''
+    filters = [{'category':'food'}, {'month':6}, {'year':2011},
+        {'year':2011, 'month':6}, {'bgn':20100101, 'end':20111231},
+        {'category':'food', 'year':2011}]
+    for filter_ in filters:
+        sql, params = where_clause(after_rowid=0, **filter_)
+        plan = med_db.db.execute('EXPLAIN QUERY PLAN ' + select_rows(sql,
+            rowid_order(**filter_)) + ' ORDER BY transactions.rowid LIMIT 2',
+            params).fetchall()
+        assert not any('TEMP B-TREE' in row[3] for row in plan), filter_
+        pages = []
+        after = 0
+        while True:
+            page = list(med_db.iter_transactions(after_rowid=after, limit=2, **filter_))
+            if not page:
+                break
+            pages.extend(page)
+            after = page[-1]['rowid']
+        assert pages == med_db.summarize(**filter_)['transactions']
+
+@pytest.mark.total
+@pytest.mark.transaction
+def test_summarize_null_amounts(empty_db):
+    ''' summarize skips NULL amounts the way the SQL aggregates do'''
+    empty_db.add({'amount':None,'category':'nul','date':20300101,'description':'x'})
+    summary = empty_db.summarize(category='nul')
+    assert summary['count'] == 1
+    assert (summary['total'], summary['min'], summary['max'], summary['avg']) == (
+        None, None, None, None)
+    empty_db.add({'amount':10,'category':'nul','date':20300102,'description':'y'})
+    empty_db.add({'amount':20,'category':'nul','date':20300103,'description':'z'})
+    summary = empty_db.summarize(category='nul')
+    row = empty_db.db.execute('''SELECT SUM(amount), COUNT(*), MIN(amount),
+        MAX(amount), AVG(amount) FROM transactions
+        WHERE category_id=(SELECT id FROM categories WHERE name='nul')''').fetchone()
+    assert (summary['total'], summary['count'], summary['min'],
+        summary['max'], summary['avg']) == row
+
+@pytest.mark.med
+@pytest.mark.transaction
+def test_select_many(med_db):
+    ''' select_many returns the rows in the order asked, and the missing ids'''
+    rows, missing = med_db.select_many([9, 2, 400, 9, 14, -1])
+    assert rows == [med_db.select_one(rowid) for rowid in (9, 2, 9, 14)]
+    assert missing == [400, -1]
+    assert med_db.select_many([]) == ([], [])
+
+@pytest.mark.delete
+@pytest.mark.transaction
+def test_delete_many(med_db):
+    ''' delete_many removes the listed rows at once and keeps the rollups'''
+    count = len(med_db.show_transactions())
+    assert med_db.delete_many([3, 8, 10, 999]) == 3
+    assert med_db.select_many([3, 8, 10, 4])[1] == [3, 8, 10]
+    assert len(med_db.show_transactions()) == count - 3
+    assert med_db.cat_total('travel') == 60
+    assert med_db.year_total(2011) == 140
+    assert med_db.verify_rollups() == []
+    assert med_db.delete_many([]) == 0
+
+@pytest.mark.delete
+@pytest.mark.transaction
+def test_delete_where(med_db):
+    ''' delete_where removes the rows matching the filters at once'''
+    assert med_db.delete_where(category='bills', year=2012) == 3
+    assert med_db.cat_total('bills') == 140
+    assert med_db.delete_where(bgn=20110101, end=20111231) == 5
+    assert med_db.year_total(2011) is None
+    assert med_db.delete_where(category='nothing') == 0
+    assert med_db.verify_rollups() == []
+    assert len(med_db.show_transactions()) == 6
+    with pytest.raises(ValueError):
+        med_db.delete_where()
+
+@pytest.mark.med
+@pytest.mark.transaction
+def test_search(med_db):
+    ''' full-text search finds words, phrases and prefixes, ranked'''
+    assert [row['rowid'] for row in med_db.search('uber')] == [3, 10]
+    assert [row['rowid'] for row in med_db.search('"monthly rent"')] == [7, 14]
+    assert [row['rowid'] for row in med_db.search('rent monthly')] == [7, 14]
+    assert [row['rowid'] for row in med_db.search('mov*')] == [2, 9]
+    assert [row['rowid'] for row in med_db.search('monthly OR dinner', limit=2,
+        rank=False)] == [4, 7]
+    assert med_db.search('monthly rent', year=2013) == [med_db.select_one(14)]
+    assert med_db.search('uber OR gas', category='travel', bgn=20110201,
+        rank=False) == [med_db.select_one(3), med_db.select_one(10)]
+    assert med_db.search('flights') == []
+    with pytest.raises(ValueError):
+        med_db.search('"unbalanced')
+
+@pytest.mark.transaction
+def test_search_follows_writes(small_db):
+    ''' the search index follows adds, updates and deletes, bulk or not'''
+    rowid = small_db.add({'amount':5,'category':'food','date':20100105,
+        'description':'farmers market'})
+    small_db.add_many([{'amount':i,'category':'food','date':20100106,
+        'description':'market stall %d' % i} for i in range(5)])
+    assert len(small_db.search('market')) == 6
+    with small_db.db.transaction() as cur:
+        cur.execute("UPDATE transactions SET description='flea' WHERE rowid=(?)", (rowid,))
+    assert [row['rowid'] for row in small_db.search('flea')] == [rowid]
+    assert len(small_db.search('market')) == 5
+    small_db.delete(rowid)
+    assert small_db.delete_where(bgn=20100106, end=20100106) == 5
+    assert small_db.search('flea OR market') == []
+    with small_db.db.transaction() as cur:
+        cur.execute("INSERT INTO transactions_fts (transactions_fts) VALUES ('integrity-check')")
+
+@pytest.mark.med
+@pytest.mark.total
+def test_group_by(med_db):
+    ''' group_by gives the GROUP BY sums, counts and averages'''
+    groups = med_db.group_by(('year', 'category'))
+    assert groups[(2012, 'bills')] == {'total':300, 'count':3, 'avg':100}
+    assert groups[(2011, 'travel')] == {'total':210, 'count':3, 'avg':70}
+    assert len(groups) == 8
+    assert list(groups) == sorted(groups)
+    assert med_db.group_by('category', month=6, year=2012) == {
+        'bills':{'total':300, 'count':3, 'avg':100},
+        'food':{'total':130, 'count':1, 'avg':130}}
+    assert med_db.group_by() == {():{'total':1050, 'count':14, 'avg':75}}
+    assert med_db.group_by('day', bgn=20120101, end=20120101) == {
+        20120101:{'total':100, 'count':2, 'avg':50}}
+    assert med_db.group_by('category', category='none') == {}
+    with pytest.raises(ValueError):
+        med_db.group_by('week')
+
+@pytest.mark.med
+@pytest.mark.total
+def test_group_by_rollups_match_table(med_db):
+    ''' the rollup tables and the transactions table give the same groups'''
+    med_db.add({'amount':None,'category':'nul','date':20140101,'description':'x'})
+    med_db.add({'amount':5,'category':'food','date':None,'description':'y'})
+    for by, filters in [(('month',), {}), (('year', 'month'), {}), ((), {'year':2011}),
+            (('day',), {'month':6}), (('category',), {}), ((), {'category':'nul'}),
+            (('year',), {'bgn':20110101, 'end':20121231})]:
+        sql, params = group_query(by, filters)
+        assert ' FROM totals_' in sql, (by, filters)
+        # after_rowid=0 changes nothing but keeps the rollups out
+        assert med_db.group_by(by, **filters) == med_db.group_by(by,
+            after_rowid=0, **filters), (by, filters)
+    assert med_db.year_total(2014) is None
+    assert med_db.total(category='nul') is None
+    assert med_db.group_by('year')[2014]['count'] == 1
+
+@pytest.mark.simple
+def test_pivot():
+    ''' pivot lays two dimensions out as rows and columns'''
+    groups = {(2010, 'a'):{'total':1, 'count':1, 'avg':1},
+        (2010, 'b'):{'total':2, 'count':1, 'avg':2},
+        (2011, 'b'):{'total':3, 'count':2, 'avg':1.5}}
+    assert pivot(groups) == ([2010, 2011], ['a', 'b'],
+        {2010:{'a':1, 'b':2}, 2011:{'b':3}})
+    assert pivot(groups, 'count')[2][2011] == {'b':2}
@@ -30,13 +30,59 @@ This app will store the data in a SQLite database ~/tracker.db
 Note the actual implementation of the ORM is hidden and so it
 could be replaced with PostgreSQL or Pandas or straight python lists
 
+Run without arguments it shows the interactive menu.  Given a command
+it runs that command instead and prints its result as one line of
+JSON (or as the menu's tables with --text), and "run" runs a whole
+script of commands in one process against one connection:
+
+    python tracker.py add 10 food 20220105 groceries
+    python tracker.py summarize --year 2022 --category food
+    python tracker.py --db other.db run commands.txt
+
+Importing the module opens nothing, so other programs can reuse its
+print functions and the TRANSACTION and CATEGORY ORMs.
+
 '''
 
-from transactions import Transaction
+import argparse
+import json
+import shlex
+import sqlite3
+import sys
+
+from transactions import DIMENSIONS, Transaction, pivot
 from category import Category
+from importer import import_file
+from exporter import WRITERS, export
+import instrument
+
+# the database the menu and the commands use; importing this module
+# opens nothing, the ORMs are created on first use (see orms())
+DBFILE = 'tracker.db'
+# with --stats, calls slower than this many seconds are logged
+SLOW = 0.5
+_ORMS = []
+
+def orms():
+    ''' return the (Transaction, Category) pair for DBFILE, opening them
+        on first use; they share one connection '''
+    if not _ORMS:
+        _ORMS.extend((Transaction(DBFILE), Category(DBFILE)))
+    return tuple(_ORMS)
+
+def close():
+    ''' close the ORMs opened by orms(), if any '''
+    while _ORMS:
+        _ORMS.pop().close()
 
-TRANSACTION = Transaction('tracker.db')
-CATEGORY = Category('tracker.db')
+def __getattr__(name):
+    ''' TRANSACTION and CATEGORY are the ORMs of orms(), opened when
+        another module first reads them '''
+    if name == 'TRANSACTION':
+        return orms()[0]
+    if name == 'CATEGORY':
+        return orms()[1]
+    raise AttributeError('module %r has no attribute %r' % (__name__, name))
 
 # here is the menu for the tracker app
 
@@ -53,12 +99,16 @@ MENU = '''
 9. summarize transactions by year
 10. summarize transactions by category
 11. print this menu
+12. import transactions from a CSV or JSONL file
+13. export transactions to a CSV, JSONL or columnar file
+14. record, then show, query statistics
+15. search transactions
+16. group totals by day, month, year and/or category
 '''
 
 def process_choice(choice):
     '''prompts user for their menu choice'''
-    transaction = TRANSACTION
-    category = CATEGORY
+    transaction, category = orms()
     if choice == '0':
         return
     elif choice=='1':
@@ -75,7 +125,10 @@ def process_choice(choice):
         name = input("new category name: ")
         desc = input("new category description: ")
         cat = {'name':name, 'desc':desc}
-        category.update(rowid,cat)
+        try:
+            category.update(rowid,cat)
+        except sqlite3.IntegrityError:
+            print("there is already a category named %s" % name)
     elif choice=='4':
         print_transactions(transaction.show_transactions())
     elif choice == '5':
@@ -85,40 +138,75 @@ def process_choice(choice):
         description = input("description: ")
         tran = {'amount':amount, 'category':ctgry,
             'date':date, 'description':description}
+        # a new category name is added to the categories once
         transaction.add(tran)
-        cat = {'name':ctgry, 'desc':description}
-        category.add(cat)
     elif choice == '6':
         item_num = input("item_num: ")
         transaction.delete(item_num)
-        print('DELETE CORRELATING CATEGORY ')
-        cats = category.select_all()
-        print_categories(cats)
-        row = input("category rowid: ")
-        category.delete(row)
     elif choice == '7':
         bgn = input("start date (yyyymmdd): ")
         end = input("end date (yyyymmdd): ")
-        print_transactions(transaction.print_sum_date(bgn, end))
-        total = transaction.date_total(bgn, end)
-        print("%-10s %-10d"%("Total:", total))
+        print_summary(transaction.summarize(bgn=bgn, end=end))
     elif choice == '8':
         month = input("month (mm): ")
-        print_transactions(transaction.print_sum_month(month))
-        total = transaction.month_total(month)
-        print("%-10s %-10d"%("Total:", total))
+        if month.strip().isdigit():
+            print_summary(transaction.summarize(month=month))
+        else:
+            print('month must be a number')
     elif choice == '9':
         year = input("year (yyyy): ")
-        print_transactions(transaction.print_sum_year(year))
-        total = transaction.year_total(year)
-        print("%-10s %-10d"%("Total:", total))
+        if year.strip().isdigit():
+            print_summary(transaction.summarize(year=year))
+        else:
+            print('year must be a number')
     elif choice == '10':
         sum_cat = input("category: ")
-        print_transactions(transaction.print_sum_cat(sum_cat))
-        total = transaction.cat_total(sum_cat)
-        print("%-10s %-10d"%("Total:", total))
+        print_summary(transaction.summarize(category=sum_cat))
     elif choice == '11':
         print(MENU)
+    elif choice == '12':
+        path = input("file: ")
+        try:
+            stats = import_file(transaction, path, skip_invalid=True)
+        except (OSError, ValueError) as error:
+            print(error)
+        else:
+            print("%d rows imported (%d already in, %d invalid) at %s rows/sec"%(
+                stats['rows'], stats['resumed'], stats['invalid'],
+                stats['rows_per_sec']))
+    elif choice == '13':
+        path = input("file: ")
+        fmt = input("format (%s): " % ', '.join(sorted(WRITERS)))
+        try:
+            count = export(transaction, path, fmt)
+        except (OSError, ValueError) as error:
+            print(error)
+        else:
+            print("%d rows exported"%count)
+    elif choice == '14':
+        # off until asked for, since it slows every call down
+        if instrument.enabled():
+            print(instrument.report())
+        else:
+            instrument.enable()
+            print('recording query statistics; choose 14 again to see them')
+    elif choice == '15':
+        query = input('search (words, "a phrase" or a prefix*): ')
+        try:
+            print_transactions(transaction.search(query))
+        except ValueError as error:
+            print(error)
+    elif choice == '16':
+        by = input("group by (%s, comma separated): " % ', '.join(DIMENSIONS))
+        year = input("year (blank for all years): ")
+        by = tuple(dim.strip() for dim in by.split(',') if dim.strip())
+        try:
+            groups = transaction.group_by(by,
+                year=int(year) if year.strip().isdigit() else None)
+        except ValueError as error:
+            print(error)
+        else:
+            print_groups(by, groups)
     choice = input("> ")
     return(choice)
 
@@ -145,6 +233,12 @@ def print_transactions(items):
         values = tuple(item.values())
         print("%-10d %-10d %-10s %-10d %-30s"%values)
 
+def print_summary(summary):
+    ''' print the transactions of a summary followed by their total '''
+    print_transactions(summary['transactions'])
+    if summary['total'] is not None:
+        print("%-10s %-10d"%("Total:", summary['total']))
+
 def print_category(cat):
     '''prints data for each category'''
     print("%-3d %-10s %-30s"%(cat['rowid'],cat['name'],cat['desc']))
@@ -159,5 +253,229 @@ def print_categories(cats):
     for cat in cats:
         print_category(cat)
 
-# here is the main call!
-toplevel()
+def print_groups(by, groups):
+    '''prints group_by totals; two dimensions are shown as a table of
+    totals with a row per value of the first one'''
+    if len(by) != 2:
+        print_group_rows([dict(zip(by, key if len(by) > 1 else (key,)), **sums)
+            for key, sums in groups.items()])
+        return
+    if not groups:
+        print('no transactions to total')
+        return
+    rows, columns, table = pivot(groups)
+    print("%-10s"%by[0] + ''.join("%12s"%column for column in columns))
+    print('-'*(10 + 12*len(columns)))
+    for row in rows:
+        totals = [table[row].get(column) for column in columns]
+        print("%-10s"%row + ''.join("%12s"%('' if total is None else total)
+            for total in totals))
+
+def print_group_rows(rows):
+    '''prints group_by totals as one line per group'''
+    if not rows:
+        print('no transactions to total')
+        return
+    names = list(rows[0])
+    print(' '.join("%-12s"%name for name in names))
+    print('-'*(13*len(names)))
+    for row in rows:
+        print(' '.join("%-12s"%('' if value is None else
+            round(value, 2) if isinstance(value, float) else value)
+            for value in row.values()))
+
+# here is the batch mode
+
+def to_plain(value):
+    ''' return a result with its rows turned into dicts, for JSON '''
+    if hasattr(value, '_asdict'):
+        return dict(value.items())
+    if isinstance(value, (list, tuple, range)):
+        return [to_plain(item) for item in value]
+    if isinstance(value, dict):
+        return {key:to_plain(item) for key, item in value.items()}
+    return value
+
+def run_command(args):
+    ''' run one parsed command and return its result '''
+    transaction, category = orms()
+    filters = {name:getattr(args, name, None)
+        for name in ('bgn', 'end', 'year', 'month', 'category')}
+    command = args.command
+    if command == 'categories':
+        return category.select_all()
+    if command == 'add-category':
+        return category.add({'name':args.name, 'desc':args.desc})
+    if command == 'update-category':
+        category.update(args.rowid, {'name':args.name, 'desc':args.desc})
+        return category.select_one(args.rowid)
+    if command == 'show':
+        return transaction.show_transactions()
+    if command == 'add':
+        return transaction.add({'amount':args.amount, 'category':args.category,
+            'date':args.date, 'description':args.description})
+    if command == 'delete':
+        transaction.delete(args.item_num)
+        return args.item_num
+    if command == 'summarize':
+        return transaction.summarize(**filters)
+    if command == 'import':
+        return import_file(transaction, args.file, skip_invalid=args.skip_invalid)
+    if command == 'export':
+        return export(transaction, args.file, args.format, **filters)
+    if command == 'group':
+        by = tuple(args.by)
+        groups = transaction.group_by(by, **filters)
+        return [dict(zip(by, key if len(by) > 1 else (key,)), **sums)
+            for key, sums in groups.items()]
+    if command == 'search':
+        return transaction.search(args.query, args.limit, **filters)
+    if command == 'stats':
+        return instrument.stats()
+    raise ValueError('unknown command %r' % (command,))
+
+def print_result(command, result):
+    ''' print a result the way the menu would '''
+    if command in ('categories',):
+        print_categories(result)
+    elif command == 'update-category':
+        print_category(result)
+    elif command in ('show', 'search'):
+        print_transactions(result)
+    elif command == 'summarize':
+        print_summary(result)
+    elif command == 'group':
+        print_group_rows(result)
+    elif command == 'stats':
+        print(instrument.report())
+    else:
+        print(result)
+
+def add_commands(parser):
+    ''' add the batch mode commands to an ArgumentParser '''
+    commands = parser.add_subparsers(dest='command', metavar='COMMAND')
+    commands.add_parser('categories', help='list the categories')
+    command = commands.add_parser('add-category', help='add a category')
+    command.add_argument('name')
+    command.add_argument('desc')
+    command = commands.add_parser('update-category', help='modify a category')
+    command.add_argument('rowid', type=int)
+    command.add_argument('name')
+    command.add_argument('desc')
+    commands.add_parser('show', help='list the transactions')
+    command = commands.add_parser('add', help='add a transaction')
+    command.add_argument('amount', type=int)
+    command.add_argument('category')
+    command.add_argument('date', type=int, help='yyyymmdd')
+    command.add_argument('description')
+    command = commands.add_parser('delete', help='delete a transaction')
+    command.add_argument('item_num', type=int)
+    for name, help_ in (('summarize', 'summarize transactions'),
+            ('export', 'export transactions'),
+            ('search', 'search the transaction descriptions'),
+            ('group', 'total the transactions by day, month, year and/or category')):
+        command = commands.add_parser(name, help=help_)
+        if name == 'export':
+            command.add_argument('file')
+            command.add_argument('--format', choices=sorted(WRITERS), default='csv')
+        if name == 'group':
+            # not choices=, which rejects an empty list
+            command.add_argument('by', nargs='*', metavar='DIMENSION',
+                help=', '.join(DIMENSIONS))
+        if name == 'search':
+            command.add_argument('query')
+            command.add_argument('--limit', type=int, default=20)
+        for option in ('bgn', 'end', 'year', 'month'):
+            command.add_argument('--' + option, type=int)
+        command.add_argument('--category')
+    command = commands.add_parser('import', help='import a CSV or JSONL file')
+    command.add_argument('file')
+    command.add_argument('--skip-invalid', action='store_true')
+    commands.add_parser('stats', help='show the query statistics')
+    command = commands.add_parser('run',
+        help='run the commands in a script, one per line (- for stdin)')
+    command.add_argument('script')
+    return parser
+
+class ScriptParser(argparse.ArgumentParser):
+    ''' an ArgumentParser for script lines, which raises ValueError
+        instead of exiting '''
+
+    def error(self, message):
+        raise ValueError(message)
+
+def run_script(lines, text=False):
+    ''' run every command in lines, skipping blank lines and # comments;
+        this stops at the first failing command and returns its exit
+        status '''
+    parser = add_commands(ScriptParser(prog='script'))
+    for number, line in enumerate(lines, 1):
+        words = shlex.split(line, comments=True)
+        if not words:
+            continue
+        try:
+            args = parser.parse_args(words)
+            if args.command in (None, 'run'):
+                raise ValueError('expected a command other than run')
+        except ValueError as error:
+            report_error(text, 'line %d: %s' % (number, error))
+            return 2
+        status = execute(args, text)
+        if status:
+            return status
+    return 0
+
+def execute(args, text=False):
+    ''' run a parsed command and print its result; one JSON object per
+        command unless text is set.  this returns the exit status '''
+    try:
+        result = run_command(args)
+    except (OSError, ValueError, IndexError, sqlite3.IntegrityError) as error:
+        report_error(text, '%s: %s' % (args.command, error))
+        return 1
+    if text:
+        print_result(args.command, result)
+    else:
+        print(json.dumps({'command':args.command, 'result':to_plain(result)}))
+    return 0
+
+def report_error(text, message):
+    ''' report a failed command on stderr '''
+    if text:
+        print(message, file=sys.stderr)
+    else:
+        print(json.dumps({'error':message}), file=sys.stderr)
+
+def main(argv):
+    ''' run the command in argv, or the interactive menu without one '''
+    global DBFILE
+    parser = add_commands(argparse.ArgumentParser(prog='tracker.py',
+        description='track personal financial transactions; '
+            'without a command this runs the interactive menu'))
+    parser.add_argument('--db', default=DBFILE, help='the database file')
+    parser.add_argument('--text', action='store_true',
+        help='print tables instead of JSON')
+    parser.add_argument('--stats', action='store_true',
+        help='record query statistics (see the stats command and menu '
+            'option 14) and log calls slower than %gs' % SLOW)
+    args = parser.parse_args(argv)
+    DBFILE = args.db
+    if args.stats:
+        instrument.enable(slow=SLOW)
+    try:
+        if args.command is None:
+            toplevel()
+            return 0
+        if args.command == 'run':
+            if args.script == '-':
+                return run_script(sys.stdin, args.text)
+            with open(args.script) as script:
+                return run_script(script, args.text)
+        return execute(args, args.text)
+    finally:
+        close()
+        if args.stats:
+            instrument.disable()
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
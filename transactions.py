@@ -3,179 +3,567 @@ transactions.py is a Object Relational Mapping to the transactions table
 
 The ORM will work map SQL rows with the schema
     (item_num, amount, category, date, description)
-to Python Dictionaries.
+to TransactionRows, compact read-only rows that can be used like
+Python Dictionaries (see rows.py).  The table itself stores the
+integer id of the category (category_id); rows are read with its
+name joined from the categories table, and adding a transaction
+adds its category if the name is new.
 
 This app will store the data in a SQLite database ~/tracker.db
 
+Transaction objects keep their connection open between calls (see
+database.py), so close them, or use them in a with-statement, when
+you are done with them.
+
 '''
 
+import json
 import sqlite3
+from itertools import islice
+
+from cache import QueryCache, cached
+from database import open_database, release_database, search_error
+from migrations import migrate
+import rollups
+from rows import row_type
+
+TransactionRow = row_type('TransactionRow',
+    ('rowid', 'amount', 'category', 'date', 'description'))
 
 def to_transaction_dict(tran):
-    ''' t is a tuple (rowid, amount, category, date, description)'''
-    transactions = {'rowid':tran[0], 'amount':tran[1], 'category':tran[2],
-        'date':tran[3], 'description':tran[4]}
-    return transactions
+    ''' t is a tuple (rowid, amount, category, date, description)
+    this returns a TransactionRow, which can be used like a dict'''
+    return TransactionRow._make(tran)
 
 def to_transaction_dict_list(tran_tuples):
     ''' convert a list of transaction tuples into a list of dictionaries'''
     return [to_transaction_dict(tran) for tran in tran_tuples]
 
+def year_range(year):
+    ''' return the lowest and highest yyyymmdd dates in a year, so a year
+    can be found with a range scan of the date index'''
+    start = int(year)*10000
+    return (start, start + 9999)
+
+def month_range(year, month):
+    ''' return the lowest and highest yyyymmdd dates in a month of a year'''
+    start = int(year)*10000 + int(month)*100
+    return (start, start + 99)
+
+def select_rows(where='', indexing=''):
+    ''' return the query reading TransactionRows, with the category
+    name joined by id, followed by where and with the INDEXED BY or
+    NOT INDEXED clause indexing (see rowid_order)'''
+    return ('SELECT transactions.rowid, amount, name, date, description'
+        ' FROM transactions' + indexing
+        + ' LEFT JOIN categories ON categories.id=category_id' + where)
+
+def where_clause(bgn=None, end=None, year=None, month=None, category=None,
+        after_rowid=None, undated=None):
+    ''' build the WHERE clause and parameters selecting transactions
+    between dates bgn and end (inclusive), in a year, in a month (of
+    every year, or of year if both are given), in a category, with
+    a rowid greater than after_rowid and, if undated is true, without
+    a date.
+    Filters left as None are not applied.'''
+    terms = []
+    params = []
+    if after_rowid is not None:
+        terms.append('transactions.rowid>(?)')
+        params.append(after_rowid)
+    # int() like year_range and month_range: the rollup tables' date
+    # column has no type, so SQLite wouldn't convert a text date there
+    if bgn is not None:
+        terms.append('date>=(?)')
+        params.append(int(bgn))
+    if end is not None:
+        terms.append('date<=(?)')
+        params.append(int(end))
+    if year is not None and month is not None:
+        terms.append('date>=(?) AND date<=(?)')
+        params.extend(month_range(year, month))
+    elif year is not None:
+        terms.append('date>=(?) AND date<=(?)')
+        params.extend(year_range(year))
+    elif month is not None:
+        terms.append('date / 100 % 100=(?)')
+        params.append(int(month))
+    if category is not None:
+        terms.append('category_id=(SELECT id FROM categories WHERE name=(?))')
+        params.append(category)
+    if undated:
+        terms.append('date IS NULL')
+    if not terms:
+        return ('', ())
+    return (' WHERE ' + ' AND '.join(terms), tuple(params))
+
+def rowid_order(category=None, month=None, **filters):
+    ''' return the INDEXED BY or NOT INDEXED clause that makes a query
+    with the where_clause filters walk the transactions in rowid order,
+    so ORDER BY rowid needs no temporary sort and a LIMIT stops early.
+    the entries of the category and month indexes for a single key are
+    in rowid order; a date range is not, so it scans the table itself'''
+    if category is not None:
+        return ' INDEXED BY transactions_category'
+    if month is not None and filters.get('year') is None:
+        return ' INDEXED BY transactions_month'
+    return ' NOT INDEXED'
+
+# the group_by dimensions, as expressions over the transactions table
+DIMENSIONS = {'day':'date', 'year':'date / 10000', 'month':'date / 100 % 100',
+    'category':'category_id'}
+
+# the rollup tables group_by can read instead, smallest first:
+# (table, its dimension expressions, the filters it can apply)
+GROUP_SOURCES = (
+    ('totals_year', {'year':'year'}, ('year',)),
+    ('totals_month', {'year':'year', 'month':'month'}, ('year', 'month')),
+    ('totals_day', {'day':'date', 'year':'date / 10000', 'month':'date / 100 % 100'},
+        ('bgn', 'end', 'year', 'month')),
+    ('totals_category', {'category':'category_id'}, ('category',)),
+)
+
+def group_source(dims, filters):
+    ''' return the (table, dimension expressions) group_query reads for
+    the dimensions and where_clause filters: the smallest rollup table
+    that has every dimension and filter, which it can only do when at
+    least one of them is a date or a category since its keys are never
+    NULL, and the transactions table otherwise'''
+    for dim in dims:
+        if dim not in DIMENSIONS:
+            raise ValueError('unknown dimension %r' % (dim,))
+    used = {name for name, value in filters.items() if value is not None}
+    for table, exprs, supported in GROUP_SOURCES:
+        if (dims or used) and set(dims) <= set(exprs) and used <= set(supported):
+            return (table, exprs)
+    return ('transactions', DIMENSIONS)
+
+def group_query(dims, filters):
+    ''' return the GROUP BY query and parameters for group_by; its rows
+    are the dimension values followed by the total, count and number
+    of non-NULL amounts.  a rollup table is read if one has every
+    dimension and filter (see group_source)'''
+    table, exprs = group_source(dims, filters)
+    if table in ('totals_year', 'totals_month'):
+        names = [name for name in ('year', 'month') if filters.get(name) is not None]
+        sql = ' AND '.join('%s=(?)' % name for name in names)
+        sql, params = (' WHERE ' + sql if sql else '',
+            tuple(int(filters[name]) for name in names))
+    elif table != 'transactions':
+        sql, params = where_clause(**filters)
+    if table != 'transactions':
+        sums = 'CASE WHEN SUM(amounts)>0 THEN SUM(total) END, SUM(count), SUM(amounts)'
+    else:
+        sql, params = where_clause(**filters)
+        not_null = ' AND '.join('%s IS NOT NULL' % exprs[dim] for dim in dims)
+        if not_null:
+            sql += (' AND ' if sql else ' WHERE ') + not_null
+        sums = 'SUM(amount), COUNT(*), COUNT(amount)'
+    keys = [exprs[dim] for dim in dims]
+    # categories are grouped by id and named once per group
+    columns = ['(SELECT name FROM categories WHERE categories.id=%s)' % expr
+        if dim == 'category' else expr for dim, expr in zip(dims, keys)]
+    query = 'SELECT %s FROM %s%s' % (', '.join(columns + [sums]), table, sql)
+    if keys:
+        # grouping by category_id first lets SQLite read the covering
+        # (category_id, date, amount) index in order instead of looking
+        # up every row of the table
+        grouped = sorted(keys, key=lambda key: key != 'category_id')
+        query += ' GROUP BY %s ORDER BY %s' % (', '.join(grouped),
+            ', '.join(str(i) for i in range(1, len(keys) + 1)))
+    return (query, params)
+
+def merge_sums(partials):
+    ''' add up group_sums results computed over disjoint sets of
+    transactions, such as separate date ranges or databases '''
+    merged = {}
+    for sums in partials:
+        for key, (total, count, amounts) in sums.items():
+            old = merged.get(key)
+            if old is not None:
+                total = (old[0] or 0) + (total or 0) if old[2] or amounts else None
+                count += old[1]
+                amounts += old[2]
+            merged[key] = (total, count, amounts)
+    return merged
+
+def group_results(sums):
+    ''' turn group_sums results into group_by's {key: {'total',
+    'count', 'avg'}} '''
+    return {key: {'total':total, 'count':count,
+        'avg':total/amounts if amounts else None}
+        for key, (total, count, amounts) in sums.items()}
+
+def summary(rows):
+    ''' return the summarize() dict of a list of TransactionRows: the
+    rows with their count and the total, min, max and average of the
+    amounts that aren't NULL '''
+    total = low = high = None
+    amounts = 0
+    for row in rows:
+        amount = row[1]
+        if amount is None:
+            continue
+        amounts += 1
+        if total is None:
+            total = low = high = amount
+        else:
+            total += amount
+            low = min(low, amount)
+            high = max(high, amount)
+    return {'transactions':rows, 'total':total, 'count':len(rows),
+        'min':low, 'max':high, 'avg':total/amounts if amounts else None}
+
+def pivot(groups, value='total'):
+    ''' lay out the group_by results of two dimensions as a table:
+    this returns (row keys, column keys, {row key: {column key: value}})
+    where the rows are the values of the first dimension, the columns
+    those of the second and value is 'total', 'count' or 'avg' '''
+    table = {}
+    columns = set()
+    for (row, column), sums in groups.items():
+        table.setdefault(row, {})[column] = sums[value]
+        columns.add(column)
+    return (sorted(table), sorted(columns), table)
+
+# adds a category by name, unless it is NULL or already there
+ADD_CATEGORY = '''INSERT INTO categories (name, desc) SELECT ?1, ''
+    WHERE ?1 IS NOT NULL ON CONFLICT (name) DO NOTHING'''
+
+# inserts an (amount, category, date, description) tuple, storing the
+# category as its id
+INSERT = '''INSERT INTO transactions VALUES
+    (?, (SELECT id FROM categories WHERE name=(?)), ?, ?)'''
+
 class Transaction():
     ''' Transaction represents a table of transactions'''
     #Class Constructor; initialization
-    def __init__(self, dbfile):
-        con= sqlite3.connect(dbfile)
-        cur = con.cursor()
-        cur.execute('''CREATE TABLE IF NOT EXISTS transactions
-            (amount int, category text, date int, description text)''')
-        con.commit()
-        con.close()
+    def __init__(self, dbfile, cache_size=0, concurrent=False):
+        self.db = open_database(dbfile)
+        self._released = False
+        # see cache.py; reads are not cached unless cache_size is given
+        self.cache = QueryCache(cache_size) if cache_size else None
+        try:
+            if concurrent:
+                # WAL, busy timeout and write retries; see database.py
+                self.db.use_wal()
+            migrate(self.db)
+        except BaseException:
+            self.close()
+            raise
         self.dbase = dbfile
 
+    def close(self):
+        ''' release the shared connection; it is closed once no other
+            Transaction or Category is using it '''
+        if not self._released:
+            self._released = True
+            release_database(self.db)
+
+    def cache_info(self):
+        ''' returns the cache statistics, or None if there is no cache '''
+        return self.cache.info() if self.cache else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @cached
     def select_one(self,rowid):
         ''' return a transaction with a specified rowid '''
-        con= sqlite3.connect(self.dbase)
-        cur = con.cursor()
-        cur.execute("SELECT rowid,* from transactions where rowid=(?)",(rowid,) )
+        cur = self.db.execute(select_rows(" where transactions.rowid=(?)"),(rowid,) )
         tuples = cur.fetchall()
-        con.commit()
-        con.close()
         return to_transaction_dict(tuples[0])
 
+    def select_many(self, rowids):
+        ''' return (rows, missing): the transactions with the item_nums
+        in rowids, in that order, read with one query, and the list of
+        item_nums that don't exist.  unlike select_one this is never
+        cached'''
+        rowids = [int(rowid) for rowid in rowids]
+        cur = self.db.execute('''SELECT transactions.rowid, amount, name,
+            date, description FROM json_each(?) AS ids
+            JOIN transactions ON transactions.rowid=ids.value
+            LEFT JOIN categories ON categories.id=category_id
+            ORDER BY ids.key''', (json.dumps(rowids),))
+        rows = to_transaction_dict_list(cur.fetchall())
+        found = {row[0] for row in rows}
+        return (rows, [rowid for rowid in rowids if rowid not in found])
+
     #Menu opt 4; show transactions
+    @cached
     def show_transactions(self):
         '''shows all transactions'''
-        con= sqlite3.connect(self.dbase)
-        cur = con.cursor()
-        cur.execute("SELECT rowid,* from transactions")
+        cur = self.db.execute(select_rows())
         tuples = cur.fetchall()
-        con.commit()
-        con.close()
         return to_transaction_dict_list(tuples)
 
 
+    def iter_transactions(self, limit=None, chunk_size=500, **filters):
+        '''yields the transactions matching the where_clause filters in
+        rowid order, reading chunk_size rows at a time.
+        for keyset pagination pass the rowid of the last transaction of
+        the previous page as after_rowid and the page size as limit.
+        the rows are read as the iterator advances, not as of a snapshot:
+        a transaction committed while it is half consumed is yielded if
+        its rowid is still ahead; run it inside db.transaction() to
+        iterate a fixed set of rows'''
+        sql, params = where_clause(**filters)
+        sql = select_rows(sql, rowid_order(**filters)) + ' ORDER BY transactions.rowid'
+        if limit is not None:
+            sql += ' LIMIT (?)'
+            params += (limit,)
+        for tran in self.db.iterate(sql, params, chunk_size):
+            yield to_transaction_dict(tran)
+
     #Menu opt 5; add transaction
     def add(self, transaction):
         '''adds a new transaction
         this returns the item_num of the inserted element'''
-        con= sqlite3.connect(self.dbase)
-        cur = con.cursor()
-        cur.execute("INSERT INTO transactions VALUES(?,?,?,?)",
-            (transaction['amount'],transaction['category'],
-            transaction['date'],transaction['description']))
-        con.commit()
-        cur.execute("SELECT last_insert_rowid()")
-        last_item_num = cur.fetchone()
-        con.commit()
-        con.close()
-        return last_item_num[0]
+        with self.db.transaction() as cur:
+            cur.execute(ADD_CATEGORY, (transaction['category'],))
+            cur.execute(INSERT,
+                (transaction['amount'],transaction['category'],
+                transaction['date'],transaction['description']))
+        return cur.lastrowid
+
+    def add_many(self, transactions, batch_size=1000):
+        '''adds an iterable of transactions in one database transaction,
+        inserting batch_size rows per executemany call so the iterable is
+        never held in memory all at once.
+        this returns the range of item_nums of the inserted elements'''
+        items = iter(transactions)
+        first = last = None
+        with self.db.transaction() as cur:
+            while True:
+                batch = [(tran['amount'], tran['category'],
+                    tran['date'], tran['description'])
+                    for tran in islice(items, batch_size)]
+                if not batch:
+                    break
+                rowids = self.insert_batch(cur, batch)
+                if first is None:
+                    first = rowids.start
+                last = rowids.stop - 1
+        if first is None:
+            return range(0)
+        return range(first, last + 1)
+
+    def insert_batch(self, cur, batch):
+        '''inserts a list of (amount, category, date, description) tuples
+        with cur, which must be in a write transaction (db.transaction()),
+        and updates the rollups and the search index once for the whole
+        batch.
+        this returns the range of item_nums of the inserted elements'''
+        if not batch:
+            return range(0)
+        # the categories first, in order of appearance so their ids
+        # don't depend on hashing
+        cur.executemany(ADD_CATEGORY,
+            [(name,) for name in dict.fromkeys(tran[1] for tran in batch)])
+        # the insert triggers stand aside while the batch goes in
+        cur.execute("UPDATE rollup_state SET deferred=1")
+        cur.executemany(INSERT, batch)
+        # nothing else can insert while we hold the write lock, so the
+        # batch got consecutive rowids ending at the last one
+        last = cur.execute("SELECT last_insert_rowid()").fetchone()[0]
+        first = last - len(batch) + 1
+        rollups.add_rows(cur, first, last)
+        cur.execute('''INSERT INTO transactions_fts (rowid, description)
+            SELECT rowid, description FROM transactions
+            WHERE rowid BETWEEN (?) AND (?)''', (first, last))
+        cur.execute("UPDATE rollup_state SET deferred=0")
+        return range(first, last + 1)
 
 
     #Menu opt 6; delete transaction
     def delete(self, itemnum):
         '''deletes a transaction'''
-        con= sqlite3.connect(self.dbase)
-        cur = con.cursor()
-        cur.execute('''DELETE FROM transactions WHERE rowid=(?) ''',(itemnum,))
-        tuples = cur.fetchall()
-        con.commit()
-        con.close()
+        with self.db.transaction() as cur:
+            cur.execute('''DELETE FROM transactions WHERE rowid=(?) ''',(itemnum,))
+            tuples = cur.fetchall()
         return to_transaction_dict_list(tuples)
 
+    def delete_many(self, rowids):
+        '''deletes the transactions with the item_nums in rowids in one
+        database transaction.
+        this returns the number of transactions deleted'''
+        rowids = [int(rowid) for rowid in rowids]
+        return self._delete(' WHERE rowid IN (SELECT value FROM json_each(?))',
+            (json.dumps(rowids),))
+
+    def delete_where(self, **filters):
+        '''deletes the transactions matching the where_clause filters
+        (bgn, end, year, month, category) in one database transaction.
+        at least one filter must be given.
+        this returns the number of transactions deleted'''
+        sql, params = where_clause(**filters)
+        if not sql:
+            raise ValueError('delete_where needs at least one filter')
+        return self._delete(sql, params)
+
+    def _delete(self, sql, params):
+        '''deletes the transactions matching a WHERE clause, removing
+        them from the rollups and the search index with one statement
+        each instead of row by row'''
+        with self.db.transaction() as cur:
+            cur.execute("UPDATE rollup_state SET deferred=1")
+            rollups.remove_rows(cur, sql, params)
+            cur.execute('''INSERT INTO transactions_fts
+                (transactions_fts, rowid, description)
+                SELECT 'delete', rowid, description FROM transactions''' + sql, params)
+            cur.execute('DELETE FROM transactions' + sql, params)
+            count = cur.rowcount
+            cur.execute("UPDATE rollup_state SET deferred=0")
+        return count
+
+    #Menu opts 7-10; summarize transactions
+    @cached
+    def summarize(self, **filters):
+        '''returns the transactions matching the where_clause filters
+        (bgn, end, year, month, category) together with their count and
+        the total, min, max and average amount, all from a single query.
+        like SUM, MIN, MAX and AVG, the amount statistics skip NULL
+        amounts and are None when there are no amounts'''
+        sql, params = where_clause(**filters)
+        cur = self.db.execute(select_rows(sql)
+            + ' ORDER BY transactions.rowid', params)
+        return summary(to_transaction_dict_list(cur))
+
     #Menu opt 7; summarize transactions by date
+    @cached
     def print_sum_date(self, bgn, end):
         '''shows transactions between provided dates (inclusive)'''
-        con= sqlite3.connect(self.dbase)
-        cur = con.cursor()
-        cur.execute('''SELECT rowid,* FROM transactions
-            WHERE date>=(?) AND date<=(?) GROUP BY rowid''', (bgn,end,))
+        cur = self.db.execute(select_rows('''
+            WHERE date>=(?) AND date<=(?) ORDER BY transactions.rowid'''), (bgn,end,))
         tuples = cur.fetchall()
-        con.commit()
-        con.close()
         return to_transaction_dict_list(tuples)
 
     def date_total(self, bgn, end):
         '''calculates total spent between provided dates (inclusive)'''
-        con= sqlite3.connect(self.dbase)
-        cur = con.cursor()
-        cur.execute('''SELECT SUM(amount) FROM transactions
-            WHERE date>=(?) AND date<=(?)''', (bgn,end,))
-        sum_tup = cur.fetchone()
-        con.commit()
-        con.close()
-        return sum_tup[0]
+        return self.total(bgn=bgn, end=end)
 
 
     #Menu opt 8; summarize transactions by month
+    @cached
     def print_sum_month(self, month):
-        '''shows transactions from provided month'''
-        con= sqlite3.connect(self.dbase)
-        cur = con.cursor()
-        # cur.execute('''SELECT *,SUBSTRING(date, 5, 2) AS month FROM transactions
-        #     GROUP BY month''')
-        cur.execute('''SELECT rowid,* FROM transactions
-            WHERE CAST(SUBSTRING(date, 5, 2) AS int)=(?) GROUP BY rowid''', (month,))
+        '''shows transactions from provided month, across all years'''
+        # date / 100 % 100 matches the transactions_month expression index
+        cur = self.db.execute(select_rows('''
+            WHERE date / 100 % 100=(?) ORDER BY transactions.rowid'''), (int(month),))
         tuples = cur.fetchall()
-        con.commit()
-        con.close()
         return to_transaction_dict_list(tuples)
 
     def month_total(self, month):
-        '''calculates total from provided month'''
-        con= sqlite3.connect(self.dbase)
-        cur = con.cursor()
-        cur.execute('''SELECT SUM(amount) FROM transactions
-            WHERE CAST(SUBSTRING(date, 5, 2) AS int)=(?)''', (month,))
-        sum_tup = cur.fetchone()
-        con.commit()
-        con.close()
-        return sum_tup[0]
+        '''calculates total from provided month, across all years'''
+        return self.total(month=month)
+
+    @cached
+    def print_sum_year_month(self, year, month):
+        '''shows transactions from provided month of provided year'''
+        return self.print_sum_date(*month_range(year, month))
+
+    def year_month_total(self, year, month):
+        '''calculates total from provided month of provided year'''
+        return self.total(year=year, month=month)
 
 
     #Menu opt 9; summarize transactions by year
+    @cached
     def print_sum_year(self, year):
         '''shows transactions from provided year'''
-        con= sqlite3.connect(self.dbase)
-        cur = con.cursor()
-        cur.execute('''SELECT rowid,* FROM transactions
-            WHERE CAST(SUBSTRING(date, 1, 4) AS int)=(?) GROUP BY rowid''', (year,))
-        tuples = cur.fetchall()
-        con.commit()
-        con.close()
-        return to_transaction_dict_list(tuples)
+        return self.print_sum_date(*year_range(year))
 
     def year_total(self, year):
         '''calculates total from provided year'''
-        con= sqlite3.connect(self.dbase)
-        cur = con.cursor()
-        cur.execute('''SELECT SUM(amount) FROM transactions
-            WHERE CAST(SUBSTRING(date, 1, 4) AS int)=(?)''', (year,))
-        sum_tup = cur.fetchone()
-        con.commit()
-        con.close()
-        return sum_tup[0]
+        return self.total(year=year)
 
 
     #Menu opt 10; summarize transactions by category
+    @cached
     def print_sum_cat(self,cat):
         '''shows transactions from provided category'''
-        con= sqlite3.connect(self.dbase)
-        cur = con.cursor()
-        cur.execute('''SELECT rowid,* FROM transactions
-            WHERE category=(?) GROUP BY rowid''',(cat,))
+        # the category's id is looked up once, then its entries in the
+        # transactions_category index are already in rowid order
+        cur = self.db.execute(select_rows('''
+            WHERE category_id=(SELECT id FROM categories WHERE name=(?))
+            ORDER BY transactions.rowid''', rowid_order(category=cat)),(cat,))
         tuples = cur.fetchall()
-        con.commit()
-        con.close()
         return to_transaction_dict_list(tuples)
 
     def cat_total(self, cat):
         '''calculates total from provided category'''
-        con= sqlite3.connect(self.dbase)
-        cur = con.cursor()
-        cur.execute('''SELECT SUM(amount) FROM transactions
-            WHERE category=(?)''', (cat,))
-        sum_tup = cur.fetchone()
-        con.commit()
-        con.close()
-        return sum_tup[0]
+        return self.total(category=cat)
+
+    #Menu opt 16; group totals
+    def group_by(self, by=(), **filters):
+        '''returns {key: {'total', 'count', 'avg'}} for the transactions
+        matching the where_clause filters, grouped by the DIMENSIONS in
+        by (one name or a tuple of them) with a single GROUP BY query,
+        read from a rollup table when one can answer it.  a key is a
+        value for one dimension, a tuple for several and () for none;
+        groups with a NULL key are left out.  like SUM and AVG, total
+        and avg skip NULL amounts and are None if there are none.
+        see pivot() to lay out two dimensions as a table'''
+        return group_results(self.group_sums(by, **filters))
+
+    @cached
+    def group_sums(self, by=(), **filters):
+        '''returns {key: (total, count, amounts)}, the sums group_by
+        is made from, where amounts counts the non-NULL amounts.
+        unlike averages these can be added up: see merge_sums'''
+        dims = (by,) if isinstance(by, str) else tuple(by)
+        sql, params = group_query(dims, filters)
+        sums = {}
+        for row in self.db.execute(sql, params):
+            total, count, amounts = row[len(dims):]
+            if not count:
+                continue
+            key = row[0] if len(dims) == 1 else tuple(row[:len(dims)])
+            sums[key] = (total, count, amounts)
+        return sums
+
+    def total(self, **filters):
+        '''returns the total amount of the transactions matching the
+        where_clause filters, or None if none of them has an amount'''
+        return self.group_by(**filters).get((), {}).get('total')
+
+    #Menu opt 15; search transactions
+    @cached
+    def search(self, query, limit=20, rank=True, **filters):
+        '''returns up to limit transactions whose description matches
+        the full-text query, best matches (by bm25) first, or in item_num
+        order if rank is False, which is faster for very common words.
+        the query uses the FTS5 syntax: words match in any order, "a b"
+        is a phrase and rent* a prefix; the where_clause filters narrow
+        the results.  ValueError is raised for a malformed query'''
+        sql, params = where_clause(**filters)
+        try:
+            cur = self.db.execute('''SELECT transactions.rowid, amount,
+                categories.name, date, transactions.description
+                FROM transactions_fts
+                JOIN transactions ON transactions.rowid=transactions_fts.rowid
+                LEFT JOIN categories ON categories.id=category_id
+                WHERE transactions_fts MATCH (?)''' + sql.replace(' WHERE ', ' AND ', 1)
+                + (' ORDER BY rank' if rank else ' ORDER BY transactions_fts.rowid')
+                + ' LIMIT (?)', (query,) + params + (limit,))
+            tuples = cur.fetchall()
+        except sqlite3.OperationalError as error:
+            bad_query = search_error(error, query)
+            if bad_query is None:
+                raise
+            raise bad_query from error
+        return to_transaction_dict_list(tuples)
+
+    #rollup maintenance; see rollups.py
+    def rebuild_rollups(self):
+        '''recomputes the running totals from the transactions table'''
+        with self.db.transaction() as cur:
+            rollups.rebuild(cur)
+
+    def verify_rollups(self):
+        '''returns the (table, row) pairs where the running totals
+        disagree with the transactions table; empty means they agree'''
+        return rollups.verify(self.db)